@@ -0,0 +1,63 @@
+from ptp_parallel_analysis import Parallel_Analysis
+from ptp_analysis_job import Analysis_Progress
+from ptp_stream_db import get_stream_db
+from ptp_pcap_ring import Pcap_Ring
+import getopt
+import sys
+import time
+
+# Offline analysis of large PCAP files, in one process per CPU (see
+# Parallel_Analysis). The results are stored as a new capture, e.g.
+#     python ptp_analyse.py [-j processes] capture.pcap0 capture.pcap1 ...
+# or, for a period of a ring capture (see Pcap_Ring), reading only the
+# segments that cover it, e.g. the last ten minutes:
+#     python ptp_analyse.py [-j processes] -r capture-ring -s -600 [-e end]
+# where times are seconds since the epoch, or before now if negative.
+# PTP_DB_BACKEND=sqlite selects the embedded database (see Constants)
+
+USAGE = """Usage: python ptp_analyse.py [-j processes] pcap_file...
+       python ptp_analyse.py [-j processes] -r ring_directory [-s start] [-e end]"""
+
+def analyse(pcap_filenames, num_processes=None, description=None):
+    progress = Analysis_Progress()
+    print("Analysing %s..." % (description or ', '.join(pcap_filenames)))
+    stream_statuses = Parallel_Analysis(pcap_filenames, num_processes).run(progress)
+    print("    ...%d packets, %d connections." % (progress.packets_read, progress.flows_analysed))
+
+    print("Storing results...")
+    db = get_stream_db()
+    capture_id = db.create_capture((description or ', '.join(pcap_filenames))[:255])
+    db.delete_old_captures()
+    db.persist_streams(capture_id, stream_statuses)
+    db.set_capture_complete(capture_id)
+    print("    ...done, as capture %d." % capture_id)
+
+def parse_time(arg):
+    ts = float(arg)
+    return time.time() + ts if ts < 0 else ts
+
+def main():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'j:r:s:e:')
+        opts = dict(opts)
+        num_processes = int(opts['-j']) if '-j' in opts else None
+        ts_start = parse_time(opts['-s']) if '-s' in opts else None
+        ts_end = parse_time(opts['-e']) if '-e' in opts else None
+    except (getopt.GetoptError, ValueError):
+        print(USAGE)
+        sys.exit(1)
+
+    if '-r' in opts:
+        ring_directory = opts['-r']
+        segments = Pcap_Ring.find_segments(ring_directory, ts_start, ts_end)
+        print("%d segments of %s cover the period." % (len(segments), ring_directory))
+        analyse(segments, num_processes,
+                '%s from %s to %s' % (ring_directory, ts_start, ts_end))
+    elif args:
+        analyse(args, num_processes)
+    else:
+        print(USAGE)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
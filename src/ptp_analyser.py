@@ -1,24 +1,66 @@
 from ptp_sniffer import Sniffer
 from ptp_session_reassembler import Session_Reassembler
 from ptp_session_pair import Session_Pair
-from ptp_stream_db import Stream_DB
+from ptp_stream_db import get_stream_db
 from ptp_constants import Constants 
-import socket
+from ptp_resolver import Resolver
+from ptp_analysis_job import Analysis_Progress, Job_Runner
+from ptp_parallel_analysis import Parallel_Analysis
+from ptp_pcap_ring import Pcap_Ring
+import multiprocessing
+import os
+import time
+import Queue
 
 
 class Analyser(object):
+    """Runs the capture and analysis of traffic and provides the results.
 
-    def __init__(self, existing_pcap_filename=None):
+    Args:
+        existing_pcap_filename (str): PCAP file to analyse instead of capturing
+        live (bool): if capturing, analyse packets as they are captured (see
+            Session_Reassembler.start_live) rather than reading the PCAP file
+            back once capturing has stopped. Results can then be had at any
+            point during the capture.
+        dump_pcap (bool): in live mode, whether to also write the PCAP file
+        resolver (Resolver): for server hostnames; one is made if not given
+        ring_directory (str): in live mode, capture into a ring of PCAP files
+            there (see Pcap_Ring) rather than one PCAP file, so that recent
+            periods can be analysed again (see analyse_window). Defaults to
+            Constants' CAPTURE_RING_DIR.
+    """
+
+    def __init__(self, existing_pcap_filename=None, live=True, dump_pcap=True,
+                 resolver=None, ring_directory=None):
         self._existing_pcap_filename = existing_pcap_filename
+        self._packet_queue = None
+        self._ring_directory = None
 
-        if self._existing_pcap_filename is None:
+        if self._existing_pcap_filename is not None:
+            pcap_filename = self._existing_pcap_filename
+            self._session_reassembler = Session_Reassembler(pcap_filename)
+        elif live:
+            const = Constants()
+            self._packet_queue = Queue.Queue(maxsize=const.LIVE_QUEUE_SIZE)
+            self._ring_directory = ring_directory or const.CAPTURE_RING_DIR
+            if self._ring_directory is not None or not dump_pcap:
+                pcap_filename = None
+            else:
+                pcap_filename = const.DEFAULT_PCAP_FILENAME
+            self._sniffer = Sniffer(pcap_filename, packet_queue=self._packet_queue,
+                                    ring_directory=self._ring_directory)
+            self._session_reassembler = Session_Reassembler()
+        else:
             self._sniffer = Sniffer()
             pcap_filename = self._sniffer.get_pcap_filename() 
-        else:
-            pcap_filename = self._existing_pcap_filename
+            self._session_reassembler = Session_Reassembler(pcap_filename)
 
-        self._session_reassembler = Session_Reassembler(pcap_filename)
-        self._stream_db = Stream_DB()
+        self._pcap_filename = pcap_filename
+        self._stream_db = get_stream_db()
+        # set when the capture's results are first stored
+        self._capture_id = None
+        self._resolver = resolver if resolver is not None else Resolver()
+        self._jobs = Job_Runner()
 
 
     def results_no_db(self):
@@ -28,53 +70,313 @@ class Analyser(object):
 
 
     def get_analysis_results(self):
-        session_pairs = self._get_session_pairs()
-        stream_statuses = [ pair.get_stream_status() for pair in session_pairs ]
+        """Analyses and stores the capture (see analyse).
+
+        Returns:
+            list: all result rows (see iter_analysis_results)
+        """
+        self.analyse()
+        return list(self.iter_analysis_results())
+
+
+    def start_analysis(self, stop_sniffing=False):
+        """Runs analyse as a background job, so the caller doesn't wait for
+        it, e.g. a web request on a big capture.
+
+        Args:
+            stop_sniffing (bool): stop the capture first, in the job
+
+        Returns:
+            Analysis_Job: follow its state and progress with get_job
+        """
+        def work(progress):
+            if stop_sniffing:
+                progress.stage = 'stopping capture'
+                self.stop_sniffing()
+            return self.analyse(progress)
+        return self._jobs.submit(work)
+
+
+    def get_job(self, job_id):
+        """Returns:
+            Analysis_Job: started by start_analysis, or None if not known
+        """
+        return self._jobs.get(job_id)
+
+
+    def analyse(self, progress=None):
+        """Analyses the capture, or what has been captured so far, and
+        stores the results, replacing any stored for it before.
+
+        Args:
+            progress (Analysis_Progress): updated as the analysis goes
+
+        Returns:
+            int: number of connections stored
+        """
+        if progress is None:
+            progress = Analysis_Progress()
+        num_processes = self._get_num_analysis_processes()
+        if num_processes > 1:
+            stream_statuses = Parallel_Analysis(self._pcap_filename, num_processes).run(
+                progress, self._get_hostname_index())
+            progress.stage = 'storing flows'
+        else:
+            session_pairs = self._get_session_pairs(progress)
+            progress.stage = 'analysing and storing flows'
+            stream_statuses = self._analyse_session_pairs(session_pairs, progress)
 	db = self._stream_db
-        db.clear_streams()
-        db.persist_streams(stream_statuses)
-        stream_statuses = db.select_all_streams() # list of lists (rows)
-        results = []
-        for ss in stream_statuses:
-            svr_ip_addr = ss[1]
-            fqdn = self._get_fqdn(svr_ip_addr) 
-            result = list(ss)
-            result.append(fqdn)
-            results.append(result)
-        return results 
+        if self._capture_id is None:
+            self._capture_id = db.create_capture(self._pcap_filename)
+            db.delete_old_captures()
+        else:
+            # results so far of a capture in progress are replaced
+            db.delete_streams(self._capture_id)
 
+        def on_batch(num_stored):
+            progress.rows_persisted = num_stored
+        num_stored = db.persist_streams(self._capture_id, stream_statuses, on_batch=on_batch)
+        if self._is_capture_finished():
+            db.set_capture_complete(self._capture_id)
+        return num_stored
 
-    def _get_fqdn(self, ip_addr):
+
+    def analyse_window(self, ts_start, ts_end=None, progress=None):
+        """Analyses the packets of the ring capture (see ring_directory)
+        from ts_start to ts_end again, reading only the segments which cover
+        that period, and stores the results as a capture of their own.
+        Connections are analysed whole from the segments read, so some may
+        start before ts_start or end after ts_end.
+
+        Args:
+            ts_start (float): seconds since the epoch
+            ts_end (float): None for up to now
+            progress (Analysis_Progress): updated as the analysis goes
+
+        Returns:
+            int: id of the capture the results are stored as
+
+        Raises:
+            ValueError: If not capturing into a ring.
+        """
+        if self._ring_directory is None:
+            raise ValueError("Not capturing into a ring of PCAP files")
+        if progress is None:
+            progress = Analysis_Progress()
+        const = Constants()
+        segments = Pcap_Ring.find_segments(self._ring_directory, ts_start, ts_end)
+        num_processes = const.ANALYSIS_PROCESSES or multiprocessing.cpu_count()
+        stream_statuses = Parallel_Analysis(segments, num_processes).run(
+            progress, self._get_hostname_index())
+
+        progress.stage = 'storing flows'
+        db = self._stream_db
+        capture_id = db.create_capture('%s from %s to %s' % (self._ring_directory, ts_start, ts_end))
+        db.delete_old_captures()
+
+        def on_batch(num_stored):
+            progress.rows_persisted = num_stored
+        db.persist_streams(capture_id, stream_statuses, on_batch=on_batch)
+        # packets are written out every SNIFF_FLUSH_INTERVAL seconds
+        if ts_end is not None and ts_end + const.SNIFF_FLUSH_INTERVAL < time.time():
+            db.set_capture_complete(capture_id)
+        return capture_id
+
+
+    def _is_capture_finished(self):
+        """Returns:
+            bool: True if no more packets will be added to the capture
+        """
+        if self._existing_pcap_filename is not None:
+            return True
+        return not self._sniffer.is_running() and not self._session_reassembler.is_live()
+
+
+    def _get_num_analysis_processes(self):
+        """Returns:
+            int: number of processes to analyse the PCAP file in (see
+                Parallel_Analysis): 1 in live mode, which has nothing left
+                to read, and for files too small to be worth starting
+                processes for
+        """
+        const = Constants()
+        if self._packet_queue is not None:
+            return 1
         try:
-            fqdn = socket.gethostbyaddr(ip_addr)[0]
-        except socket.herror:
-            fqdn = ip_addr
-        return fqdn
+            if os.path.getsize(self._pcap_filename) < const.PARALLEL_ANALYSIS_MIN_BYTES:
+                return 1
+        except (OSError, TypeError):
+            return 1
+        return const.ANALYSIS_PROCESSES or multiprocessing.cpu_count()
 
-    def get_connection_details_row(self, conn_id):
+
+    def _analyse_session_pairs(self, session_pairs, progress):
+        """Generator of the pairs' Stream_Statuses, counting them"""
+        for pair in session_pairs:
+            yield pair.get_stream_status()
+            progress.flows_analysed += 1
+
+
+    def get_capture_id(self):
+        """Returns:
+            int: capture_id the capture's results are stored under, or None
+                if they haven't been yet
+        """
+        return self._capture_id
+
+
+    def get_capture(self, capture_id):
+        """Returns:
+            tuple: see Stream_DB.get_capture
+        """
+        return self._stream_db.get_capture(capture_id)
+
+
+    def get_stream_version(self, conn_id):
+        """Returns:
+            tuple: see Stream_DB.get_stream_version
+        """
+        return self._stream_db.get_stream_version(conn_id)
+
+
+    def get_results_page(self, capture_id, sort_by='bytes_to_cli', descending=True,
+                         after=None, limit=None):
+        """One page of a capture's stored results (see
+        Stream_DB.select_streams_page). Server hostnames are left out: they
+        change as lookups finish, while the stored results don't (see
+        get_hostnames).
+
+        Returns:
+            (list, tuple): the rows, as iter_analysis_results but without the
+                hostname, and the after key of the next page, or None if this
+                is the last
+        """
+        db = self._stream_db
+        limit = limit or Constants().DB_PAGE_SIZE
+        rows = db.select_streams_page(capture_id, sort_by, descending, after, limit)
+        next_after = db.page_key(rows[-1], sort_by) if len(rows) == limit else None
+        return rows, next_after
+
+
+    def has_results(self):
+        """Returns:
+            bool: whether analyse has stored results for the capture
+        """
+        return self._capture_id is not None
+
+
+    def iter_analysis_results(self, sort_by='bytes_to_cli', descending=True):
+        """Generator of the stored results of the capture, read from the
+        database a page at a time (see Stream_DB.iter_stream_pages), so they
+        can be sent as they are read.
+
+        Each row is (id, server IP address, bytes to server, bytes to
+        client, is_encrypted, server hostname). The servers on the first
+        page are named all at once, waiting for lookups up to the
+        resolver's timeout. Later pages get the names known so far without
+        waiting, as they are already being sent; the results page fetches
+        the rest later (see get_hostnames).
+
+        Args:
+            sort_by (str): one of Stream_DB.SORT_COLUMNS
+            descending (bool)
+        """
+        if self._capture_id is None:
+            return
+        svr_ip_col = 1
+        get_names = self._get_fqdns
+        for rows in self._stream_db.iter_stream_pages(self._capture_id, sort_by, descending):
+            ip_addrs = set(row[svr_ip_col] for row in rows)
+            fqdns = get_names(ip_addrs)
+            get_names = self.get_hostnames
+            for row in rows:
+                result = list(row)
+                result.append(fqdns.get(row[svr_ip_col], row[svr_ip_col]))
+                yield result
+
+
+    def get_hostnames(self, ip_addrs):
+        """Returns:
+            dict: IP address -> hostname, for those of ip_addrs named so
+                far; doesn't wait for lookups
+        """
+        names = self._get_hostname_index().lookup(ip_addrs)
+        names.update(self._resolver.get_cached(set(ip_addrs).difference(names)))
+        return names
+
+
+    def _get_fqdns(self, ip_addrs):
+        """Names servers from the DNS responses and TLS server names seen in
+        the traffic (see Hostname_Index), and only falls back on reverse DNS
+        lookups for addresses not named there.
+
+        Returns:
+            dict: IP address -> hostname, or the address itself if none
+        """
+        ip_addrs = set(ip_addrs)
+        fqdns = self._get_hostname_index().lookup(ip_addrs)
+        unnamed = ip_addrs.difference(fqdns)
+        if unnamed:
+            fqdns.update(self._resolver.resolve_all(unnamed))
+        return fqdns
+
+
+    def _get_fqdn(self, ip_addr):
+        return self._get_fqdns([ip_addr])[ip_addr]
+
+
+    def _get_hostname_index(self):
+        return self._session_reassembler.get_hostname_index()
+
+    def get_connection_details_row(self, conn_id, with_hostname=True):
 	db = self._stream_db
         row = db.get_connection_details_row(int(conn_id))
         result = list(row)
-        svr_ip_addr = result[2] 
-        fqdn = self._get_fqdn(svr_ip_addr)
-        result.append(fqdn)
+        if with_hostname:
+            svr_ip_addr = result[2] 
+            fqdn = self._get_fqdn(svr_ip_addr)
+            result.append(fqdn)
         return result 
 
     def get_encryption_details_row(self, conn_id):
 	db = self._stream_db
         return db.get_encryption_details_row(int(conn_id))
 
+    def get_verdict_feed(self):
+        """Returns:
+            Verdict_Feed: connection verdicts as they are reached during a
+                live capture, or None if not capturing live
+        """
+        return self._session_reassembler.get_verdict_feed()
+
     def start_sniffing(self):
+        self._capture_id = None
+        if self._packet_queue is not None:
+            self._session_reassembler.start_live(self._packet_queue)
         self._sniffer.start()
 
     def stop_sniffing(self):
-        self._sniffer.stop()
+        """Stops the capture and waits, for SNIFF_STOP_TIMEOUT seconds at
+        most, for the packets still queued to be analysed.
+
+        Raises:
+            RuntimeError: If the capture failed, e.g. it couldn't be started.
+        """
+        timeout = Constants().SNIFF_STOP_TIMEOUT
+        self._sniffer.stop(timeout)
+        # only the packets still queued are left to analyse
+        self._session_reassembler.stop_live(timeout)
+        if self._sniffer.error is not None:
+            raise RuntimeError("The capture failed: %s" % self._sniffer.error)
+
+    def is_sniffing(self):
+        return self._sniffer.is_running()
 
     def _get_sniffer(self):
         return self._sniffer
 	
-    def _get_session_pairs(self):
-        return self._session_reassembler.get_session_pairs().values()
+    def _get_session_pairs(self, progress=None):
+        return self._session_reassembler.get_session_pairs(progress).values()
 
     def _get_session_reassembler(self):
         return self._session_reassembler
@@ -0,0 +1,168 @@
+import threading
+import time
+import traceback
+import uuid
+import Queue
+from collections import OrderedDict
+
+
+class Analysis_Progress(object):
+    """Counts of the work an analysis has done so far. Written by the thread
+    doing the analysis and read by others, e.g. to report on an
+    Analysis_Job.
+
+    Attributes:
+        stage (str): what the analysis is doing, e.g. 'reading packets'
+        packets_read (int)
+        flows_analysed (int)
+        rows_persisted (int)
+    """
+
+    def __init__(self):
+        self.stage = None
+        self.packets_read = 0
+        self.flows_analysed = 0
+        self.rows_persisted = 0
+
+
+    def to_dict(self):
+        return {'stage': self.stage,
+                'packets_read': self.packets_read,
+                'flows_analysed': self.flows_analysed,
+                'rows_persisted': self.rows_persisted}
+
+
+class Analysis_Job(object):
+    """A piece of work run in the background by a Job_Runner, with an id it
+    can be looked up by while it runs.
+
+    Attributes:
+        job_id (str)
+        state (str): QUEUED, RUNNING, DONE or FAILED
+        progress (Analysis_Progress): updated by the work as it runs
+        result: what the work returned, once DONE
+        error (str): what went wrong, once FAILED
+    """
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    def __init__(self, work):
+        self.job_id = uuid.uuid4().hex
+        self.state = self.QUEUED
+        self.progress = Analysis_Progress()
+        self.result = None
+        self.error = None
+        self.ts_created = time.time()
+        self.ts_started = None
+        self.ts_finished = None
+        self._work = work
+        self._finished = threading.Event()
+
+
+    def is_finished(self):
+        return self._finished.is_set()
+
+
+    def wait(self, timeout=None):
+        """Waits for the job to finish.
+
+        Returns:
+            bool: True if it has finished
+        """
+        self._finished.wait(timeout)
+        return self._finished.is_set()
+
+
+    def to_dict(self):
+        """Returns:
+            dict: the job's state and progress, e.g. for a JSON status response
+        """
+        now = self.ts_finished or time.time()
+        return {'job_id': self.job_id,
+                'state': self.state,
+                'progress': self.progress.to_dict(),
+                'error': self.error,
+                'seconds_running': round(now - self.ts_started, 3) if self.ts_started else 0}
+
+
+    def _run(self):
+        self.state = self.RUNNING
+        self.ts_started = time.time()
+        try:
+            self.result = self._work(self.progress)
+            self.state = self.DONE
+        except Exception as e:
+            self.error = "%s: %s" % (type(e).__name__, e)
+            traceback.print_exc()
+            self.state = self.FAILED
+        finally:
+            self.ts_finished = time.time()
+            self._finished.set()
+
+
+class Job_Runner(object):
+    """Runs Analysis_Jobs one at a time on a background thread, in the order
+    submitted, so web requests can start long analyses and return straight
+    away, then follow them by job id.
+
+    Args:
+        max_jobs (int): number of jobs remembered; the oldest finished ones
+            are forgotten first
+    """
+
+    def __init__(self, max_jobs=100):
+        self._max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._queue = Queue.Queue()
+        self._worker = None
+
+
+    def submit(self, work):
+        """Queues work to run in the background.
+
+        Args:
+            work (function): takes an Analysis_Progress to update as it goes;
+                what it returns becomes the job's result
+
+        Returns:
+            Analysis_Job
+        """
+        job = Analysis_Job(work)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._forget_old_jobs()
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run_worker)
+                self._worker.daemon = True
+                self._worker.start()
+        self._queue.put(job)
+        return job
+
+
+    def get(self, job_id):
+        """Returns:
+            Analysis_Job: the job with job_id, or None if there isn't one
+        """
+        with self._lock:
+            return self._jobs.get(job_id)
+
+
+    def _forget_old_jobs(self):
+        """Must be called with the lock held."""
+        excess = len(self._jobs) - self._max_jobs
+        for job_id, job in self._jobs.items():
+            if excess <= 0:
+                break
+            if job.is_finished():
+                del self._jobs[job_id]
+                excess -= 1
+
+
+    def _run_worker(self):
+        while True:
+            job = self._queue.get()
+            job._run()
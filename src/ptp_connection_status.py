@@ -28,6 +28,8 @@ class TCP_Status(object):
         self.svr_pt = kwargs.get('svr_pt', None)
         self.bytes_to_svr = kwargs.get('bytes_to_svr', None)
         self.bytes_to_cli = kwargs.get('bytes_to_cli', None)
+        self.dup_pkts_to_svr = kwargs.get('dup_pkts_to_svr', 0)
+        self.dup_pkts_to_cli = kwargs.get('dup_pkts_to_cli', 0)
         constants = Constants()
         self.ts_first_pkt = kwargs.get('ts_first_pkt', constants.DEFAULT_TS_FIRST_PKT)
         self.ts_last_pkt = kwargs.get('ts_last_pkt', constants.DEFAULT_TS_LAST_PKT)
@@ -1,3 +1,5 @@
+import os
+
 class Is_Encrypted_Enum(object):
     NO = 'No' 
     YES = 'Yes'
@@ -10,7 +12,60 @@ class Constants(object):
         self.DEFAULT_PCAP_FILENAME = 'sniffed.pcap'
         self.DEFAULT_TS_FIRST_PKT = '2011-11-11 11:11:11'
         self.DEFAULT_TS_LAST_PKT = '2011-11-11 11:11:11'
+        # destination of the stop packet earlier versions of the Sniffer
+        # injected into their captures, skipped when reading those files
         self.KILL_PKT_IP = '10.11.12.13'
+        self.LIVE_QUEUE_SIZE = 10000
+        # in live mode, seconds of capture between releases of the packets
+        # of finished connections: those closed LIVE_FLOW_LINGER seconds
+        # ago, or idle for LIVE_FLOW_IDLE_TIMEOUT (see Flow_Table.pop_finished)
+        self.LIVE_SWEEP_INTERVAL = 5.0
+        self.LIVE_FLOW_LINGER = 10.0
+        self.LIVE_FLOW_IDLE_TIMEOUT = 300.0
+        # libpcap read timeout, so the capture loop notices stop requests
+        self.SNIFF_TIMEOUT_MS = 100
+        # most packets handled per pass of the capture loop
+        self.SNIFF_BATCH_SIZE = 1024
+        self.SNIFF_WRITE_BUFFER_SIZE = 4 * 1024 * 1024
+        # seconds between writes of the captured packets to the PCAP file
+        self.SNIFF_FLUSH_INTERVAL = 1.0
+        # most seconds waited for the capture, and the live analysis of the
+        # packets still queued, to finish when it is stopped
+        self.SNIFF_STOP_TIMEOUT = 30.0
+        # 'pcapy', or 'tpacket' to read the kernel's packet ring directly
+        # on Linux (see Tpacket_V3_Capture), which needs no pcapy and filters
+        # packets only if libpcap is installed. Set with the environment
+        # variable PTP_CAPTURE_BACKEND, which ptp_start.sh passes on.
+        self.CAPTURE_BACKEND = os.environ.get('PTP_CAPTURE_BACKEND') or 'pcapy'
+        self.TPACKET_BLOCK_SIZE = 1024 * 1024
+        self.TPACKET_NUM_BLOCKS = 64
+        # directory to capture into a ring of PCAP files (see Pcap_Ring) in
+        # live mode, instead of one ever-growing file; None (or the variable
+        # set to '') for the latter
+        self.CAPTURE_RING_DIR = os.environ.get('PTP_CAPTURE_RING') or None
+        self.CAPTURE_RING_SEGMENTS = 10
+        self.CAPTURE_RING_SEGMENT_BYTES = 64 * 1024 * 1024
+        self.CAPTURE_RING_SEGMENT_SECONDS = 300
+        self.DB_POOL_SIZE = 4
+        self.DB_INSERT_BATCH_SIZE = 1000
+        self.DB_CAPTURES_KEPT = 20
+        self.DB_PAGE_SIZE = 500
+        # None for one per CPU
+        self.ANALYSIS_PROCESSES = None
+        # smaller PCAP files are analysed in one process
+        self.PARALLEL_ANALYSIS_MIN_BYTES = 32 * 1024 * 1024
+        # where PCAP files are split into shards for parallel analysis;
+        # None for the system's temporary directory
+        self.SHARD_DIR = None
+        # seconds clients may cache API responses about finished captures
+        self.API_CACHE_MAX_AGE = 3600
+        # 'mysql' or 'sqlite' (see get_stream_db)
+        self.DB_BACKEND = os.environ.get('PTP_DB_BACKEND') or 'mysql'
+        self.MYSQL_HOST = 'localhost'
+        self.MYSQL_USER = 'root'
+        self.MYSQL_PASSWORD = 'password'
+        self.MYSQL_DB = 'ptp'
+        self.SQLITE_DB_FILENAME = 'ptp.db'
         self.TEST_PCAP_DIR = 'test-pcap-files'
 
         self.ssl_version_by_code = { 
@@ -18,6 +73,7 @@ class Constants(object):
 	    '0301': 'TLS 1.0',
 	    '0302': 'TLS 1.1',
 	    '0303': 'TLS 1.2',
+	    '0304': 'TLS 1.3',
 	}
 
 
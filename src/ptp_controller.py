@@ -1,5 +1,11 @@
-from flask import Flask, render_template, url_for, request
+import base64
+import itertools
+import json
+from flask import Flask, render_template, url_for, request, jsonify, Response, \
+    stream_with_context
 from ptp_analyser import Analyser
+from ptp_stream_db import Stream_DB
+from ptp_constants import Constants
 
 app = Flask(__name__)
 analyser = Analyser()
@@ -31,20 +37,108 @@ def capture():
 
 @app.route('/results')
 def results():
+    """Stops the capture and analyses it in a background job. The page
+    returned shows the job's progress, and goes on to the main results page
+    (/results-sorted) once it is done.
+
+    Note:
+        The analysis runs in the background so this request returns straight
+        away, however big the capture is.
+    """
+    job = analyser.start_analysis(stop_sniffing=True)
+    #log("stop_capture(): traffic capture stopped")
+    return render_template('analysing.html', job=job)
+
+
+@app.route('/results-so-far')
+def results_so_far():
+    """Analyses the capture in progress, without stopping it, as /results
+    does. Connections whose encryption hasn't been decided yet are shown as
+    unassessed.
+    """
+    job = analyser.start_analysis()
+    return render_template('analysing.html', job=job)
+
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """State and progress of an analysis job, as JSON. Polled by the page
+    /results returns."""
+    job = analyser.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'no such job'}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route('/verdicts')
+def verdicts():
+    """Server-sent events stream of connection verdicts, as they are
+    reached during the capture. Used by the /capture page.
+
+    Each message carries a JSON list of verdicts which arrived close
+    together (see Verdict_Feed.get_batch), and its id is the number to
+    carry on from, which browsers send back as Last-Event-ID when they
+    reconnect. A comment is sent when nothing has happened for a while,
+    to keep the connection open, and an 'end' event once the capture stops.
+    """
+    feed = analyser.get_verdict_feed()
+    next_seq = int(request.headers.get('Last-Event-ID') or request.args.get('from') or 0)
+
+    def events():
+        seq = next_seq
+        while feed is not None:
+            batch, seq = feed.get_batch(seq)
+            if batch:
+                yield 'id: %d\ndata: %s\n\n' % (seq, json.dumps(batch))
+            elif feed.is_closed():
+                break
+            else:
+                yield ': keep-alive\n\n'
+        yield 'event: end\ndata: \n\n'
+
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
+
+
+@app.route('/results-sorted')
+def sorted_results():
     """Main results page - also has a start again button taking user back to /index.
+    Shows the results last analysed, in the order given by the sort
+    (a Stream_DB.SORT_COLUMNS name) and order ('asc' or 'desc') parameters.
 
     Note:
         The results.html template sends back links that allow the user to drill
         down for TCP/IP and SSL related information about each connection.
     """
-    analyser.stop_sniffing()
-    #log("stop_capture(): traffic capture stopped")
-    results = analyser.get_analysis_results()
+    return render_results()
 
-    if results:
-        return render_template('results.html', results=results)
-    else:
+
+def render_results():
+    """Streams the results page, a row at a time as the results are read
+    from the database, rather than building the whole page first.
+    """
+    sort_by = request.args.get('sort', 'bytes_to_cli')
+    if sort_by not in Stream_DB.SORT_COLUMNS:
+        sort_by = 'bytes_to_cli'
+    descending = request.args.get('order', 'desc') != 'asc'
+
+    results = analyser.iter_analysis_results(sort_by, descending)
+    first_row = next(results, None)
+    if first_row is None:
         return render_template('no_results.html')
+    results = itertools.chain([first_row], results)
+    return Response(stream_with_context(stream_template(
+        'results.html', results=results, sort_by=sort_by, descending=descending)))
+
+
+def stream_template(template_name, **context):
+    """Like render_template, but returns a generator of the page's parts"""
+    app.update_template_context(context)
+    template = app.jinja_env.get_template(template_name)
+    stream = template.stream(context)
+    # sends parts in chunks rather than one by one
+    stream.enable_buffering(64)
+    return stream
 
 
 @app.route('/encryption_details')
@@ -67,6 +161,140 @@ def connection_details():
     return render_template('connection_details.html', results=results)
 
 
+@app.route('/hostnames', methods=['GET', 'POST'])
+def hostnames():
+    """Hostnames of the server IP addresses given, for those resolved so
+    far: in a POST, as the list ips in a JSON body; in a GET, comma-separated
+    in the ips parameter. Used by the /results page to fill in names that
+    weren't resolved when it was rendered.
+    """
+    if request.method == 'POST':
+        body = request.get_json(silent=True)
+        ips = body.get('ips') if isinstance(body, dict) else None
+        ip_addrs = [ip for ip in ips if ip] if isinstance(ips, list) else []
+    else:
+        ip_addrs = [ip for ip in request.args.get('ips', '').split(',') if ip]
+    return jsonify(analyser.get_hostnames(ip_addrs))
+
+
+@app.route('/api/results')
+def api_results():
+    """One page of a capture's results, as JSON. Parameters, all optional:
+    capture_id (defaults to the capture last analysed), sort and order (as
+    for /results-sorted), limit (rows per page) and cursor (the next_cursor
+    of the previous page). Server hostnames are had from /hostnames, as they
+    are named after the results are stored.
+    """
+    capture_id = request.args.get('capture_id', type=int) or analyser.get_capture_id()
+    capture = analyser.get_capture(capture_id) if capture_id is not None else None
+    if capture is None:
+        return jsonify({'error': 'no such capture'}), 404
+    capture_id, ts_created, pcap_filename, num_streams, version, is_complete = capture
+
+    sort_by = request.args.get('sort', 'bytes_to_cli')
+    if sort_by not in Stream_DB.SORT_COLUMNS:
+        return jsonify({'error': 'cannot sort by %s' % sort_by}), 400
+    descending = request.args.get('order', 'desc') != 'asc'
+    limit = max(1, min(request.args.get('limit', Constants().DB_PAGE_SIZE, type=int),
+                       Constants().DB_PAGE_SIZE))
+    try:
+        after = decode_cursor(request.args.get('cursor'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'bad cursor'}), 400
+
+    def make_body():
+        rows, next_after = analyser.get_results_page(capture_id, sort_by, descending,
+                                                     after, limit)
+        return {'capture_id': capture_id,
+                'num_streams': num_streams,
+                'is_complete': bool(is_complete),
+                'results': [dict(zip(['id', 'svr_ip', 'bytes_to_svr', 'bytes_to_cli',
+                                      'is_encrypted'], row)) for row in rows],
+                'next_cursor': encode_cursor(next_after)}
+
+    return cached_json(capture_id, version, is_complete, make_body)
+
+
+@app.route('/api/connections/<int:conn_id>')
+def api_connection_details(conn_id):
+    """TCP/IP details of a connection, as JSON. The server's hostname is had
+    from /hostnames."""
+    def make_body():
+        row = analyser.get_connection_details_row(conn_id, with_hostname=False)
+        body = dict(zip(['cli_ip', 'cli_pt', 'svr_ip', 'svr_pt', 'ts_first_pkt',
+                         'ts_last_pkt'], row))
+        body['ts_first_pkt'] = str(body['ts_first_pkt'])
+        body['ts_last_pkt'] = str(body['ts_last_pkt'])
+        body['id'] = conn_id
+        return body
+    return cached_stream_json(conn_id, make_body)
+
+
+@app.route('/api/connections/<int:conn_id>/encryption')
+def api_encryption_details(conn_id):
+    """Encryption details of a connection, as JSON"""
+    def make_body():
+        row = analyser.get_encryption_details_row(conn_id)
+        body = dict(zip(['is_encrypted', 'ssl_version', 'ssl_cipher'], row))
+        body['id'] = conn_id
+        return body
+    return cached_stream_json(conn_id, make_body)
+
+
+def cached_stream_json(conn_id, make_body):
+    """cached_json for a response about one connection"""
+    stream_version = analyser.get_stream_version(conn_id)
+    if stream_version is None:
+        return jsonify({'error': 'no such connection'}), 404
+    capture_id, version, is_complete = stream_version
+    return cached_json(capture_id, version, is_complete, make_body)
+
+
+def cached_json(capture_id, version, is_complete, make_body):
+    """JSON response with an ETag made from the capture's id and version,
+    which changes whenever its stored results do, so the body must hold
+    nothing else that changes, e.g. server hostnames. If the request's If-None-Match
+    has the ETag, the response is a 304 and make_body, which would query the
+    database, isn't called.
+
+    Finished captures don't change, so clients may cache responses about
+    them for a while without asking again; others must revalidate each time.
+    """
+    etag = '%d-%d' % (capture_id, version)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(make_body())
+    response.set_etag(etag)
+    if is_complete:
+        response.headers['Cache-Control'] = 'max-age=%d' % Constants().API_CACHE_MAX_AGE
+    else:
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def encode_cursor(after):
+    """Returns:
+        str: opaque form of a Stream_DB page key, for API clients, or None
+    """
+    if after is None:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(after))
+
+
+def decode_cursor(cursor):
+    """Returns:
+        tuple: the page key encode_cursor was given, or None if no cursor
+
+    Raises:
+        ValueError, TypeError: if cursor is malformed
+    """
+    if not cursor:
+        return None
+    after_value, after_id = json.loads(base64.urlsafe_b64decode(str(cursor)))
+    return after_value, int(after_id)
+
+
 @app.route('/results-for-existing-pcapfile')
 def results_test():
     """For testing"""
@@ -0,0 +1,151 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class DB_Pool_Timeout(Exception):
+    """Raised when no pooled connection became free in time."""
+    pass
+
+
+class DB_Connection_Pool(object):
+    """Thread-safe pool of open database connections, shared by the Flask
+    request threads, so a page view doesn't pay for connecting (TCP and
+    authentication) to the database every time.
+
+    Connections are opened as needed, up to size of them, and handed out
+    most recently used first. One that has sat idle for longer than
+    check_after seconds is health-checked before it is handed out again,
+    and replaced if the check fails (e.g. the server closed it).
+    A connection in use when an exception escapes is closed rather than
+    returned to the pool, as it may be left in a bad state.
+
+    Usage:
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            ...
+
+    Args:
+        connect (function): takes no arguments and returns a new DB-API
+            connection
+        size (int): maximum number of connections open at once
+        timeout (float): seconds to wait for a free connection before
+            raising DB_Pool_Timeout
+        check_after (float): idle seconds after which a connection is
+            health-checked before use
+        check (function): takes a connection and raises an exception if it
+            is no longer usable. Defaults to calling its ping() method,
+            as MySQLdb connections have.
+    """
+
+    def __init__(self, connect, size=4, timeout=10.0, check_after=30.0, check=None):
+        self._connect = connect
+        self._size = size
+        self._timeout = timeout
+        self._check_after = check_after
+        self._check = check if check is not None else self._ping
+        self._idle = []
+        self._num_open = 0
+        self._cond = threading.Condition()
+
+
+    @contextmanager
+    def connection(self):
+        """Context manager checking a connection out of the pool for the
+        duration of the with block.
+
+        Any transaction still open at the end of the block is rolled back,
+        so the next user of the connection doesn't see an old snapshot of
+        the database; writes must be committed inside the block.
+        """
+        conn = self._checkout()
+        try:
+            yield conn
+        except Exception:
+            self._discard(conn)
+            raise
+        self._checkin(conn)
+
+
+    def get_num_open(self):
+        """Returns:
+            int: number of connections open, idle or in use
+        """
+        return self._num_open
+
+
+    def close_all(self):
+        """Closes the idle connections. Those in use are closed when they
+        are returned."""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._num_open -= len(idle)
+        for conn, last_used in idle:
+            self._close(conn)
+
+
+    def _checkout(self):
+        deadline = time.time() + self._timeout
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._num_open < self._size:
+                    self._num_open += 1
+                    conn = None
+                    break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise DB_Pool_Timeout("No database connection free after %.1fs"
+                                          % self._timeout)
+                self._cond.wait(remaining)
+
+        # Connecting and checking happen outside the lock, as they can be slow
+        if conn is not None and time.time() - last_used > self._check_after:
+            try:
+                self._check(conn)
+            except Exception:
+                self._close(conn)
+                conn = None
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                self._release_slot()
+                raise
+        return conn
+
+
+    def _checkin(self, conn):
+        try:
+            conn.rollback()
+        except Exception:
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.time()))
+            self._cond.notify()
+
+
+    def _discard(self, conn):
+        self._close(conn)
+        self._release_slot()
+
+
+    def _release_slot(self):
+        with self._cond:
+            self._num_open -= 1
+            self._cond.notify()
+
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+    def _ping(self, conn):
+        conn.ping()
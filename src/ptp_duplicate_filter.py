@@ -0,0 +1,80 @@
+from collections import deque
+from ptp_packet_decoder import TCP_SYN, TCP_PSH, TCP_ACK
+
+
+class Duplicate_Filter(object):
+    """Streaming, partial de-duplication of the packets of one direction of a
+    TCP connection. Packets are checked one at a time as they arrive, and
+    are considered duplicate if they fall under one of these cases:
+    both directions:
+    * duplicate ack: no payload, flags=A, same seq and ack numbers.
+    * duplicate data: flags=PA or A, same seq/ack/TCP chksum, same non-zero payload
+    cli_to_svr:
+    * duplicate syn: flags=S, same seq numbers
+    svr_to_cli:
+    * duplicate synack: flags=SA, same seq/ack
+
+    Each case has its own kind of key, a plain tuple of header fields, and
+    keys are remembered in one set, so checking a packet is O(1). Only the
+    most recent max_keys keys are remembered: duplicates (e.g. the same
+    packet sniffed twice, or a retransmission) arrive close together, and
+    this keeps memory per connection bounded however long it runs.
+
+    Args:
+        max_keys (int): number of most recent keys remembered
+    """
+
+    _ACK = 0
+    _DATA = 1
+    _SYN = 2
+    _SYNACK = 3
+
+    _DATA_FLAGS = (TCP_ACK, TCP_PSH | TCP_ACK)
+
+    def __init__(self, max_keys=1024):
+        self._max_keys = max_keys
+        self._keys = set()
+        self._key_order = deque()
+
+
+    def is_duplicate(self, pkt):
+        """Checks whether a packet duplicates one seen earlier, remembering it
+        if not.
+
+        Args:
+            pkt (Decoded_Packet)
+
+        Returns:
+            bool: True if pkt is a duplicate
+        """
+        key = self._get_key(pkt)
+        if key is None:
+            return False
+
+        keys = self._keys
+        if key in keys:
+            return True
+
+        keys.add(key)
+        key_order = self._key_order
+        key_order.append(key)
+        if len(key_order) > self._max_keys:
+            keys.discard(key_order.popleft())
+        return False
+
+
+    def _get_key(self, pkt):
+        """Returns:
+            tuple: de-duplication key for pkt, or None if pkt falls under none
+                of the cases and so is never considered a duplicate
+        """
+        flags = pkt.flags
+        if flags == TCP_ACK and pkt.payload_len == 0:
+            return (self._ACK, pkt.seq, pkt.ack)
+        if flags in self._DATA_FLAGS and pkt.payload_len != 0:
+            return (self._DATA, pkt.seq, pkt.ack, pkt.chksum, flags)
+        if flags == TCP_SYN and pkt.ack == 0:
+            return (self._SYN, pkt.seq)
+        if flags == TCP_SYN | TCP_ACK:
+            return (self._SYNACK, pkt.seq, pkt.ack)
+        return None
@@ -0,0 +1,223 @@
+from ptp_packet_decoder import TCP_SYN, TCP_ACK, TCP_FIN, TCP_RST
+from ptp_packet_table import Packet_Table
+from ptp_duplicate_filter import Duplicate_Filter
+from ptp_tls_tracker import TLS_Tracker
+
+
+class Flow_Table(object):
+    """Splits packets into TCP connections (flows) and, within each flow,
+    into its client-to-server and server-to-client directions, in a single
+    pass. Replaces building Scapy-style 'TCP a:b > c:d' session keys and
+    pairing them up afterwards by string manipulation.
+
+    Each flow is identified by its quad tuple (cli_ip, cli_pt, svr_ip,
+    svr_pt), i.e. the connection's endpoints in a canonical client-first
+    order, so both directions map to the same flow. A second dict, keyed by
+    the directional (src_ip, src_pt, dst_ip, dst_pt) tuple of a packet, maps
+    straight to the Packet_Table for that direction. Assigning a packet
+    therefore costs one dict lookup, and building the table is linear in the
+    number of packets however many connections there are.
+
+    Each direction also has a Duplicate_Filter, so duplicate packets are
+    dropped (and counted) as they arrive rather than in a later pass.
+
+    Each flow also has a TLS_Tracker, which is given the payload of the
+    packets kept for as long as it needs them, so SSL analysis happens while
+    the packets are read rather than after.
+
+    Note:
+        The protocol part of the 5-tuple is implicit: Packet_Decoder only
+        yields TCP packets.
+
+    Args:
+        cli_ip (str): IP address of the client (the mobile device), used to
+            decide which end of a new flow is the client
+        payload_source: passed on to each Packet_Table, see Packet_Table
+        on_verdict (function): called with a flow's quad tuple and
+            TLS_Tracker when the tracker reaches its verdict, e.g. to report
+            it during a live capture
+
+    Attributes:
+        _flows (dict): quad tuple -> [cli_to_svr, svr_to_cli] Packet_Tables,
+            either of which may be None
+        _directions (dict): directional tuple -> (Packet_Table,
+            Duplicate_Filter, TLS_Tracker, bool: True if client-to-server,
+            quad tuple of the flow)
+        _trackers (dict): quad tuple -> TLS_Tracker
+        _closed (set): quad tuples of the flows a FIN or RST was seen in
+    """
+
+    def __init__(self, cli_ip=None, payload_source=None, on_verdict=None):
+        self._cli_ip = cli_ip
+        self._payload_source = payload_source
+        self._on_verdict = on_verdict
+        self._flows = {}
+        self._directions = {}
+        self._trackers = {}
+        # quad tuples whose verdict has been passed to on_verdict
+        self._reported = set()
+        self._closed = set()
+
+
+    def __len__(self):
+        return len(self._flows)
+
+
+    def add_packet(self, pkt, offset):
+        """Appends a packet to the table for its flow and direction, creating
+        them if this is the first packet seen, unless it is a duplicate.
+
+        Args:
+            pkt (Decoded_Packet)
+            offset (int): offset of the packet's payload in the payload source
+
+        Returns:
+            Packet_Table: the table the packet was appended to, or None if
+                it was dropped as a duplicate
+        """
+        key = (pkt.src_ip, pkt.src_pt, pkt.dst_ip, pkt.dst_pt)
+        direction = self._directions.get(key)
+        if direction is None:
+            direction = self._add_direction(pkt, key)
+        table, dup_filter, tracker, from_client, quad = direction
+        if dup_filter.is_duplicate(pkt):
+            table.num_duplicates += 1
+            return None
+        table.append(pkt, offset)
+        if pkt.flags & (TCP_FIN | TCP_RST):
+            self._closed.add(quad)
+        if tracker.needs_payload(from_client) and (pkt.payload_len or pkt.flags & TCP_SYN):
+            verdict = tracker.add_segment(from_client, pkt.seq, pkt.flags, pkt.get_payload())
+            if verdict is not None and self._on_verdict is not None:
+                self._report_verdict(quad, tracker)
+        return table
+
+
+    def finish(self):
+        """Decides the verdict of every flow which doesn't have one yet, for
+        when no more packets will be added, passing them to on_verdict.
+        """
+        for quad, tracker in self._trackers.iteritems():
+            if tracker.get_verdict() is None:
+                tracker.finish()
+                if self._on_verdict is not None:
+                    self._report_verdict(quad, tracker)
+
+
+    def pop_finished(self, now, linger, idle_timeout):
+        """Removes the flows which are over, so that a live capture's memory
+        doesn't grow with its length: those closed (a FIN or RST seen) with
+        no packets for linger seconds, and any with none for idle_timeout
+        seconds. Flows without a verdict are finished (see finish) first.
+        A packet of a flow which comes after it is removed starts a new one.
+
+        Args:
+            now (float): timestamp of the latest packet
+            linger (float): seconds a closed flow is kept for late packets,
+                e.g. the last ACK or retransmissions
+            idle_timeout (float)
+
+        Returns:
+            dict: quad tuple -> ((cli_to_svr, svr_to_cli), TLS_Tracker) of
+                the flows removed
+        """
+        finished = []
+        for quad, directions in self._flows.iteritems():
+            last_ts = max(table.ts[-1] for table in directions if table is not None)
+            idle = now - last_ts
+            if idle >= idle_timeout or (idle >= linger and quad in self._closed):
+                finished.append(quad)
+
+        removed = {}
+        for quad in finished:
+            directions = self._flows.pop(quad)
+            for table in directions:
+                if table is not None:
+                    del self._directions[(table.src_ip, table.src_pt, table.dst_ip, table.dst_pt)]
+            tracker = self._trackers.pop(quad)
+            if tracker.get_verdict() is None:
+                tracker.finish()
+                if self._on_verdict is not None:
+                    self._report_verdict(quad, tracker)
+            self._reported.discard(quad)
+            self._closed.discard(quad)
+            removed[quad] = (tuple(directions), tracker)
+        return removed
+
+
+    def _report_verdict(self, quad, tracker):
+        if quad not in self._reported:
+            self._reported.add(quad)
+            self._on_verdict(quad, tracker)
+
+
+    def get_flows(self):
+        """Returns:
+            dict: quad tuple (cli_ip, cli_pt, svr_ip, svr_pt) -> pair of
+                Packet_Tables (cli_to_svr, svr_to_cli); a direction in which
+                no packets were seen is None.
+        """
+        return dict((quad, tuple(directions))
+                    for quad, directions in self._flows.iteritems())
+
+
+    def get_tls_trackers(self):
+        """Returns:
+            dict: quad tuple -> TLS_Tracker of the flow
+        """
+        return dict(self._trackers)
+
+
+    def _add_direction(self, pkt, key):
+        """Creates the Packet_Table for a direction not seen before, and the
+        flow it belongs to if the opposite direction hasn't been seen either.
+
+        Returns:
+            tuple: the new direction's entry in _directions
+        """
+        table = Packet_Table(pkt.src_ip, pkt.src_pt, pkt.dst_ip, pkt.dst_pt,
+                             self._payload_source)
+        reverse_key = (pkt.dst_ip, pkt.dst_pt, pkt.src_ip, pkt.src_pt)
+
+        if reverse_key in self._flows:
+            # reverse direction is client-to-server, so this is server-to-client
+            quad, from_client = reverse_key, False
+        elif key in self._flows:
+            quad, from_client = key, True
+        elif self._is_from_client(pkt):
+            quad, from_client = key, True
+            self._add_flow(quad)
+        else:
+            quad, from_client = reverse_key, False
+            self._add_flow(quad)
+
+        self._flows[quad][0 if from_client else 1] = table
+        direction = self._directions[key] = \
+            (table, Duplicate_Filter(), self._trackers[quad], from_client, quad)
+        return direction
+
+
+    def _add_flow(self, quad):
+        self._flows[quad] = [None, None]
+        self._trackers[quad] = TLS_Tracker(svr_pt=quad[3])
+
+
+    def _is_from_client(self, pkt):
+        """Decides which end of a new flow is the client, from its first packet.
+        Falls back on the TCP handshake flags and then on the ports (servers
+        usually listen on the lower-numbered, well-known port) if the flow
+        doesn't involve the known client IP address.
+
+        Returns:
+            bool: True if pkt was sent by the client
+        """
+        if pkt.src_ip == self._cli_ip:
+            return True
+        if pkt.dst_ip == self._cli_ip:
+            return False
+        handshake_flags = pkt.flags & (TCP_SYN | TCP_ACK)
+        if handshake_flags == TCP_SYN:
+            return True
+        if handshake_flags == TCP_SYN | TCP_ACK:
+            return False
+        return pkt.src_pt > pkt.dst_pt
@@ -0,0 +1,213 @@
+import socket
+import struct
+import threading
+from collections import OrderedDict
+
+
+class Hostname_Index(object):
+    """IP address -> hostname index built passively from the capture itself,
+    so servers can be named without any network lookups. Names come from:
+
+    - DNS responses (UDP port 53): each A or AAAA answer maps its address to
+      the name the client asked for. The asked-for name, rather than the
+      end of any CNAME chain, is used, as the latter is often just a CDN
+      node's name.
+    - the server name (SNI) a client put in its TLS ClientHello, which
+      overrides a name from DNS for the same address, since it is what the
+      client actually connected to.
+
+    Safe to add to from a capture thread while other threads read it.
+
+    Args:
+        max_entries (int): maximum number of addresses kept; the oldest
+            entries are dropped first
+    """
+
+    DNS_PORT = 53
+    _TYPE_A = 1
+    _TYPE_AAAA = 28
+    _CLASS_IN = 1
+    _QR_RESPONSE = 0x8000
+    _RCODE_MASK = 0x000f
+    _MAX_POINTERS = 32
+
+    _dns_hdr = struct.Struct('!HHHHHH')
+    _rr_hdr = struct.Struct('!HHIH')
+    _question_tail = struct.Struct('!HH')
+    _ubyte = struct.Struct('!B')
+    _ushort = struct.Struct('!H')
+
+    def __init__(self, max_entries=65536):
+        self._max_entries = max_entries
+        self._names = OrderedDict()
+        self._from_sni = set()
+        self._lock = threading.Lock()
+
+
+    def get(self, ip_addr):
+        """Returns:
+            str: hostname of ip_addr, or None if not seen
+        """
+        return self._names.get(ip_addr)
+
+
+    def lookup(self, ip_addrs):
+        """Returns:
+            dict: IP address -> hostname, for those of ip_addrs in the index
+        """
+        with self._lock:
+            return dict((ip_addr, self._names[ip_addr])
+                        for ip_addr in ip_addrs if ip_addr in self._names)
+
+
+    def __len__(self):
+        return len(self._names)
+
+
+    def get_entries(self):
+        """Returns:
+            list of (str, str, bool): (IP address, hostname, True if the
+                name is from SNI) for every address, oldest first, e.g. to
+                merge into another index
+        """
+        with self._lock:
+            return [(ip_addr, name, ip_addr in self._from_sni)
+                    for ip_addr, name in self._names.iteritems()]
+
+
+    def merge(self, entries):
+        """Adds entries from another index's get_entries, with SNI names
+        overriding DNS ones as usual."""
+        with self._lock:
+            for ip_addr, name, from_sni in entries:
+                if from_sni:
+                    self._from_sni.add(ip_addr)
+                elif ip_addr in self._from_sni:
+                    continue
+                self._set(ip_addr, name)
+
+
+    def add_sni(self, svr_ip, server_name):
+        """Records the server name a client gave in its ClientHello when
+        connecting to svr_ip."""
+        if not server_name:
+            return
+        with self._lock:
+            self._from_sni.add(svr_ip)
+            self._set(svr_ip, server_name)
+
+
+    def add_packet(self, pkt):
+        """Adds the answers of a DNS response.
+
+        Args:
+            pkt (Decoded_Packet): a UDP packet; anything but a response from
+                port 53 is ignored
+
+        Returns:
+            int: number of addresses added
+        """
+        if pkt.src_pt != self.DNS_PORT:
+            return 0
+        return self.add_dns_response(pkt.get_payload())
+
+
+    def add_dns_response(self, msg):
+        """Adds the A and AAAA answers of a DNS response message.
+
+        Args:
+            msg (str): DNS message, as carried in a UDP payload
+
+        Returns:
+            int: number of addresses added
+        """
+        try:
+            answers = self._parse_dns_response(msg)
+        except (struct.error, ValueError):
+            # truncated or malformed
+            return 0
+
+        with self._lock:
+            for ip_addr, name in answers:
+                if ip_addr not in self._from_sni:
+                    self._set(ip_addr, name)
+        return len(answers)
+
+
+    def _set(self, ip_addr, name):
+        """Must be called with the lock held."""
+        self._names.pop(ip_addr, None)
+        self._names[ip_addr] = name
+        while len(self._names) > self._max_entries:
+            old_ip_addr, _ = self._names.popitem(last=False)
+            self._from_sni.discard(old_ip_addr)
+
+
+    def _parse_dns_response(self, msg):
+        """Returns:
+            list of (str, str): (IP address, name asked for) for each A or
+                AAAA answer
+        """
+        txn_id, flags, qd_count, an_count, ns_count, ar_count = \
+            self._dns_hdr.unpack_from(msg, 0)
+        if not flags & self._QR_RESPONSE or flags & self._RCODE_MASK or not an_count:
+            return []
+
+        offset = self._dns_hdr.size
+        asked = None
+        for i in range(qd_count):
+            name, offset = self._read_name(msg, offset)
+            offset += self._question_tail.size
+            if asked is None:
+                asked = name
+
+        answers = []
+        for i in range(an_count):
+            name, offset = self._read_name(msg, offset)
+            rr_type, rr_class, ttl, rd_len = self._rr_hdr.unpack_from(msg, offset)
+            offset += self._rr_hdr.size
+            rdata = msg[offset:offset + rd_len]
+            offset += rd_len
+            if len(rdata) < rd_len:
+                raise ValueError("truncated answer")
+            if rr_class != self._CLASS_IN:
+                continue
+            if rr_type == self._TYPE_A and rd_len == 4:
+                answers.append((socket.inet_ntoa(rdata), asked or name))
+            elif rr_type == self._TYPE_AAAA and rd_len == 16:
+                answers.append((socket.inet_ntop(socket.AF_INET6, rdata), asked or name))
+        return answers
+
+
+    def _read_name(self, msg, offset):
+        """Reads a possibly compressed domain name (RFC 1035 4.1.4).
+
+        Returns:
+            (str, int): the name, without the trailing dot, and the offset
+                just past it where it started
+        """
+        labels = []
+        end = None
+        pointers = 0
+        while True:
+            length, = self._ubyte.unpack_from(msg, offset)
+            if length & 0xc0 == 0xc0:
+                pointer, = self._ushort.unpack_from(msg, offset)
+                if end is None:
+                    end = offset + 2
+                pointers += 1
+                if pointers > self._MAX_POINTERS:
+                    raise ValueError("compression loop")
+                offset = pointer & 0x3fff
+            elif length & 0xc0:
+                raise ValueError("unknown label type")
+            elif length == 0:
+                if end is None:
+                    end = offset + 1
+                return '.'.join(labels).lower(), end
+            else:
+                label = msg[offset + 1:offset + 1 + length]
+                if len(label) < length:
+                    raise ValueError("truncated name")
+                labels.append(str(label))
+                offset += 1 + length
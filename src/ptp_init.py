@@ -1,7 +1,8 @@
-from ptp_stream_db import Stream_DB
+from ptp_stream_db import get_stream_db
 import sys
 
-db = Stream_DB()
+# PTP_DB_BACKEND=sqlite selects the embedded database (see Constants)
+db = get_stream_db()
 
 def create_db():
     try:
@@ -11,6 +12,14 @@ def create_db():
     except:
         print("    ...skipping database creation as it already exists.")
 
+def create_captures_table():
+    try:
+        print("Creating captures table...")
+        db.create_table_captures()
+        print("    ...done.")
+    except:
+        print("    ...skipping captures table creation as it already exists.")
+
 def create_streams_table():
     try:
         print("Creating streams table...")
@@ -19,6 +28,24 @@ def create_streams_table():
     except:
         print("    ...skipping streams table creation as it already exists.")
 
+def migrate_streams_table():
+    try:
+        print("Migrating streams table...")
+        if db.migrate_table_streams():
+            print("    ...done.")
+        else:
+            print("    ...skipping migration as it is up to date.")
+    except Exception as e:
+        print("    ...migration failed: %s" % e)
+
+def compact_db():
+    try:
+        print("Compacting database...")
+        db.compact()
+        print("    ...done.")
+    except Exception as e:
+        print("    ...compaction failed: %s" % e)
+
 def drop_streams_table():
     try:
         print("Dropping streams table...")
@@ -27,13 +54,26 @@ def drop_streams_table():
     except:
         print("    ...skipping drop as table doesn't exist.")
 
+def drop_captures_table():
+    try:
+        print("Dropping captures table...")
+        db.drop_table_captures()
+        print("    ...done.")
+    except:
+        print("    ...skipping drop as table doesn't exist.")
+
 def init():
     create_db()
+    create_captures_table()
     create_streams_table()
+    migrate_streams_table()
+    compact_db()
 
 def reinit():
     create_db()
     drop_streams_table()
+    drop_captures_table()
+    create_captures_table()
     create_streams_table()
 
 def main():
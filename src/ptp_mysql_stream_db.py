@@ -0,0 +1,91 @@
+import MySQLdb
+from ptp_constants import Constants
+from ptp_stream_db import Stream_DB
+
+
+class MySQL_Stream_DB(Stream_DB):
+    """Stream_DB stored on a MySQL server, with the connection settings in
+    Constants (MYSQL_HOST etc.). IP addresses are stored in binary with
+    inet6_aton.
+
+    Args:
+        pool (DB_Connection_Pool): pool to use instead of the shared one
+    """
+
+    _db_error = MySQLdb.OperationalError
+
+    def create_db_ptp(self):
+        const = Constants()
+        conn = MySQLdb.connect(host=const.MYSQL_HOST, user=const.MYSQL_USER,
+                               passwd=const.MYSQL_PASSWORD)
+        try:
+            cursor = conn.cursor()
+            cursor.execute("create database %s;" % const.MYSQL_DB)
+        finally:
+            conn.close()
+
+
+    def compact(self):
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("optimize table streams, captures;")
+            cursor.fetchall()
+            cursor.close()
+
+
+    def _sql_create_table_captures(self):
+        return """create table captures (id int not null primary key auto_increment,
+            ts_created datetime,
+            pcap_filename varbinary(255),
+            num_streams int not null default 0,
+            version int not null default 0,
+            is_complete bool not null default false ) engine=InnoDB"""
+
+
+    def _sql_create_table_streams(self):
+        return ["""create table streams (id int not null primary key auto_increment,
+            capture_id int not null,
+            cli_ip varbinary(16),
+            cli_pt int(5),
+            svr_ip varbinary(16),
+            svr_pt int(5),
+            bytes_to_cli int(10),
+            bytes_to_svr int(6),
+            ts_first_pkt datetime,
+            ts_last_pkt datetime,
+            ssl_cli_hello bool,
+            ssl_cli_ccs bool,
+            ssl_svr_hello bool,
+            ssl_version varbinary(64),
+            ssl_cipher varbinary(128),
+            ssl_svr_ccs bool,
+            is_encrypted varbinary(16),
+            index streams_capture_svr_ip (capture_id, svr_ip),
+            index streams_capture_is_encrypted (capture_id, is_encrypted),
+            index streams_capture_bytes_to_cli (capture_id, bytes_to_cli),
+            foreign key (capture_id) references captures (id) on delete cascade ) engine=InnoDB"""]
+
+
+    def _sql_migrate_table_streams(self, capture_id):
+        return ["""alter table streams
+            add column capture_id int not null default %d after id,
+            add index streams_capture_svr_ip (capture_id, svr_ip),
+            add index streams_capture_is_encrypted (capture_id, is_encrypted),
+            add index streams_capture_bytes_to_cli (capture_id, bytes_to_cli),
+            add foreign key (capture_id) references captures (id) on delete cascade""" % capture_id,
+            "alter table streams alter column capture_id drop default"]
+
+
+    def _ip_to_db(self, value):
+        return "inet6_aton(%s)" % value
+
+
+    def _ip_from_db(self, column):
+        return "inet6_ntoa(%s)" % column
+
+
+    @staticmethod
+    def _connect():
+        const = Constants()
+        return MySQLdb.connect(host=const.MYSQL_HOST, user=const.MYSQL_USER,
+                               passwd=const.MYSQL_PASSWORD, db=const.MYSQL_DB)
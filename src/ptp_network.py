@@ -9,8 +9,6 @@ class Network(object):
         self._nic_name = self._sniff_iface_name
         self._gateway_iface_name = ptp_network_conf.gateway_iface
         self._gateway_iface_ip_addr = ptp_network_conf.gateway_iface_ip_addr
-        self._sniffer_stop_eth = '00:00:00:03:02:01'
-        self._sniffer_stop_ip = '10.11.12.13' 
 
     def get_nic_name(self):
         return self._nic_name
@@ -31,9 +29,3 @@ class Network(object):
 
     def get_host_ip(self):
         return self._gateway_iface_ip_addr
-
-    def get_stop_eth(self):
-        return self._sniffer_stop_eth 
-
-    def get_stop_ip(self):
-        return self._sniffer_stop_ip 
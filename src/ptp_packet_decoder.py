@@ -0,0 +1,329 @@
+import socket
+import struct
+import zlib
+
+
+# TCP flag bits (byte 13 of the TCP header)
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_PSH = 0x08
+TCP_ACK = 0x10
+TCP_URG = 0x20
+TCP_ECE = 0x40
+TCP_CWR = 0x80
+
+IP_PROTO_TCP = 6
+IP_PROTO_UDP = 17
+
+_shard_key = struct.Struct('!BHH')
+
+
+def flow_shard(proto, src, src_pt, dst, dst_pt, num_shards):
+    """Splits flows into shards by a CRC-32 of their 5-tuple, e.g. to share
+    them out between processes. Both directions of a flow are in the same
+    shard, and, unlike with hash(), every process agrees on it.
+
+    Args:
+        proto (int): IP protocol number
+        src (str): packed source IP address, as in the IP header
+        src_pt (int)
+        dst (str): packed destination IP address
+        dst_pt (int)
+        num_shards (int)
+
+    Returns:
+        int: shard of the packet's flow, from 0 to num_shards - 1
+    """
+    if (src, src_pt) > (dst, dst_pt):
+        src, src_pt, dst, dst_pt = dst, dst_pt, src, src_pt
+    key = _shard_key.pack(proto, src_pt, dst_pt) + src + dst
+    return (zlib.crc32(key) & 0xffffffff) % num_shards
+
+
+class Decoded_Packet(object):
+    """The handful of header fields PTP's analysis uses, pulled out of a raw
+    frame by Packet_Decoder. A lightweight stand-in for a dissected
+    Scapy.Packet.
+
+    Attributes:
+        ts (float): capture timestamp, seconds since the epoch
+        src_ip (str): source IP address (IPv4 dotted quad or IPv6 text form)
+        src_pt (int): source TCP port
+        dst_ip (str): destination IP address
+        dst_pt (int): destination TCP port
+        proto (int): IP protocol number
+        seq (int): TCP sequence number
+        ack (int): TCP acknowledgement number
+        flags (int): TCP flags byte, see TCP_* constants
+        chksum (int): TCP checksum
+        frame: the raw frame the packet was decoded from
+        payload_offset (int): offset of the TCP payload within frame
+        payload_len (int): length of the TCP payload in bytes, excluding any
+            link-layer padding
+
+    Note:
+        For a UDP packet (see Packet_Decoder's decode_udp) the ports, checksum
+        and payload are UDP's, and seq, ack and flags are 0.
+    """
+
+    __slots__ = ('ts', 'src_ip', 'src_pt', 'dst_ip', 'dst_pt', 'proto', 'seq',
+                 'ack', 'flags', 'chksum', 'frame', 'payload_offset',
+                 'payload_len')
+
+    def __init__(self, ts, src_ip, src_pt, dst_ip, dst_pt, proto, seq, ack,
+                 flags, chksum, frame, payload_offset, payload_len):
+        self.ts = ts
+        self.src_ip = src_ip
+        self.src_pt = src_pt
+        self.dst_ip = dst_ip
+        self.dst_pt = dst_pt
+        self.proto = proto
+        self.seq = seq
+        self.ack = ack
+        self.flags = flags
+        self.chksum = chksum
+        self.frame = frame
+        self.payload_offset = payload_offset
+        self.payload_len = payload_len
+
+    def get_payload(self):
+        """Returns:
+            str: copy of the TCP payload bytes ('' if there is no payload)
+        """
+        start = self.payload_offset
+        return self.frame[start:start + self.payload_len]
+
+    def __repr__(self):
+        return "<Decoded_Packet %s:%d > %s:%d flags=0x%02x seq=%d ack=%d len=%d>" % \
+            (self.src_ip, self.src_pt, self.dst_ip, self.dst_pt, self.flags,
+             self.seq, self.ack, self.payload_len)
+
+
+class Packet_Decoder(object):
+    """Header-only decoder for the frames PTP captures. Unpacks just the
+    link-layer, IP and TCP header fields PTP needs with the struct module,
+    so no Scapy objects are built on the analysis hot path.
+
+    Supported link types are Ethernet (as sniffed on tap0, with optional
+    802.1Q tags), Linux cooked capture (as libpcap delivers from ppp0, where
+    the EtherType sits 2 bytes further in than on Ethernet), PPP, raw IP and
+    BSD loopback. IPv4 and IPv6 (skipping common extension headers) are
+    decoded; anything other than TCP is ignored, or other than TCP and UDP
+    if decode_udp is set.
+
+    Args:
+        link_type (int): LINKTYPE_* value of the frames, e.g. from
+            Pcap_Reader.get_link_type()
+        decode_udp (bool): also decode UDP packets (e.g. for DNS), in which
+            case callers must check each packet's proto
+    """
+
+    LINKTYPE_NULL = 0
+    LINKTYPE_ETHERNET = 1
+    LINKTYPE_PPP = 9
+    LINKTYPE_RAW = 101
+    LINKTYPE_LINUX_SLL = 113
+
+    ETHERTYPE_IPV4 = 0x0800
+    ETHERTYPE_IPV6 = 0x86dd
+    _ETHERTYPE_VLAN = (0x8100, 0x88a8, 0x9100)
+    _PPP_IPV4 = 0x0021
+    _PPP_IPV6 = 0x0057
+    _IPV6_EXT_HEADERS = (0, 43, 60)
+    _IPV6_FRAGMENT = 44
+
+    _ipv4_hdr = struct.Struct('!BxHxxHxBxx4s4s')
+    _ipv6_hdr = struct.Struct('!4xHBx16s16s')
+    _tcp_hdr = struct.Struct('!HHIIBBxxH')
+    _udp_hdr = struct.Struct('!HHxxH')
+    _UDP_HDR_LEN = 8
+    _ushort = struct.Struct('!H')
+    _ubyte_pair = struct.Struct('!BB')
+    _uint_le = struct.Struct('<I')
+
+    _ports = struct.Struct('!HH')
+
+    def __init__(self, link_type=LINKTYPE_ETHERNET, decode_udp=False):
+        self._link_type = link_type
+        self._decode_udp = decode_udp
+        self._get_ip_offset = {
+            self.LINKTYPE_NULL: self._null_ip_offset,
+            self.LINKTYPE_ETHERNET: self._ethernet_ip_offset,
+            self.LINKTYPE_PPP: self._ppp_ip_offset,
+            self.LINKTYPE_RAW: self._raw_ip_offset,
+            self.LINKTYPE_LINUX_SLL: self._linux_sll_ip_offset,
+        }.get(link_type)
+
+        if self._get_ip_offset is None:
+            raise ValueError("Unsupported link type: %d" % link_type)
+
+
+    def get_link_type(self):
+        return self._link_type
+
+
+    def decode(self, ts, frame):
+        """Decodes one frame.
+
+        Args:
+            ts (float): capture timestamp of the frame
+            frame (str, buffer or memoryview): raw frame bytes
+
+        Returns:
+            Decoded_Packet, or None if frame is not a (complete enough)
+            TCP/IP (or UDP/IP, see decode_udp) packet
+        """
+        try:
+            ip_version, ip_offset = self._get_ip_offset(frame)
+            if ip_version == 4:
+                proto, tcp_offset, ip_end, src, dst = self._decode_ipv4(frame, ip_offset)
+            elif ip_version == 6:
+                proto, tcp_offset, ip_end, src, dst = self._decode_ipv6(frame, ip_offset)
+            else:
+                return None
+
+            if proto == IP_PROTO_TCP:
+                src_pt, dst_pt, seq, ack, data_offset, flags, chksum = \
+                    self._tcp_hdr.unpack_from(frame, tcp_offset)
+                payload_offset = tcp_offset + (data_offset >> 4) * 4
+            elif proto == IP_PROTO_UDP and self._decode_udp:
+                src_pt, dst_pt, chksum = self._udp_hdr.unpack_from(frame, tcp_offset)
+                seq = ack = flags = 0
+                payload_offset = tcp_offset + self._UDP_HDR_LEN
+            else:
+                return None
+        except (struct.error, TypeError, ValueError):
+            # truncated frame, or a fragment carrying no TCP header
+            return None
+
+        if ip_version == 4:
+            src_ip = socket.inet_ntoa(src)
+            dst_ip = socket.inet_ntoa(dst)
+        else:
+            src_ip = socket.inet_ntop(socket.AF_INET6, src)
+            dst_ip = socket.inet_ntop(socket.AF_INET6, dst)
+
+        payload_len = min(ip_end, len(frame)) - payload_offset
+        if payload_len < 0:
+            payload_len = 0
+
+        return Decoded_Packet(ts, src_ip, src_pt, dst_ip, dst_pt, proto, seq, ack,
+                              flags, chksum, frame, payload_offset, payload_len)
+
+
+    def get_shard(self, frame, num_shards):
+        """Works out which shard a frame's flow is in (see flow_shard) from
+        just its addresses and ports, without decoding the rest.
+
+        Args:
+            frame (str, buffer or memoryview): raw frame bytes
+            num_shards (int)
+
+        Returns:
+            int: the shard, or None for frames decode would ignore
+        """
+        try:
+            ip_version, ip_offset = self._get_ip_offset(frame)
+            if ip_version == 4:
+                proto, l4_offset, _, src, dst = self._decode_ipv4(frame, ip_offset)
+            elif ip_version == 6:
+                proto, l4_offset, _, src, dst = self._decode_ipv6(frame, ip_offset)
+            else:
+                return None
+            if proto != IP_PROTO_TCP and not (proto == IP_PROTO_UDP and self._decode_udp):
+                return None
+            src_pt, dst_pt = self._ports.unpack_from(frame, l4_offset)
+        except (struct.error, TypeError, ValueError):
+            return None
+        return flow_shard(proto, src, src_pt, dst, dst_pt, num_shards)
+
+
+    def _decode_ipv4(self, frame, offset):
+        """Returns:
+            (int, int, int, str, str): IP protocol, offset of the transport
+                header, offset of the end of the IP datagram (excludes link
+                padding), packed source and destination addresses
+        """
+        ver_ihl, total_len, frag, proto, src, dst = \
+            self._ipv4_hdr.unpack_from(frame, offset)
+        if frag & 0x1fff:
+            raise ValueError("non-initial fragment")
+        return proto, offset + (ver_ihl & 0x0f) * 4, offset + total_len, src, dst
+
+
+    def _decode_ipv6(self, frame, offset):
+        """See _decode_ipv4."""
+        payload_len, next_hdr, src, dst = self._ipv6_hdr.unpack_from(frame, offset)
+        ip_end = offset + 40 + payload_len
+        offset += 40
+        while next_hdr in self._IPV6_EXT_HEADERS or next_hdr == self._IPV6_FRAGMENT:
+            if next_hdr == self._IPV6_FRAGMENT:
+                frag, = self._ushort.unpack_from(frame, offset + 2)
+                if frag & 0xfff8:
+                    raise ValueError("non-initial fragment")
+                ext_len = 8
+                next_hdr, _ = self._ubyte_pair.unpack_from(frame, offset)
+            else:
+                next_hdr, ext_len = self._ubyte_pair.unpack_from(frame, offset)
+                ext_len = (ext_len + 1) * 8
+            offset += ext_len
+        return next_hdr, offset, ip_end, src, dst
+
+
+    def _ethertype_ip_version(self, ethertype):
+        if ethertype == self.ETHERTYPE_IPV4:
+            return 4
+        if ethertype == self.ETHERTYPE_IPV6:
+            return 6
+        return None
+
+
+    def _ethernet_ip_offset(self, frame):
+        offset = 12
+        ethertype, = self._ushort.unpack_from(frame, offset)
+        while ethertype in self._ETHERTYPE_VLAN:
+            offset += 4
+            ethertype, = self._ushort.unpack_from(frame, offset)
+        return self._ethertype_ip_version(ethertype), offset + 2
+
+
+    def _linux_sll_ip_offset(self, frame):
+        # 16-byte cooked header; protocol field is where an Ethernet header's
+        # EtherType would be, shifted 2 bytes along
+        ethertype, = self._ushort.unpack_from(frame, 14)
+        return self._ethertype_ip_version(ethertype), 16
+
+
+    def _ppp_ip_offset(self, frame):
+        offset = 0
+        if frame[0:2] == b'\xff\x03':   # HDLC address and control bytes
+            offset = 2
+        first, second = self._ubyte_pair.unpack_from(frame, offset)
+        if first & 0x01:
+            # protocol field compressed to a single byte (RFC 1661)
+            protocol = first
+            offset += 1
+        else:
+            protocol = (first << 8) | second
+            offset += 2
+        if protocol == self._PPP_IPV4:
+            return 4, offset
+        if protocol == self._PPP_IPV6:
+            return 6, offset
+        return None, offset
+
+
+    def _raw_ip_offset(self, frame):
+        ver_ihl, _ = self._ubyte_pair.unpack_from(frame, 0)
+        return ver_ihl >> 4, 0
+
+
+    def _null_ip_offset(self, frame):
+        family, = self._uint_le.unpack_from(frame, 0)
+        if family == socket.AF_INET:
+            return 4, 4
+        # AF_INET6 differs between BSDs: 24, 28 or 30
+        if family in (24, 28, 30):
+            return 6, 4
+        return None, 4
@@ -0,0 +1,142 @@
+from array import array
+from collections import namedtuple
+
+
+Packet_Row = namedtuple('Packet_Row',
+                        'ts seq ack flags chksum payload_len offset')
+
+
+class Packet_Table(object):
+    """Compact, column-oriented store for the packets of one direction of a
+    TCP connection (what Scapy calls a session). Each header field PTP uses
+    lives in its own typed array, so a packet costs a few dozen bytes rather
+    than a full packet object, and whole-session figures such as total
+    payload size or first/last timestamp are reductions over a single
+    column.
+
+    Payload bytes are not stored; the offset column records where each
+    packet's payload starts in the payload source (normally the
+    memory-mapped PCAP file), from which it can be fetched on demand.
+
+    Args:
+        src_ip (str): IP address packets are sent from
+        src_pt (int): TCP port packets are sent from
+        dst_ip (str): IP address packets are sent to
+        dst_pt (int): TCP port packets are sent to
+        payload_source: object with a get_bytes(offset, length) method, e.g.
+            a Pcap_Reader; None if payloads can't be fetched
+
+    Attributes:
+        ts (array of float): capture timestamps
+        seq (array of int): TCP sequence numbers
+        ack (array of int): TCP acknowledgement numbers
+        flags (array of int): TCP flags bytes
+        chksum (array of int): TCP checksums
+        payload_len (array of int): TCP payload lengths
+        offset (array of int): offsets of the payloads in the payload source
+        num_duplicates (int): number of duplicate packets dropped rather than
+            added to the table
+    """
+
+    def __init__(self, src_ip, src_pt, dst_ip, dst_pt, payload_source=None):
+        self.src_ip = src_ip
+        self.src_pt = src_pt
+        self.dst_ip = dst_ip
+        self.dst_pt = dst_pt
+        self._payload_source = payload_source
+        self.ts = array('d')
+        self.seq = array('I')
+        self.ack = array('I')
+        self.flags = array('B')
+        self.chksum = array('H')
+        self.payload_len = array('I')
+        self.offset = array('L')
+        self.num_duplicates = 0
+
+
+    @classmethod
+    def from_packets(cls, pkts, payload_source=None):
+        """Builds a table from Decoded_Packet objects all travelling in the
+        same direction, e.g. for testing.
+
+        Args:
+            pkts (list of Decoded_Packet)
+            payload_source: see class docstring
+
+        Returns:
+            Packet_Table
+        """
+        first = pkts[0]
+        table = cls(first.src_ip, first.src_pt, first.dst_ip, first.dst_pt,
+                    payload_source)
+        for pkt in pkts:
+            table.append(pkt, pkt.payload_offset)
+        return table
+
+
+    def __len__(self):
+        return len(self.ts)
+
+
+    def __getitem__(self, i):
+        return Packet_Row(self.ts[i], self.seq[i], self.ack[i], self.flags[i],
+                          self.chksum[i], self.payload_len[i], self.offset[i])
+
+
+    def __iter__(self):
+        for i in range(len(self.ts)):
+            yield self[i]
+
+
+    def append(self, pkt, offset):
+        """Adds a packet's header fields as a new row.
+
+        Args:
+            pkt (Decoded_Packet)
+            offset (int): offset of the packet's payload in the payload source
+        """
+        self.ts.append(pkt.ts)
+        self.seq.append(pkt.seq)
+        self.ack.append(pkt.ack)
+        self.flags.append(pkt.flags)
+        self.chksum.append(pkt.chksum)
+        self.payload_len.append(pkt.payload_len)
+        self.offset.append(offset)
+
+
+    def select(self, indices):
+        """Returns:
+            Packet_Table: new table holding only the given rows, in the order
+                given
+        """
+        table = Packet_Table(self.src_ip, self.src_pt, self.dst_ip, self.dst_pt,
+                             self._payload_source)
+        for name in Packet_Row._fields:
+            column = getattr(self, name)
+            getattr(table, name).extend(column[i] for i in indices)
+        return table
+
+
+    def get_payload(self, i):
+        """Returns:
+            str: TCP payload bytes of row i ('' if there is none, or no
+                payload source)
+        """
+        length = self.payload_len[i]
+        if not length or self._payload_source is None:
+            return b''
+        return self._payload_source.get_bytes(self.offset[i], length)
+
+
+    def get_payload_size(self):
+        """Returns:
+            int: total TCP payload in bytes
+        """
+        return sum(self.payload_len)
+
+
+    def get_start_and_end_ts(self):
+        """Returns:
+            (float, float): lowest and highest timestamps in the table
+        """
+        return min(self.ts), max(self.ts)
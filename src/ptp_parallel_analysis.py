@@ -0,0 +1,122 @@
+import multiprocessing
+import shutil
+import tempfile
+from ptp_session_reassembler import Session_Reassembler
+from ptp_pcap_splitter import Pcap_Splitter
+from ptp_constants import Constants
+from ptp_connection_status import Stream_Status, TCP_Status, SSL_Status
+from ptp_analysis_job import Analysis_Progress
+
+
+def _analyse_shard(shard_filename):
+    """Runs in a worker process: pre-processes and analyses the flows in
+    one shard file (see Pcap_Splitter).
+
+    Args:
+        shard_filename (str)
+
+    Returns:
+        (list, list): compact Stream_Status records (see to_record) and
+            Hostname_Index entries
+    """
+    reassembler = Session_Reassembler(shard_filename)
+    session_pairs = reassembler.get_session_pairs()
+    records = [to_record(pair.get_stream_status()) for pair in session_pairs.itervalues()]
+    return records, reassembler.get_hostname_index().get_entries()
+
+
+def to_record(stream_status):
+    """Returns:
+        tuple: the Stream_Status's values, which are cheaper to send between
+            processes than the objects
+    """
+    ts = stream_status.tcp_status
+    ss = stream_status.ssl_status
+    return (ts.cli_ip, ts.cli_pt, ts.svr_ip, ts.svr_pt, ts.bytes_to_svr, ts.bytes_to_cli,
+            ts.dup_pkts_to_svr, ts.dup_pkts_to_cli, ts.ts_first_pkt, ts.ts_last_pkt,
+            ss.ssl_cli_hello, ss.ssl_cli_ccs, ss.ssl_svr_hello, ss.ssl_version,
+            ss.ssl_cipher, ss.ssl_svr_ccs, ss.is_encrypted)
+
+
+def from_record(record):
+    """Returns:
+        Stream_Status: made from a to_record tuple
+    """
+    (cli_ip, cli_pt, svr_ip, svr_pt, bytes_to_svr, bytes_to_cli,
+     dup_pkts_to_svr, dup_pkts_to_cli, ts_first_pkt, ts_last_pkt,
+     ssl_cli_hello, ssl_cli_ccs, ssl_svr_hello, ssl_version,
+     ssl_cipher, ssl_svr_ccs, is_encrypted) = record
+    tcp_status = TCP_Status(cli_ip=cli_ip, cli_pt=cli_pt, svr_ip=svr_ip, svr_pt=svr_pt,
+                            bytes_to_svr=bytes_to_svr, bytes_to_cli=bytes_to_cli,
+                            dup_pkts_to_svr=dup_pkts_to_svr, dup_pkts_to_cli=dup_pkts_to_cli,
+                            ts_first_pkt=ts_first_pkt, ts_last_pkt=ts_last_pkt)
+    ssl_status = SSL_Status(ssl_cli_hello=ssl_cli_hello, ssl_cli_ccs=ssl_cli_ccs,
+                            ssl_svr_hello=ssl_svr_hello, ssl_version=ssl_version,
+                            ssl_cipher=ssl_cipher, ssl_svr_ccs=ssl_svr_ccs,
+                            is_encrypted=is_encrypted)
+    return Stream_Status(tcp_status=tcp_status, ssl_status=ssl_status)
+
+
+class Parallel_Analysis(object):
+    """Analyses one or more PCAP files in several processes at once, to use
+    more than one core: Python threads can't, because of the GIL.
+
+    The files are first split into shard files of whole flows in one
+    sequential pass (see Pcap_Splitter), after which each process
+    reassembles and analyses the flows of a shard independently of the
+    others. Only compact result records and hostnames are sent back. There
+    are a few shards per process, so that one shard of unusually big flows
+    doesn't leave the other processes waiting.
+
+    Args:
+        pcap_filenames (str or list of str): file, or files in capture
+            order, e.g. those of a capture rotated by tcpdump -C
+        num_processes (int): defaults to the number of CPUs
+    """
+
+    SHARDS_PER_PROCESS = 4
+
+    def __init__(self, pcap_filenames, num_processes=None):
+        if isinstance(pcap_filenames, basestring):
+            pcap_filenames = [pcap_filenames]
+        self._pcap_filenames = pcap_filenames
+        self._num_processes = num_processes or multiprocessing.cpu_count()
+        self._const = Constants()
+
+
+    def run(self, progress=None, hostname_index=None):
+        """Analyses the files.
+
+        Args:
+            progress (Analysis_Progress): packets_read is updated as the files
+                are split, and flows_analysed as each shard is finished
+            hostname_index (Hostname_Index): the server names found are
+                added to it
+
+        Returns:
+            list of Stream_Status: one per connection, in no particular order
+        """
+        if progress is None:
+            progress = Analysis_Progress()
+        num_shards = self._num_processes * self.SHARDS_PER_PROCESS
+        directory = tempfile.mkdtemp(prefix='ptp-shards-', dir=self._const.SHARD_DIR)
+        stream_statuses = []
+        # started before splitting, while this process is still small to fork
+        pool = multiprocessing.Pool(self._num_processes)
+        try:
+            shard_filenames = Pcap_Splitter(self._pcap_filenames, num_shards,
+                                            directory).split(progress)
+            progress.stage = 'analysing flows in %d processes' % self._num_processes
+            for records, hostnames in pool.imap_unordered(_analyse_shard, shard_filenames):
+                stream_statuses.extend(from_record(record) for record in records)
+                if hostname_index is not None:
+                    hostname_index.merge(hostnames)
+                progress.flows_analysed += len(records)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+            shutil.rmtree(directory, ignore_errors=True)
+        return stream_statuses
@@ -0,0 +1,189 @@
+import mmap
+import os
+import struct
+
+
+try:
+    _buffer = buffer    # Python 2: mmap has no new-style buffer interface
+except NameError:
+    _buffer = None
+
+
+def _make_view(buf, offset, length):
+    """Returns a zero-copy, read-only view of length bytes of buf starting at
+    offset."""
+    if _buffer is not None:
+        return _buffer(buf, offset, length)
+    return memoryview(buf)[offset:offset + length]
+
+
+class Pcap_Reader(object):
+    """Lazy, memory-mapped reader for libpcap (PCAP) files. Rather than
+    dissecting every packet up front (as Scapy's rdpcap does), records are
+    yielded one at a time as (timestamp, offset, frame) tuples, where frame is
+    a zero-copy view into the mapped file. Memory use therefore stays flat
+    however large the file grows, and the pages backing a frame can be dropped
+    by the OS as soon as the caller is done with it.
+
+    Note:
+        Both byte orders and both microsecond and nanosecond timestamp
+        resolutions are supported. A truncated final record (e.g. from a
+        capture that was still being written) is silently ignored.
+
+    Args:
+        pcap_filename (str): name of existing PCAP file to read.
+
+    Attributes:
+        _pcap_filename (str): name of the PCAP file
+        _file (file): open file object backing the memory map
+        _map (mmap): memory map of the whole file, or None if the file holds
+            no records
+        _endian (str): struct byte order prefix, '<' or '>'
+        _ts_divisor (float): converts the sub-second timestamp field to seconds
+        _link_type (int): link-layer header type of every frame in the file
+    """
+
+    GLOBAL_HEADER_LEN = 24
+    RECORD_HEADER_LEN = 16
+
+    _MAGIC_USEC = 0xa1b2c3d4
+    _MAGIC_NSEC = 0xa1b23c4d
+
+
+    def __init__(self, pcap_filename):
+        self._pcap_filename = pcap_filename
+        self._file = None
+        self._map = None
+        self._endian = '<'
+        self._ts_divisor = 1e6
+        self._link_type = None
+        self._open()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+    def __iter__(self):
+        return self.records()
+
+
+    def get_link_type(self):
+        """Returns:
+            int: link-layer header type (LINKTYPE_* value) from the global header
+        """
+        return self._link_type
+
+
+    def get_pcap_filename(self):
+        return self._pcap_filename
+
+
+    def get_global_header(self):
+        """Returns:
+            str: the file's global header as it is, e.g. to start another
+                file that records can be copied into unchanged, or '' if
+                the file holds no records
+        """
+        return self.get_bytes(0, self.GLOBAL_HEADER_LEN)
+
+
+    def records(self, start=None, end=None):
+        """Generator over the packet records in the file.
+
+        Args:
+            start (int): file offset of the first record header to read.
+                Defaults to the first record in the file.
+            end (int): file offset at which to stop reading. Defaults to the
+                end of the file.
+
+        Yields:
+            (float, int, buffer): record timestamp in seconds since the epoch,
+                file offset of the first byte of the frame, and a zero-copy
+                view of the captured frame bytes.
+        """
+        buf = self._map
+        if buf is None:
+            return
+
+        rec_hdr = struct.Struct(self._endian + 'IIII')
+        rec_hdr_len = self.RECORD_HEADER_LEN
+        unpack_from = rec_hdr.unpack_from
+        ts_divisor = self._ts_divisor
+        make_view = _make_view
+
+        pos = self.GLOBAL_HEADER_LEN if start is None else start
+        size = len(buf) if end is None else min(end, len(buf))
+
+        while pos + rec_hdr_len <= size:
+            ts_sec, ts_frac, caplen, wirelen = unpack_from(buf, pos)
+            frame_offset = pos + rec_hdr_len
+            pos = frame_offset + caplen
+            if pos > size:
+                break
+            yield (ts_sec + ts_frac / ts_divisor, frame_offset,
+                   make_view(buf, frame_offset, caplen))
+
+
+    def get_bytes(self, offset, length):
+        """Copies bytes out of the mapped file, e.g. to recover the payload
+        of a packet whose file offset was recorded while iterating.
+
+        Args:
+            offset (int): file offset of the first byte
+            length (int): number of bytes
+
+        Returns:
+            str: the requested bytes
+        """
+        if self._map is None:
+            return b''
+        return self._map[offset:offset + length]
+
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+    def _open(self):
+        """Opens and memory-maps the file and parses its global header.
+
+        Raises:
+            ValueError: If the file is not a PCAP file.
+        """
+        self._file = open(self._pcap_filename, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+
+        if size < self.GLOBAL_HEADER_LEN:
+            # e.g. sniffer stopped before libpcap flushed the global header
+            return
+
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, = struct.unpack_from('<I', self._map, 0)
+        if magic in (self._MAGIC_USEC, self._MAGIC_NSEC):
+            self._endian = '<'
+        else:
+            magic, = struct.unpack_from('>I', self._map, 0)
+            self._endian = '>'
+
+        if magic == self._MAGIC_USEC:
+            self._ts_divisor = 1e6
+        elif magic == self._MAGIC_NSEC:
+            self._ts_divisor = 1e9
+        else:
+            self.close()
+            raise ValueError("%s is not a PCAP file" % self._pcap_filename)
+
+        link_type, = struct.unpack_from(self._endian + 'I', self._map, 20)
+        # upper bits of the field may carry FCS information
+        self._link_type = link_type & 0x0fffffff
@@ -0,0 +1,181 @@
+import json
+import os
+from ptp_pcap_writer import Pcap_Writer
+
+
+class Pcap_Ring(object):
+    """Writes a capture as a ring of PCAP segment files, for monitoring that
+    goes on for days: a new segment is started once the current one reaches
+    max_bytes or max_seconds, and the oldest is deleted once there are more
+    than num_segments, so disk use stays bounded.
+
+    An index of the segments and the time range of their packets is kept in
+    the directory (see read_index), so that the packets of a given period
+    can be found without opening every segment (see find_segments). It is
+    rewritten whenever a segment is started and on every flush.
+
+    Writing carries on from an existing ring in the directory, e.g. one
+    left by an earlier capture.
+
+    Has the same interface as Pcap_Writer, for the Sniffer.
+
+    Args:
+        directory (str): where the segments and index are kept; created if
+            need be
+        link_type (int): LINKTYPE_* value of the frames
+        snaplen (int): most bytes captured of any frame
+        num_segments (int): most segments kept
+        max_bytes (int): size at which a segment is finished
+        max_seconds (float): time after its first packet at which a segment
+            is finished
+        buffer_size (int): write buffer size, see Pcap_Writer
+
+    Attributes:
+        num_written (int): number of records written
+    """
+
+    INDEX_FILENAME = 'index.json'
+
+
+    def __init__(self, directory, link_type, snaplen=65535, num_segments=10,
+                 max_bytes=64 * 1024 * 1024, max_seconds=300,
+                 buffer_size=4 * 1024 * 1024):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._directory = directory
+        self._link_type = link_type
+        self._snaplen = snaplen
+        self._num_segments = num_segments
+        self._max_bytes = max_bytes
+        self._max_seconds = max_seconds
+        self._buffer_size = buffer_size
+        self._segments = self.read_index(directory)
+        self._writer = None
+        self._segment = None
+        # the current segment's figures, copied to its index entry on flush
+        self._seg_bytes = 0
+        self._seg_packets = 0
+        self._seg_ts_first = None
+        self._seg_ts_last = None
+        self.num_written = 0
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+    def get_directory(self):
+        return self._directory
+
+
+    def write(self, ts_sec, ts_usec, frame, wirelen=None):
+        """Adds a record to the current segment, first starting a new one if
+        it is full or old enough. See Pcap_Writer.write."""
+        ts = ts_sec + ts_usec / 1e6
+        if (self._writer is None or self._seg_bytes >= self._max_bytes or
+                ts - self._seg_ts_first >= self._max_seconds):
+            self._start_segment(ts)
+        self._writer.write(ts_sec, ts_usec, frame, wirelen)
+        self._seg_bytes += Pcap_Writer.RECORD_HEADER_LEN + len(frame)
+        self._seg_packets += 1
+        self._seg_ts_last = ts
+        self.num_written += 1
+
+
+    def flush(self):
+        """Writes out the records buffered so far and updates the index."""
+        if self._writer is not None:
+            self._writer.flush()
+            self._update_segment()
+            self._write_index()
+
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            self._update_segment()
+            self._write_index()
+
+
+    @classmethod
+    def read_index(cls, directory):
+        """Returns:
+            list of dict: the ring's segments, oldest first, each with its
+                filename (within directory), seq (number), ts_first and
+                ts_last (times of its first and last packets), num_packets
+                and num_bytes. Empty if there is no ring in directory.
+        """
+        try:
+            with open(os.path.join(directory, cls.INDEX_FILENAME)) as index_file:
+                return json.load(index_file)['segments']
+        except IOError:
+            return []
+
+
+    @classmethod
+    def find_segments(cls, directory, ts_start=None, ts_end=None):
+        """Finds the segments holding packets captured from ts_start to
+        ts_end, going by the index.
+
+        Args:
+            directory (str): the ring's directory
+            ts_start (float): seconds since the epoch; None for the start of
+                the ring
+            ts_end (float): None for the end of the ring
+
+        Returns:
+            list of str: paths of the segment files, oldest first, e.g. for
+                Parallel_Analysis. A segment may be deleted by the writer
+                any time after it is the oldest.
+        """
+        return [os.path.join(directory, segment['filename'])
+                for segment in cls.read_index(directory)
+                if segment['num_packets'] and
+                (ts_start is None or segment['ts_last'] >= ts_start) and
+                (ts_end is None or segment['ts_first'] <= ts_end)]
+
+
+    def _start_segment(self, ts):
+        if self._writer is not None:
+            self._writer.close()
+            self._update_segment()
+
+        seq = self._segments[-1]['seq'] + 1 if self._segments else 0
+        self._segment = {'filename': 'segment-%06d.pcap' % seq, 'seq': seq,
+                         'ts_first': ts, 'ts_last': ts, 'num_packets': 0,
+                         'num_bytes': 0}
+        self._segments.append(self._segment)
+        while len(self._segments) > self._num_segments:
+            oldest = self._segments.pop(0)
+            try:
+                os.remove(os.path.join(self._directory, oldest['filename']))
+            except OSError:
+                pass
+        # listed before it is written to, so a reader never misses packets
+        self._write_index()
+
+        self._writer = Pcap_Writer(os.path.join(self._directory, self._segment['filename']),
+                                   self._link_type, self._snaplen, self._buffer_size)
+        self._seg_bytes = Pcap_Writer.GLOBAL_HEADER_LEN
+        self._seg_packets = 0
+        self._seg_ts_first = self._seg_ts_last = ts
+
+
+    def _update_segment(self):
+        self._segment['ts_first'] = self._seg_ts_first
+        self._segment['ts_last'] = self._seg_ts_last
+        self._segment['num_packets'] = self._seg_packets
+        self._segment['num_bytes'] = self._seg_bytes
+
+
+    def _write_index(self):
+        """Replaces the index in one go, so readers never see half of it"""
+        filename = os.path.join(self._directory, self.INDEX_FILENAME)
+        with open(filename + '.tmp', 'w') as index_file:
+            json.dump({'segments': self._segments}, index_file)
+        os.rename(filename + '.tmp', filename)
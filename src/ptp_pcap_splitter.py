@@ -0,0 +1,108 @@
+import os
+from ptp_pcap_reader import Pcap_Reader
+from ptp_packet_decoder import Packet_Decoder
+from ptp_analysis_job import Analysis_Progress
+
+
+class Pcap_Splitter(object):
+    """Splits one or more PCAP files into shard files by flow, in a single
+    sequential pass, so that each shard can then be analysed on its own,
+    e.g. in a process of its own (see Parallel_Analysis).
+
+    Both directions of a flow go to the same shard (see flow_shard), and the
+    files are read one after the other, so each shard file is a smaller
+    capture of whole flows with their packets in the order they were
+    captured. Records are copied as they are, headers and all; frames that
+    are neither TCP nor UDP over IP are left out.
+
+    Note:
+        The shard files take up about as much disk space as the files split.
+
+    Args:
+        pcap_filenames (list of str): files to split, in capture order. They
+            must share a link type and byte order, e.g. the files of one
+            capture rotated by tcpdump -C.
+        num_shards (int)
+        directory (str): existing directory to write the shard files in
+    """
+
+    WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+    def __init__(self, pcap_filenames, num_shards, directory):
+        self._pcap_filenames = pcap_filenames
+        self._num_shards = num_shards
+        self._directory = directory
+
+
+    def get_shard_filenames(self):
+        """Returns:
+            list of str: shard file names, in shard order
+        """
+        return [os.path.join(self._directory, 'shard-%d.pcap' % shard)
+                for shard in range(self._num_shards)]
+
+
+    def split(self, progress=None):
+        """Writes the shard files.
+
+        Args:
+            progress (Analysis_Progress): packets_read is updated every few
+                thousand packets
+
+        Returns:
+            list of str: shard file names, in shard order. Shards no flow
+                fell in hold no records.
+
+        Raises:
+            ValueError: If a file's link type or byte order differs from the
+                first's, or a file is not a PCAP file.
+        """
+        if progress is None:
+            progress = Analysis_Progress()
+        progress.stage = 'splitting packets into %d shards' % self._num_shards
+
+        num_shards = self._num_shards
+        rec_hdr_len = Pcap_Reader.RECORD_HEADER_LEN
+        shard_filenames = self.get_shard_filenames()
+        shard_files = [open(filename, 'wb', self.WRITE_BUFFER_SIZE)
+                       for filename in shard_filenames]
+        first_header = None
+        num_packets = 0
+        try:
+            for pcap_filename in self._pcap_filenames:
+                with Pcap_Reader(pcap_filename) as reader:
+                    if reader.get_link_type() is None:
+                        continue
+                    header = reader.get_global_header()
+                    if first_header is None:
+                        first_header = header
+                        for shard_file in shard_files:
+                            shard_file.write(header)
+                    elif not self._is_same_format(header, first_header):
+                        raise ValueError("%s has a different link type or byte order to %s" %
+                                         (pcap_filename, self._pcap_filenames[0]))
+
+                    get_shard = Packet_Decoder(reader.get_link_type(), decode_udp=True).get_shard
+                    get_bytes = reader.get_bytes
+                    for ts, offset, frame in reader:
+                        num_packets += 1
+                        if not num_packets & 0xfff:
+                            progress.packets_read = num_packets
+                        shard = get_shard(frame, num_shards)
+                        if shard is not None:
+                            shard_files[shard].write(
+                                get_bytes(offset - rec_hdr_len, rec_hdr_len + len(frame)))
+        finally:
+            for shard_file in shard_files:
+                shard_file.close()
+
+        progress.packets_read = num_packets
+        return shard_filenames
+
+
+    @staticmethod
+    def _is_same_format(header, other):
+        """Compares the magic number (byte order and timestamp resolution)
+        and link type of two global headers. Snapshot lengths may differ."""
+        return header[:4] == other[:4] and header[20:24] == other[20:24]
@@ -0,0 +1,76 @@
+import struct
+
+
+class Pcap_Writer(object):
+    """Writes libpcap (PCAP) files through a large buffer, the counterpart of
+    Pcap_Reader. Records go to the file in big writes rather than one small
+    write per packet; call flush now and then to make the packets written
+    so far visible to readers of the file, e.g. to analyse a capture still
+    in progress (Pcap_Reader ignores a final record that is only partly
+    written).
+
+    Files are written in the host's byte order with microsecond timestamps,
+    as libpcap writes them.
+
+    Args:
+        pcap_filename (str): name of the PCAP file to create (or truncate)
+        link_type (int): LINKTYPE_* value of the frames
+        snaplen (int): most bytes captured of any frame
+        buffer_size (int): bytes buffered before they are written out
+
+    Attributes:
+        num_written (int): number of records written
+    """
+
+    GLOBAL_HEADER_LEN = 24
+    RECORD_HEADER_LEN = 16
+
+    _MAGIC = 0xa1b2c3d4
+    _global_hdr = struct.Struct('=IHHiIII')
+    _rec_hdr = struct.Struct('=IIII')
+
+
+    def __init__(self, pcap_filename, link_type, snaplen=65535, buffer_size=4 * 1024 * 1024):
+        self._pcap_filename = pcap_filename
+        self._file = open(pcap_filename, 'wb', buffer_size)
+        self._file.write(self._global_hdr.pack(self._MAGIC, 2, 4, 0, 0, snaplen, link_type))
+        self.num_written = 0
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+    def get_pcap_filename(self):
+        return self._pcap_filename
+
+
+    def write(self, ts_sec, ts_usec, frame, wirelen=None):
+        """Adds a record to the buffer.
+
+        Args:
+            ts_sec (int): capture timestamp, whole seconds since the epoch
+            ts_usec (int): microseconds part of the timestamp
+            frame (str): captured frame bytes
+            wirelen (int): length of the frame on the wire, if more than
+                was captured
+        """
+        caplen = len(frame)
+        write = self._file.write
+        write(self._rec_hdr.pack(ts_sec, ts_usec, caplen, wirelen or caplen))
+        write(frame)
+        self.num_written += 1
+
+
+    def flush(self):
+        """Writes out the records buffered so far."""
+        self._file.flush()
+
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
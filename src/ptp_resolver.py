@@ -0,0 +1,160 @@
+import socket
+import threading
+import time
+import Queue
+from collections import OrderedDict
+
+
+class Resolver(object):
+    """Reverse DNS lookups of server IP addresses, done concurrently by a
+    pool of worker threads and cached.
+
+    socket.gethostbyaddr blocks, and can take seconds to time out for
+    addresses with no PTR record, so looking up one IP address after
+    another makes the results page as slow as the sum of all the lookups.
+    Here each unique address is looked up once, in parallel with the
+    others, and callers wait at most a deadline for the answers. Lookups
+    still running at the deadline carry on in the background and their
+    answers go in the cache, so they are there the next time they are asked
+    for.
+
+    The cache is least-recently-used (LRU), with a time-to-live (TTL) on
+    every entry. Failed lookups are cached too, for a shorter time.
+
+    Args:
+        num_threads (int): number of worker threads
+        timeout (float): default deadline, in seconds, callers wait for
+        ttl (float): seconds an answer is cached for
+        negative_ttl (float): seconds a failed lookup is cached for
+        max_entries (int): maximum number of addresses cached
+        lookup (function): takes an IP address, returns (hostname,
+            aliases, addresses) or raises socket.error (e.g. socket.herror),
+            like socket.gethostbyaddr
+    """
+
+    def __init__(self, num_threads=8, timeout=2.0, ttl=3600.0, negative_ttl=300.0,
+                 max_entries=4096, lookup=socket.gethostbyaddr):
+        self._num_threads = num_threads
+        self._timeout = timeout
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+        self._max_entries = max_entries
+        self._lookup = lookup
+        self._cache = OrderedDict()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._resolved = threading.Condition(self._lock)
+        self._requests = Queue.Queue()
+        self._workers = []
+
+
+    def resolve(self, ip_addr, timeout=None):
+        """Returns:
+            str: hostname of ip_addr, or ip_addr itself if it has none or
+                the lookup didn't finish within timeout seconds
+        """
+        return self.resolve_all([ip_addr], timeout)[ip_addr]
+
+
+    def resolve_all(self, ip_addrs, timeout=None):
+        """Looks up all the given addresses concurrently.
+
+        Args:
+            ip_addrs (iterable of str): addresses, in any order, with repeats
+            timeout (float): seconds to wait for the answers at most;
+                defaults to the timeout given to the constructor
+
+        Returns:
+            dict: IP address -> hostname, or the address itself if it has no
+                hostname or the lookup didn't finish in time
+        """
+        if timeout is None:
+            timeout = self._timeout
+        deadline = time.time() + timeout
+        ip_addrs = set(ip_addrs)
+
+        with self._lock:
+            names = self._get_cached(ip_addrs)
+            self._request(ip_addrs.difference(names))
+            while len(names) < len(ip_addrs):
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._resolved.wait(remaining)
+                names.update(self._get_cached(ip_addrs.difference(names)))
+
+        for ip_addr in ip_addrs.difference(names):
+            names[ip_addr] = ip_addr
+        return names
+
+
+    def get_cached(self, ip_addrs):
+        """Answers from the cache only, without waiting. Addresses not yet
+        resolved are looked up in the background.
+
+        Returns:
+            dict: IP address -> hostname (or the address itself), for the
+                addresses that were in the cache
+        """
+        ip_addrs = set(ip_addrs)
+        with self._lock:
+            names = self._get_cached(ip_addrs)
+            self._request(ip_addrs.difference(names))
+        return names
+
+
+    def _get_cached(self, ip_addrs):
+        """Returns cache entries still within their TTL, moving them to the
+        most recently used end. Must be called with the lock held.
+        """
+        now = time.time()
+        names = {}
+        for ip_addr in ip_addrs:
+            entry = self._cache.pop(ip_addr, None)
+            if entry is None:
+                continue
+            name, expiry = entry
+            if expiry > now:
+                self._cache[ip_addr] = entry
+                names[ip_addr] = name
+        return names
+
+
+    def _request(self, ip_addrs):
+        """Queues lookups of addresses not already being looked up. Must be
+        called with the lock held."""
+        for ip_addr in ip_addrs:
+            if ip_addr in self._pending:
+                continue
+            self._pending.add(ip_addr)
+            self._requests.put(ip_addr)
+        if self._pending:
+            self._start_workers()
+
+
+    def _start_workers(self):
+        while len(self._workers) < self._num_threads:
+            worker = threading.Thread(target=self._run_worker)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+
+    def _run_worker(self):
+        while True:
+            ip_addr = self._requests.get()
+            try:
+                name = self._lookup(ip_addr)[0]
+                ttl = self._ttl
+            except Exception:
+                # socket.error for no name, but anything else must not kill
+                # the worker and leave ip_addr pending for ever
+                name = ip_addr
+                ttl = self._negative_ttl
+            with self._lock:
+                self._pending.discard(ip_addr)
+                self._cache.pop(ip_addr, None)
+                self._cache[ip_addr] = (name, time.time() + ttl)
+                while len(self._cache) > self._max_entries:
+                    self._cache.popitem(last=False)
+                self._resolved.notify_all()
@@ -1,14 +1,31 @@
-from scapy.all import rdpcap, PacketList, Ether, IP, TCP, Raw
-import hashlib
 from ptp_network import Network
+from ptp_pcap_reader import Pcap_Reader
+from ptp_packet_decoder import Packet_Decoder, IP_PROTO_UDP
+from ptp_flow_table import Flow_Table
 from ptp_constants import Constants
 from ptp_session_pair import Session_Pair
+from ptp_hostname_index import Hostname_Index
+from ptp_analysis_job import Analysis_Progress
+from ptp_verdict_feed import Verdict_Feed
+import threading
 
 
 class Session_Reassembler(object):
     """TCP-like pre-processing of sniffed packets from PCAP file, to be done
     before Application Layer protocol analysis can take place.
 
+    Alternatively, in live mode (see start_live), packets are taken from a
+    queue filled by the Sniffer while it is capturing, and added to the
+    flows straight away, so the analysis is up to date whenever it is asked
+    for and no PCAP file needs to be read back. Each connection's verdict
+    is also published on a Verdict_Feed as soon as it is reached. The
+    packets of connections which are over are let go of as the capture
+    goes on, keeping only their results, so memory doesn't grow with the
+    length of the capture.
+
+    Along the way, server hostnames are collected from DNS responses and
+    from the server names (SNI) in TLS ClientHellos, see Hostname_Index.
+
     Args:
         pcap_filename (str): name of existing PCAP file to pre-process.
     """
@@ -16,209 +33,275 @@ class Session_Reassembler(object):
 
     def __init__(self, pcap_filename=None):
         self._pcap_filename = pcap_filename
-        self._sessions_dict = None 
+        self._pcap_reader = None
+        self._flows = None 
+        self._tls_trackers = None
         self._session_pairs = None
         self._const = Constants()
+        self._live_flow_table = None
+        # quad tuple -> Session_Pair of the connections over in live mode,
+        # whose packets have been let go of
+        self._finished_pairs = {}
+        self._live_thread = None
+        self._live_lock = threading.Lock()
+        self._num_live_packets = 0
+        self._verdict_feed = None
+        self._hostname_index = Hostname_Index()
+
+
+    def get_session_pairs(self, progress=None):
+        """High level method calling all other methods required to pre-process packets.
 
+        Args:
+            progress (Analysis_Progress): packets_read is updated on it as
+                the PCAP file is read
 
-    def get_session_pairs(self):
-        """High level method calling all other methods required to pre-process packets.
-        
         Returns: 
             dict of Session_Pair objects: The key is the 'quad' tuple (cli_ip, cli_pt,
             svr_ip, svr_pt).
         """ 
 
-        session_pairs = {}
-        sessions = self._get_sessions_dict()
-        keys = sessions.keys()
-        values = sessions.values()
-        cli_ip = Network().get_cli_ip()
-
-        for key in keys:
-            # e.g. key = 'TCP 151.101.16.175:443 > 192.168.1.12:44071'
-            #  opp_key = 'TCP 192.168.1.12:44071 > 151.101.16.175:443'
-            prot, src, arrow, dst = key.split()
-            src_ip, src_pt = src.split(':') 
-            dst_ip, dst_pt = dst.split(':') 
-
-            if dst_ip == self._const.KILL_PKT_IP: 
-                continue
+        if progress is None:
+            progress = Analysis_Progress()
 
-            opp_key = "%s %s:%s %s %s:%s" % \
-                (prot, dst_ip, str(dst_pt), arrow, src_ip, str(src_pt))  
-            session = sessions[key]
+        if self._live_flow_table is not None:
+            progress.packets_read = self._num_live_packets
+            return self._get_live_session_pairs()
 
-            if src_ip == cli_ip:
-                quad = (src_ip, src_pt, dst_ip, dst_pt)
-                if quad in session_pairs.keys(): 
-                    # we must've hit opp_key earlier 
-                    continue
-                if opp_key in keys:
-                    opp_session = sessions[opp_key]
-                else:
-                    opp_session = None
-                session_pair = Session_Pair(session, opp_session)
-                session_pairs[quad] = session_pair 
-            else:
-                quad = (dst_ip, dst_pt, src_ip, src_pt)
-                if quad in session_pairs.keys(): 
-                    # we must've hit opp_key earlier 
-                    continue
-                if opp_key in keys:
-                    opp_session = sessions[opp_key]
-                else:
-                    opp_session = None
-                session_pair = Session_Pair(opp_session, session)
-                session_pairs[quad] = session_pair 
+        session_pairs = {}
+        flows = self._get_flows(progress)
+        trackers = self._tls_trackers
+
+        for quad, (cli_to_svr, svr_to_cli) in flows.iteritems():
+            session_pairs[quad] = Session_Pair(cli_to_svr, svr_to_cli, trackers[quad])
+        self._add_server_names(trackers)
 
         self._session_pairs = session_pairs
         return self._session_pairs
 
 
-    def _get_sessions_dict(self):
-        """Extracts packets from PCAP file, splits into sessions, calls
-        deduplication and sorting methods.
-
-        Returns: 
-            dict of PacketList objects
+    def get_hostname_index(self):
+        """Returns:
+            Hostname_Index: server hostnames seen in the traffic analysed by
+                the last call to get_session_pairs (or so far, in live mode)
         """
+        return self._hostname_index
 
-        pkts = rdpcap(self._pcap_filename) 
-        sessions = pkts.sessions()
 
-        for key,session in sessions.iteritems():
-            deduped_session = self._remove_duplicate_packets(session)
-            sessions[key] = deduped_session
-            self._sort_session_by_seq_no(session)
+    def get_verdict_feed(self):
+        """Returns:
+            Verdict_Feed: verdicts of the current (or last) live capture, or
+                None if not in live mode
+        """
+        return self._verdict_feed
 
-        self._sessions_dict = sessions
-        return self._sessions_dict 
 
+    def start_live(self, packet_queue):
+        """Starts live mode: a thread takes Decoded_Packets from packet_queue
+        and adds them to the flows, until it takes None (see Sniffer).
+        Then the flows still undecided get their final verdicts and the
+        verdict feed is closed.
 
-    def _sort_session_by_seq_no(self, session):
-        """Sorts packets of session (PacketList) in-place by TCP sequence number,
-        as packets are sometimes sniffed out of sequence number order. 
-        We need them in that order to see e.g. TCP and SSL handshake completions. 
-        Uses Python sort method, with TCP sequence number (from Scapy.Packet) as
-        the key. Credit for sorting technique: Baggett M., IP Fragment Reassembly with
-        Scapy.
-        
         Args:
-            session: Scapy.PacketList
+            packet_queue (Queue.Queue): queue the Sniffer puts packets on
         """
-        def get_seq(pkt):
-            return pkt[TCP].seq
+        self._verdict_feed = Verdict_Feed()
+        self._live_flow_table = Flow_Table(Network().get_cli_ip(),
+                                           on_verdict=self._publish_verdict)
+        self._hostname_index = Hostname_Index()
+        self._finished_pairs = {}
+        self._num_live_packets = 0
+        self._live_thread = threading.Thread(target=self._run_live_thread,
+                                             args=(packet_queue,))
+        self._live_thread.daemon = True
+        self._live_thread.start()
+
+
+    def stop_live(self, timeout=None):
+        """Waits for the live thread to finish the packets already queued.
+        The Sniffer ends the queue with None when it stops.
 
-        session.sort(key=get_seq)
+        Args:
+            timeout (float): seconds to wait at most, or None to wait until
+                it has finished. If it hasn't, the results are those so far,
+                with connections still undecided unassessed.
+        """
+        if self._live_thread is not None:
+            self._live_thread.join(timeout)
 
 
-    def _get_opposing_session_key(self, key):
-        """To identify a session in a dict generated by Scapy.sessions(),
-        Scapy uses a key which is a string of the form
-        'protocol src_ip:src_pt > dst_ip:dst_pt' where the '>' indicates direction. 
-        Given one such key, this method returns the key for the opposing session.
+    def is_live(self):
+        """Returns:
+            bool: True while the live thread is taking packets off the queue
+        """
+        return self._live_thread is not None and self._live_thread.isAlive()
+
+
+    def _run_live_thread(self, packet_queue):
+        flow_table = self._live_flow_table
+        hostname_index = self._hostname_index
+        lock = self._live_lock
+        sweep_interval = self._const.LIVE_SWEEP_INTERVAL
+        next_sweep = 0.0
+        while True:
+            pkt = packet_queue.get()
+            if pkt is None:
+                break
+            if pkt.proto == IP_PROTO_UDP:
+                hostname_index.add_packet(pkt)
+            else:
+                # Payloads aren't kept in live mode: the packet's own frame is
+                # all the TLS_Tracker needs, and Packet_Table just gets offset 0.
+                with lock:
+                    flow_table.add_packet(pkt, 0)
+                    if pkt.ts >= next_sweep:
+                        self._release_finished_flows(pkt.ts)
+                        next_sweep = pkt.ts + sweep_interval
+            # only counted once added, so the results of the packets counted
+            # (see get_session_pairs) are all there
+            self._num_live_packets += 1
+
+        with lock:
+            flow_table.finish()
+        self._verdict_feed.close()
+
+
+    def _release_finished_flows(self, now):
+        """Takes the connections which are over out of the live flow table,
+        keeping only their results. Must be called with the live lock held.
 
         Args:
-            key: session identifier from a dict of PacketList objects
+            now (float): timestamp of the latest packet
+        """
+        const = self._const
+        finished = self._live_flow_table.pop_finished(now, const.LIVE_FLOW_LINGER,
+                                                      const.LIVE_FLOW_IDLE_TIMEOUT)
+        for quad, ((cli_to_svr, svr_to_cli), tracker) in finished.iteritems():
+            if tracker.client.server_name:
+                self._hostname_index.add_sni(quad[2], tracker.client.server_name)
+            # a stray late packet makes a flow of its own: the first is kept
+            if quad not in self._finished_pairs:
+                pair = Session_Pair(cli_to_svr, svr_to_cli, tracker)
+                pair.release_packets()
+                self._finished_pairs[quad] = pair
+
+
+    def _publish_verdict(self, quad, tracker):
+        cli_ip, cli_pt, svr_ip, svr_pt = quad
+        self._verdict_feed.publish({'cli_ip': cli_ip, 'cli_pt': cli_pt,
+                                    'svr_ip': svr_ip, 'svr_pt': svr_pt,
+                                    'server_name': tracker.client.server_name,
+                                    'is_encrypted': tracker.get_verdict()})
+
+
+    def _get_live_session_pairs(self):
+        """Builds Session_Pairs from the flows seen so far in live mode and
+        analyses them while the live thread is held off, so each pair's
+        Stream_Status is a consistent snapshot. Connections whose verdict
+        hasn't been reached yet are marked UNASSESSED until the capture ends.
+        Those already over (see _release_finished_flows) are as they were
+        when their packets were let go of.
+        """
+        in_progress = self.is_live()
+        with self._live_lock:
+            session_pairs = dict(self._finished_pairs)
+            flows = self._live_flow_table.get_flows()
+            trackers = self._live_flow_table.get_tls_trackers()
+            for quad, (cli_to_svr, svr_to_cli) in flows.iteritems():
+                if quad in session_pairs:
+                    continue
+                pair = Session_Pair(cli_to_svr, svr_to_cli, trackers[quad],
+                                    in_progress=in_progress)
+                pair.get_stream_status()
+                session_pairs[quad] = pair
+            self._add_server_names(trackers)
+
+        self._session_pairs = session_pairs
+        return self._session_pairs
+
 
-        Returns
-            str: opposing key string 
+    def _get_flows(self, progress):
+        """Extracts packets from PCAP file and splits them into flows (session
+        pairs) and directions with a Flow_Table, which also drops duplicate
+        packets as they arrive. Packets are read lazily (see _read_packets)
+        and added straight to their flow, so the whole capture is never held
+        in memory as one list. Packets stay in capture order; putting
+        payloads in stream order is left to Stream_Reassembler. Each flow's
+        TLS_Tracker is fed as its packets are added, and its verdict is
+        usually reached long before the end of the file.
 
-        Examples:
-            >>> _get_opposing_session_key("TCP 10.1.2.3:12345 > 192.168.1.1:9999")
-            "TCP 192.168.1.1:9999 > 10.1.2.3:12345" 
+        Args:
+            progress (Analysis_Progress): packets_read is updated every few
+                thousand packets
+
+        Returns: 
+            dict: quad tuple -> (cli_to_svr, svr_to_cli) Packet_Tables, see
+                Flow_Table.get_flows
         """
-        prot, src, arrow, dst = key.split()
-        src_ip, src_pt = src.split(':') 
-        dst_ip, dst_pt = dst.split(':') 
-        opp_key = "%s %s:%s %s %s:%s" % \
-            (prot, dst_ip, str(dst_pt), arrow, src_ip, str(src_pt))  
-        return opp_key
-
-
-    def _remove_duplicate_packets(self, session):
-        """Carries out partial de-duplication of Scapy.PacketList. 
-        Packets are considered duplicate if they fall under one of these cases:
-        both directions:
-        * duplicate ack: no payload, flags=A, same seq and ack numbers.
-        * duplicate data: flags=PA or A, same seq/ack/TCP chksum, same non-zero payload
-        cli_to_svr:
-        * duplicate syn: flags=S, same seq numbers 
-        svr_to_cli:
-        * duplicate synack: flags=SA, same seq/ack
-        
-        We hash the packets (credit: https://stackoverflow.com/a/3350656) depending on
-        context. We'll need to make separate hash tables for each case to check.
-        To make it easier to read, make a few reusable, function-like methods 
-        first and use them to build up to the bigger algorithm.
+
+        # Payloads are fetched from the memory-mapped file on demand (see
+        # Packet_Table), so the reader is kept open for the lifetime of
+        # this object.
+        reader = self._pcap_reader = Pcap_Reader(self._pcap_filename)
+        flow_table = Flow_Table(Network().get_cli_ip(), reader)
+        hostname_index = self._hostname_index = Hostname_Index()
+        kill_pkt_ip = self._const.KILL_PKT_IP
+
+        progress.stage = 'reading packets'
+        num_packets = 0
+        for offset, pkt in self._read_packets(reader):
+            num_packets += 1
+            if not num_packets & 0xfff:
+                progress.packets_read = num_packets
+            if pkt.proto == IP_PROTO_UDP:
+                hostname_index.add_packet(pkt)
+                continue
+            if pkt.dst_ip == kill_pkt_ip:
+                # stop packet of a capture made by an earlier Sniffer
+                continue
+            flow_table.add_packet(pkt, offset + pkt.payload_offset)
+        progress.packets_read = num_packets
+
+        self._flows = flow_table.get_flows()
+        self._tls_trackers = flow_table.get_tls_trackers()
+        return self._flows 
+
+
+    def _add_server_names(self, trackers):
+        """Adds the server names (SNI) clients gave in their ClientHellos to
+        the hostname index.
 
         Args:
-            session (Scapy.PacketList)
-        
-        Returns:
-            Scapy.PacketList
+            trackers (dict): quad tuple -> TLS_Tracker
         """
+        for quad, tracker in trackers.iteritems():
+            if tracker.client.server_name:
+                self._hostname_index.add_sni(quad[2], tracker.client.server_name)
 
-        def payload_len(pkt): return len(pkt[TCP].payload)
-        def flags(pkt): return str(pkt[TCP].flags)
-        def seq(pkt): return pkt[TCP].seq
-        def ack(pkt): return pkt[TCP].ack
-        def chksum(pkt): return pkt[TCP].chksum
-        def md5(*args):
-            str_args = map(str, args)
-            return hashlib.md5("".join(str_args)).hexdigest()
-        def is_ack(pkt):
-            return flags(pkt) == 'A' and payload_len(pkt) == 0
-        def hash_ack(pkt): return md5(seq(pkt)), ack(pkt) 
-        def is_data(pkt):
-            return payload_len(pkt) != 0 and (flags(pkt) == 'A' or flags(pkt) == 'PA')
-        def hash_data(pkt): return md5(seq(pkt), ack(pkt), chksum(pkt), flags(pkt)) 
-        def is_syn(pkt):
-            return flags(pkt) == 'S' and ack(pkt) == 0
-        def hash_syn(pkt): return md5(seq(pkt)) 
-        def is_synack(pkt): return flags(pkt) == 'SA'
-        def hash_synack(pkt): return md5(seq(pkt), ack(pkt)) 
-
-        ack_pkts = {}
-        data_pkts = {}
-        syn_pkts = {}
-        synack_pkts = {}
-
-        deduped = [] 
-
-        # if it's one of our cases and we haven't seen it then add to appropriate hash table and deduped.
-        # if not one of our cases, just add it to deduped.
-        # Can we safely assume no packet can fall under two cases?
-        for pkt in session:
-            if is_ack(pkt):
-                if (hash_ack(pkt) not in ack_pkts.keys()):
-                    deduped.append(pkt)
-                    ack_pkts[hash_ack(pkt)] = pkt
-
-            elif is_data(pkt):
-                if (hash_data(pkt) not in data_pkts.keys()):
-                    deduped.append(pkt)
-                    data_pkts[hash_data(pkt)] = pkt
-
-            elif is_syn(pkt):
-                if (hash_syn(pkt) not in syn_pkts.keys()):
-                    deduped.append(pkt)
-                    syn_pkts[hash_syn(pkt)] = pkt
-
-            elif is_synack(pkt):
-                if (hash_synack(pkt) not in synack_pkts.keys()):
-                    deduped.append(pkt)
-                    synack_pkts[hash_synack(pkt)] = pkt
 
-            else:
-                deduped.append(pkt)
+    def _read_packets(self, reader):
+        """Generator yielding the TCP and UDP packets of the PCAP file one at a time.
+        Frames are memory-mapped by Pcap_Reader rather than loaded with
+        rdpcap, and only their headers are decoded, by Packet_Decoder; no
+        Scapy objects are built.
+
+        Args:
+            reader (Pcap_Reader)
+
+        Yields:
+            (int, Decoded_Packet): file offset of the frame, decoded packet
+        """
+        if reader.get_link_type() is None:
+            return
+        decode = Packet_Decoder(reader.get_link_type(), decode_udp=True).decode
+        for ts, offset, frame in reader:
+            pkt = decode(ts, frame)
+            if pkt is not None:
+                yield offset, pkt
+
 
-        return PacketList(deduped)
-        
-                
-    def _print_sessions_dict_summary(self):
-        for k,v in self._get_sessions_dict().iteritems():
+    def _print_flows_summary(self):
+        for k,v in self._get_flows(Analysis_Progress()).iteritems():
             print k, "\n", v,"\n"
 
 
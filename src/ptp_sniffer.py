@@ -1,14 +1,14 @@
-import logging
-logging.getLogger("scapy.runtime").setLevel(logging.ERROR)
-from scapy.all import Ether, IP, TCP, sendp, rdpcap, Raw, PacketList, PPP
 import threading
 import os
 import time
-import pcapy
-from socket import ntohs
-from struct import unpack
+import Queue
+import traceback
 from ptp_network import Network 
 from ptp_logger import Logger
+from ptp_packet_decoder import Packet_Decoder
+from ptp_pcap_writer import Pcap_Writer
+from ptp_pcap_ring import Pcap_Ring
+from ptp_constants import Constants
 
 class Sniffer(object):
     """Captures packet data on a specified network interface and writes to PCAP file.
@@ -18,19 +18,42 @@ class Sniffer(object):
         at a time and extracting, and extracting the content of the packet using struct.
         See https://www.binarytides.com/code-a-packet-sniffer-in-python-with-pcapy-extension/
 
-    Args:
-        pcap_filename (str): name of PCAP file to write the packets to. 
+    Packets are captured with pcapy, or from the kernel's packet ring (see
+    Tpacket_V3_Capture) if Constants' CAPTURE_BACKEND is 'tpacket'.
+
+    Packets can also be decoded and put on a queue as they are captured, for
+    live analysis (see Session_Reassembler.start_live), in which case writing
+    the PCAP file is optional. The queue is bounded: if analysis falls
+    behind, packets are dropped from it (and counted) rather than held up
+    in the capture loop, where they would be lost by libpcap anyway.
 
+    Args:
+        pcap_filename (str): name of PCAP file to write the packets to, or
+            None to not write one.
+        packet_queue (Queue.Queue): if given, each TCP (or DNS) packet
+            captured is put on it as a Decoded_Packet, and None is put on it
+            when the sniffer stops.
+        ring_directory (str): if given, packets are written to a ring of
+            PCAP files there (see Pcap_Ring) instead of to pcap_filename
+
+    Attributes:
+        num_dropped (int): packets not put on packet_queue because it was full
+        error (str): why the last capture failed, e.g. the interface could
+            not be opened, or None
     """
 
 
-    def __init__(self, pcap_filename='sniffed.pcap'):
+    def __init__(self, pcap_filename='sniffed.pcap', packet_queue=None, ring_directory=None):
         self._sniffer_thread = None
+        self._ring_directory = ring_directory
+        self._packet_queue = packet_queue
+        self.num_dropped = 0
+        self.error = None
         self._logger = Logger(logfile="ptp_sniffer.log")
         self._pcap_filename = pcap_filename 
         self._net = Network()
         self._host_ip = self._net.get_host_ip()
-        self._stop_eth_addr = self._net.get_stop_eth() 
+        self._stop_requested = threading.Event()
         self._sniff_iface_name = self._net.get_sniff_iface_name()
         self._cli_ip = self._net.get_cli_ip()
 
@@ -39,6 +62,8 @@ class Sniffer(object):
 
     def start(self):
         """Runs sniffer thread"""
+        self._stop_requested.clear()
+        self.error = None
         self._sniffer_thread = threading.Thread(target=self._run_sniffer_thread)
         self._sniffer_thread.daemon = True
         self.log("Sniffer initialised")
@@ -46,92 +71,128 @@ class Sniffer(object):
 
 
     def _run_sniffer_thread(self):
-        """Sniffer thread
+        """Sniffer thread. However the capture ends, even if it can't be
+        started, the packet queue is ended with None, so that its consumer
+        doesn't wait for ever, and any error is kept in error.
+        """
+        try:
+            self._capture()
+        except Exception as e:
+            self.error = "%s: %s" % (type(e).__name__, e)
+            traceback.print_exc()
+        finally:
+            if self._packet_queue is not None:
+                # tells the consumer there are no more packets
+                self._packet_queue.put(None)
+
+    def _capture(self):
+        """Packets are taken from libpcap a buffer-full at a
+        time with dispatch rather than one at a time with next, and written
+        through a buffered Pcap_Writer that is flushed every
+        SNIFF_FLUSH_INTERVAL seconds, so the file can be analysed while the
+        capture goes on. The read timeout lets dispatch return even when no
+        packets come, so a stop request (see stop) is noticed within one
+        timeout; the packets libpcap has buffered by then are still taken.
         Credit: Binary Tides
         """
-        #print '_run_sniffer_thread'
+        const = Constants()
         nic_name = self._sniff_iface_name
-        cli_ip = self._cli_ip
         max_packet_size = 65536
         promiscuous_mode = 1
 
-        # may need to set timeout_ms to something non-zero, 
-        # otherwise the underlying (libpcap) packet capture loop iteration 
-        # can't complete until packets are actually captured
-        timeout_ms = 0 
-        cap = pcapy.open_live(nic_name, max_packet_size, promiscuous_mode, timeout_ms)
-	bpf_filter = "tcp"
-	cap.setfilter(bpf_filter)
-	dumper = cap.dump_open(self._pcap_filename)
-
-	while(True):
-            #print 'in while'
-	    packet_hdr, packet_body = cap.next()
-            #print 'yoda'
-	    if self._is_stop_packet(packet_body, self._stop_eth_addr):
-		break
-	    dumper.dump(packet_hdr,packet_body)
-
-	del dumper
-
-    def _eth_addr(self, a):
-        """Extract packet Ethernet address from packet bytes
-        Credit: Binary Tides
-        """
-	b = "%.2x:%.2x:%.2x:%.2x:%.2x:%.2x" % (ord(a[0]) , ord(a[1]) , ord(a[2]), ord(a[3]), ord(a[4]) , ord(a[5]))
-	return b
-
-    def _is_stop_packet(self, packet_body, stop_eth_addr):
-        #print '_is_stop_packet:', packet_body
-        """Check if packet is stop packet
-        Credit: Binary Tides
+        cap = self._open_capture(const, nic_name, max_packet_size, promiscuous_mode)
+        writer = None
+        try:
+            # DNS responses are wanted for naming servers (see Hostname_Index)
+            bpf_filter = "tcp or udp port 53"
+            try:
+                cap.setfilter(bpf_filter)
+            except ValueError:
+                # no libpcap to compile it with for the tpacket backend: other
+                # packets are written too, but the decoder ignores them
+                self.log("Capturing without filter %r" % bpf_filter)
+            if self._ring_directory is not None:
+                writer = Pcap_Ring(self._ring_directory, cap.datalink(), max_packet_size,
+                                   const.CAPTURE_RING_SEGMENTS, const.CAPTURE_RING_SEGMENT_BYTES,
+                                   const.CAPTURE_RING_SEGMENT_SECONDS,
+                                   const.SNIFF_WRITE_BUFFER_SIZE)
+            elif self._pcap_filename is not None:
+                writer = Pcap_Writer(self._pcap_filename, cap.datalink(), max_packet_size,
+                                     const.SNIFF_WRITE_BUFFER_SIZE)
+
+            packet_queue = self._packet_queue
+            decode = Packet_Decoder(cap.datalink(), decode_udp=True).decode
+            write = writer.write if writer is not None else None
+            enqueue = self._enqueue
+            stop_requested = self._stop_requested
+
+            def on_packet(packet_hdr, packet_body):
+                if write is not None:
+                    sec, usec = packet_hdr.getts()
+                    write(sec, usec, packet_body, packet_hdr.getlen())
+                if packet_queue is not None:
+                    enqueue(packet_queue, decode, packet_hdr, packet_body)
+
+            flush_interval = const.SNIFF_FLUSH_INTERVAL
+            next_flush = time.time() + flush_interval
+            while not stop_requested.is_set():
+                cap.dispatch(const.SNIFF_BATCH_SIZE, on_packet)
+                if writer is not None and time.time() >= next_flush:
+                    writer.flush()
+                    next_flush = time.time() + flush_interval
+            # what libpcap had already captured when the stop came
+            cap.dispatch(-1, on_packet)
+        finally:
+            if hasattr(cap, 'close'):
+                cap.close()
+            if writer is not None:
+                writer.close()
+
+    def _open_capture(self, const, nic_name, max_packet_size, promiscuous_mode):
+        """Returns:
+            pcapy.Reader or Tpacket_V3_Capture: capturing on nic_name,
+                depending on CAPTURE_BACKEND
         """
-        eth_header_start_byte = 0
-        eth_header_length = 14
-
+        if const.CAPTURE_BACKEND == 'tpacket':
+            from ptp_tpacket_capture import Tpacket_V3_Capture
+            return Tpacket_V3_Capture(nic_name, max_packet_size, promiscuous_mode,
+                                      const.SNIFF_TIMEOUT_MS, const.TPACKET_BLOCK_SIZE,
+                                      const.TPACKET_NUM_BLOCKS)
+        import pcapy
+        return pcapy.open_live(nic_name, max_packet_size, promiscuous_mode,
+                               const.SNIFF_TIMEOUT_MS)
+
+    def _enqueue(self, packet_queue, decode, packet_hdr, packet_body):
+        """Decodes a captured packet and puts it on the queue, unless it
+        isn't TCP or UDP or the queue is full.
         """
-        we need to move forward 2 bytes if using PPP. See
-        https://www.wireshark.org/lists/ethereal-users/200412/msg00314.html 
+        sec, usec = packet_hdr.getts()
+        pkt = decode(sec + usec / 1e6, packet_body)
+        if pkt is None:
+            return
+        if not isinstance(packet_body, str):
+            # a view into the tpacket ring, which the kernel reuses
+            pkt.frame = str(packet_body)
+        try:
+            packet_queue.put_nowait(pkt)
+        except Queue.Full:
+            self.num_dropped += 1
+
+    def stop(self, timeout=None):
+        """Stops the sniffer, which takes up to about one read timeout
+        (SNIFF_TIMEOUT_MS), and waits for it to finish writing the PCAP file.
+
+        Args:
+            timeout (float): seconds to wait at most, or None to wait until
+                it has finished
         """
-        if self._sniff_iface_name == 'ppp0':
-            #print "using ppp0"
-	    eth_header_start_byte = 2 
-
-        eth_header_end_byte = eth_header_start_byte + eth_header_length
-	eth_header = packet_body[eth_header_start_byte:eth_header_end_byte]
-	eth = unpack('!6s6sH' , eth_header)
-	eth_protocol = ntohs(eth[2])
-	eth_header_bytes = packet_body[0:6]
-	eth_addr_str = self._eth_addr(eth_header_bytes)
-        #print "eth_addr_str:", eth_addr_str
-	if eth_addr_str == stop_eth_addr:
-	    #print 'Stop packet received'
-	    return True
-        else:
-	    #print 'Stop not packet received'
-	    return False
-
-
-
-    def stop(self):
-        """Stop sniffer."""
-        self._send_kill_packet()
-	if self.is_running():
-            time.sleep(1)
-            self.stop()
+        self._stop_requested.set()
+        if self._sniffer_thread is not None:
+            self._sniffer_thread.join(timeout)
 
     def pcap_filename(self):
         return self._pcap_filename 
 
-    def _send_kill_packet(self):
-        net = self._net 
-        kill_packet = Ether(dst=net.get_stop_eth())/IP(dst=net.get_stop_ip())/TCP()
-        #sendp(kill_packet, iface=net.get_nic_name())
-        nic_name = net.get_sniff_iface_name()
-	#print 'stop eth:', net.get_stop_eth(), 'ip:', net.get_stop_ip(), 'nic:', net.get_sniff_iface_name() 
-	#kill_packet.show()
-        sendp(kill_packet, iface=nic_name)
-
 
     def is_running(self):
         if self._sniffer_thread is None:
@@ -139,7 +200,14 @@ class Sniffer(object):
         return self._sniffer_thread.isAlive()
         
 
+    def get_ring_directory(self):
+        return self._ring_directory
+
     def pcap_file_exists(self):
+        if self._ring_directory is not None:
+            return len(Pcap_Ring.find_segments(self._ring_directory)) > 0
+        if self._pcap_filename is None:
+            return False
         return os.path.isfile(self._pcap_filename) 
 
     def log(self, msg):
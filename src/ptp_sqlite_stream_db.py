@@ -0,0 +1,99 @@
+import sqlite3
+from ptp_constants import Constants
+from ptp_stream_db import Stream_DB
+
+
+class SQLite_Stream_DB(Stream_DB):
+    """Stream_DB stored in an embedded SQLite database file, for running
+    PTP without a database server.
+
+    The database is used in write-ahead log (WAL) mode, so the Flask threads
+    reading results aren't blocked by the analyser writing them. sqlite3
+    keeps a cache of prepared statements per connection, and executemany
+    runs one prepared statement for a whole batch of rows. IP addresses are
+    stored as text.
+
+    Args:
+        pool (DB_Connection_Pool): pool to use instead of the shared one
+        filename (str): database file to use instead of
+            Constants().SQLITE_DB_FILENAME; gets its own pool
+    """
+
+    _param = '?'
+    _db_error = sqlite3.OperationalError
+
+    # Seconds a write waits for another connection's write to finish
+    _BUSY_TIMEOUT = 10.0
+
+    def __init__(self, pool=None, filename=None):
+        if pool is None and filename is not None:
+            pool = self._make_pool(lambda: self._connect(filename))
+        super(SQLite_Stream_DB, self).__init__(pool)
+
+
+    def compact(self):
+        with self._pool.connection() as conn:
+            conn.execute("VACUUM")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+    def _sql_create_table_captures(self):
+        return """create table captures (id integer primary key autoincrement,
+            ts_created timestamp,
+            pcap_filename text,
+            num_streams integer not null default 0,
+            version integer not null default 0,
+            is_complete boolean not null default 0 )"""
+
+
+    def _sql_create_table_streams(self):
+        return ["""create table streams (id integer primary key autoincrement,
+            capture_id integer not null references captures (id) on delete cascade,
+            cli_ip text,
+            cli_pt integer,
+            svr_ip text,
+            svr_pt integer,
+            bytes_to_cli integer,
+            bytes_to_svr integer,
+            ts_first_pkt timestamp,
+            ts_last_pkt timestamp,
+            ssl_cli_hello boolean,
+            ssl_cli_ccs boolean,
+            ssl_svr_hello boolean,
+            ssl_version text,
+            ssl_cipher text,
+            ssl_svr_ccs boolean,
+            is_encrypted text )""",
+            "create index streams_capture_svr_ip on streams (capture_id, svr_ip)",
+            "create index streams_capture_is_encrypted on streams (capture_id, is_encrypted)",
+            "create index streams_capture_bytes_to_cli on streams (capture_id, bytes_to_cli)"]
+
+
+    def _sql_migrate_table_streams(self, capture_id):
+        # a column can't be given a foreign key by alter table
+        return (["alter table streams add column capture_id integer not null default %d" %
+                 capture_id] + self._sql_create_table_streams()[1:])
+
+
+    @staticmethod
+    def _connect(filename=None):
+        # A pooled connection is only used by one thread at a time, but not
+        # always the one which opened it.
+        # timestamp columns are returned as datetimes, as MySQLdb does.
+        conn = sqlite3.connect(filename or Constants().SQLITE_DB_FILENAME,
+                               timeout=SQLite_Stream_DB._BUSY_TIMEOUT,
+                               detect_types=sqlite3.PARSE_DECLTYPES,
+                               check_same_thread=False)
+        # str rather than unicode, as MySQLdb returns
+        conn.text_factory = str
+        conn.execute("PRAGMA journal_mode=WAL")
+        # Safe with WAL: a power cut may lose the last commits, but can't
+        # corrupt the database
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+
+    @staticmethod
+    def _check_connection(conn):
+        conn.execute("SELECT 1")
@@ -31,6 +31,18 @@ function exit_if_down_tap_interface_exists()
 
 exit_if_down_tap_interface_exists
 get_new_cipher_list
-python ptp_init.py reinit
+# keeps the stored captures; 'reinit' would drop them
+python ptp_init.py init
+# With PTP_CAPTURE_RING set to a directory, captures go to a ring of PCAP
+# files there, whose size is bounded and which is kept between runs so
+# recent periods can be analysed again (see ptp_analyse.py). Otherwise
+# they go to sniffed.pcap, which is started afresh. PTP_CAPTURE_BACKEND=tpacket
+# captures from the kernel's packet ring rather than with pcapy.
 sudo rm -f sniffed.pcap
-sudo PATH=$PATH python ptp_controller.py
+# PTP_* settings are passed through sudo only when set, so that unset ones
+# keep their defaults (see ptp_constants.py) rather than becoming ''
+SUDO_ENV=("PATH=$PATH")
+[ -n "$PTP_CAPTURE_RING" ] && SUDO_ENV+=("PTP_CAPTURE_RING=$PTP_CAPTURE_RING")
+[ -n "$PTP_DB_BACKEND" ] && SUDO_ENV+=("PTP_DB_BACKEND=$PTP_DB_BACKEND")
+[ -n "$PTP_CAPTURE_BACKEND" ] && SUDO_ENV+=("PTP_CAPTURE_BACKEND=$PTP_CAPTURE_BACKEND")
+sudo "${SUDO_ENV[@]}" python ptp_controller.py
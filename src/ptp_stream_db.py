@@ -1,63 +1,309 @@
 from __future__ import print_function
 from datetime import datetime
 import time
-import MySQLdb
+import threading
 from ptp_connection_status import Stream_Status, TCP_Status, SSL_Status
+from ptp_constants import Constants
+from ptp_db_pool import DB_Connection_Pool
 import sys
 from ptp_logger import Logger
 
 
+def get_stream_db(backend=None):
+    """Returns the Stream_DB for a storage backend.
+
+    Each backend's module is only imported here, so only the chosen one's
+    database driver needs to be installed.
+
+    Args:
+        backend (str): 'mysql' or 'sqlite'; defaults to
+            Constants().DB_BACKEND
+
+    Returns:
+        Stream_DB
+    """
+    backend = backend or Constants().DB_BACKEND
+    if backend == 'mysql':
+        from ptp_mysql_stream_db import MySQL_Stream_DB
+        return MySQL_Stream_DB()
+    if backend == 'sqlite':
+        from ptp_sqlite_stream_db import SQLite_Stream_DB
+        return SQLite_Stream_DB()
+    raise ValueError("Unknown database backend: %s" % backend)
+
+
 class Stream_DB(object):
-    """Stores and retrieves traffic analysis data in a MySQL database. One table is
-    used, with one row per TCP connection. There is a small number of columns,
-    and a single table avoids performance issues caused by joins.
+    """Stores and retrieves traffic analysis data in a SQL database. The
+    streams table has one row per TCP connection. There is a small number of
+    columns, and a single table avoids performance issues caused by joins.
+
+    Each analysed capture has a row in the captures table, and its streams
+    are partitioned by their capture_id, which leads each of the streams
+    table's indexes. The results of earlier captures are kept, up to
+    Constants().DB_CAPTURES_KEPT of them, and old ones are deleted by
+    capture_id range rather than by scanning the table. A capture's version
+    goes up whenever its streams change, so readers can tell whether what
+    they fetched before is still current (e.g. for HTTP ETags).
+
+    This is the storage interface. Subclasses connect to a particular
+    database engine and supply the parts of the SQL which differ between
+    engines: MySQL_Stream_DB (ptp_mysql_stream_db) and SQLite_Stream_DB
+    (ptp_sqlite_stream_db). Use get_stream_db to get the configured one.
+
+    Connections come from a DB_Connection_Pool shared by all objects of the
+    same subclass (and so by all Flask request threads), rather than each
+    method connecting and disconnecting.
+
+    Args:
+        pool (DB_Connection_Pool): pool to use instead of the shared one
     """
 
-    def __init__(self):
+    _shared_pool = None
+    _shared_pool_lock = threading.Lock()
+
+    # DB-API parameter placeholder used by the driver
+    _param = '%s'
+
+    # Driver exception for a statement which failed to run
+    _db_error = Exception
+
+    # Columns a capture's streams can be sorted by, and their positions in
+    # the rows returned. Each one (bar id, which every index ends with)
+    # follows capture_id in an index, so a page is read as an index range.
+    SORT_COLUMNS = {'id': 0, 'svr_ip': 1, 'bytes_to_cli': 3, 'is_encrypted': 4}
+
+    def __init__(self, pool=None):
         self._sql_streams_table_columns = \
-            """streams (cli_ip, cli_pt, svr_ip, svr_pt, bytes_to_svr, bytes_to_cli, ts_first_pkt, ts_last_pkt, ssl_cli_hello, ssl_cli_ccs, ssl_svr_hello, ssl_version, ssl_cipher, ssl_svr_ccs, is_encrypted)"""
+            """streams (capture_id, cli_ip, cli_pt, svr_ip, svr_pt, bytes_to_svr, bytes_to_cli, ts_first_pkt, ts_last_pkt, ssl_cli_hello, ssl_cli_ccs, ssl_svr_hello, ssl_version, ssl_cipher, ssl_svr_ccs, is_encrypted)"""
 
+        # Placeholders are filled in by the driver, which quotes and escapes
+        # the values, rather than by % formatting of the SQL string
+        ip, p = self._ip_to_db(self._param), self._param
         self._sql_stream_table_values = \
-            """VALUES (inet6_aton(\'%s\'), %d, inet6_aton(\'%s\'), %d, %d, %d, '%s', '%s', %d, %d, %d, '%s', '%s', %d, '%s')"""
-
-
-    def select_all_streams(self):
-        """Retrieves all rows from database"""
-        conn = self._get_conn_to_ptp_db()
-	cursor = conn.cursor()
-
-	sql =  """SELECT id, inet6_ntoa(svr_ip), bytes_to_svr, bytes_to_cli, is_encrypted
-                    FROM streams
-                    ORDER BY bytes_to_cli DESC;"""
-
-	cursor.execute(sql)
-	rows = cursor.fetchall()
-	cursor.close()
-        conn.close()
-	return rows
-
-    def persist_streams(self, stream_statuses):
-        """Stores a set of Stream_Status objects"""
-        conn = self._get_conn_to_ptp_db()
-	cursor = conn.cursor()
-        try:
-            for stream_status in stream_statuses: 
-                ts = stream_status.tcp_status
-                ss = stream_status.ssl_status
-                sql = ' '.join(["INSERT INTO", self._sql_streams_table_columns, self._sql_stream_table_values]) % \
-                    (ts.cli_ip, ts.cli_pt, ts.svr_ip, ts.svr_pt, int(ts.bytes_to_svr), int(ts.bytes_to_cli),
-                     self._epoch_to_datetime(ts.ts_first_pkt), self._epoch_to_datetime(ts.ts_last_pkt),
-                     ss.ssl_cli_hello, ss.ssl_cli_ccs, ss.ssl_svr_hello, ss.ssl_version, 
-                     ss.ssl_cipher, ss.ssl_svr_ccs, ss.is_encrypted)
- 
-                cursor.execute(sql)
+            "VALUES (" + ", ".join([p, ip, p, ip] + [p] * 12) + ")"
+
+        self._insert_batch_size = Constants().DB_INSERT_BATCH_SIZE
+
+        self._pool = pool if pool is not None else self._get_shared_pool()
+
+
+    def create_capture(self, pcap_filename=None):
+        """Adds a capture, which streams can then be stored under.
+
+        Args:
+            pcap_filename (str): file the capture was read from or saved in
+
+        Returns:
+            int: the new capture_id
+        """
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            sql = """INSERT INTO captures (ts_created, pcap_filename, num_streams)
+                  VALUES ({p}, {p}, 0)""".format(p=self._param)
+            cursor.execute(sql, (self._epoch_to_datetime(time.time()), pcap_filename))
+            capture_id = cursor.lastrowid
+            conn.commit()
+            cursor.close()
+        return capture_id
+
+
+    def get_capture(self, capture_id):
+        """Returns:
+            tuple: (id, ts_created, pcap_filename, num_streams, version,
+                is_complete) of the capture, or None if there isn't one
+        """
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            sql = """SELECT id, ts_created, pcap_filename, num_streams, version, is_complete
+                  FROM captures
+                  WHERE id = {p}""".format(p=self._param)
+            cursor.execute(sql, (capture_id,))
+            row = cursor.fetchone()
+            cursor.close()
+        return row
+
+
+    def get_stream_version(self, conn_id):
+        """Returns:
+            tuple: (capture_id, version, is_complete) of the capture a
+                stream belongs to, or None if there is no such stream
+        """
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            sql = """SELECT captures.id, captures.version, captures.is_complete
+                  FROM streams JOIN captures ON captures.id = streams.capture_id
+                  WHERE streams.id = {p}""".format(p=self._param)
+            cursor.execute(sql, (conn_id,))
+            row = cursor.fetchone()
+            cursor.close()
+        return row
+
+
+    def set_capture_complete(self, capture_id):
+        """Marks a capture as finished with, so its streams won't change
+        again."""
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            sql = "UPDATE captures SET is_complete = 1 WHERE id = {p}".format(p=self._param)
+            cursor.execute(sql, (capture_id,))
             conn.commit()
-        except MySQLdb.OperationalError as e:
-            print("Insert failed: ", e)
-            conn.rollback()
-        finally:
             cursor.close()
-            conn.close()
+
+
+    def select_streams_page(self, capture_id, sort_by='bytes_to_cli', descending=True,
+                            after=None, limit=None):
+        """Retrieves one page of a capture's rows, ordered by sort_by and
+        then id.
+
+        Pages are found by keyset pagination: each page starts just after
+        the last row of the one before, which the index on (capture_id,
+        sort_by) finds directly, rather than at an OFFSET, which reads
+        and discards all the earlier rows. Rows added or deleted while
+        paging don't shift later pages.
+
+        Args:
+            capture_id (int)
+            sort_by (str): one of SORT_COLUMNS
+            descending (bool)
+            after (tuple): page_key of the last row of the previous page,
+                or None for the first page
+            limit (int): rows per page; defaults to Constants().DB_PAGE_SIZE
+
+        Returns:
+            list of (id, svr_ip, bytes_to_svr, bytes_to_cli, is_encrypted)
+        """
+        if sort_by not in self.SORT_COLUMNS:
+            raise ValueError("Can't sort streams by %s" % sort_by)
+        p = self._param
+        cmp_op, order = ('<', 'DESC') if descending else ('>', 'ASC')
+        where = "capture_id = {p}".format(p=p)
+        params = [capture_id]
+        if after is not None:
+            after_value, after_id = after
+            if sort_by == 'id':
+                where += " AND id {cmp} {p}".format(cmp=cmp_op, p=p)
+                params.append(after_id)
+            else:
+                value = self._ip_to_db(p) if sort_by == 'svr_ip' else p
+                where += " AND ({col} {cmp} {value} OR ({col} = {value} AND id {cmp} {p}))".format(
+                    col=sort_by, cmp=cmp_op, value=value, p=p)
+                params.extend([after_value, after_value, after_id])
+        params.append(limit or Constants().DB_PAGE_SIZE)
+
+        order_by = "id " + order if sort_by == 'id' else "{col} {order}, id {order}".format(
+            col=sort_by, order=order)
+        sql = """SELECT id, {svr_ip}, bytes_to_svr, bytes_to_cli, is_encrypted
+              FROM streams
+              WHERE {where}
+              ORDER BY {order_by}
+              LIMIT {p}""".format(svr_ip=self._ip_from_db('svr_ip'), where=where,
+                                  order_by=order_by, p=p)
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+            cursor.close()
+        return rows
+
+
+    def page_key(self, row, sort_by='bytes_to_cli'):
+        """Returns:
+            tuple: the key to pass to select_streams_page as after, to get
+                the page following row
+        """
+        return (row[self.SORT_COLUMNS[sort_by]], row[0])
+
+
+    def iter_stream_pages(self, capture_id, sort_by='bytes_to_cli', descending=True,
+                          page_size=None):
+        """Generator of all of a capture's rows, a page (list of rows) at a
+        time, so only one page is held in memory. The connection is only
+        held while each page is read.
+
+        Args: as select_streams_page
+        """
+        after = None
+        while True:
+            rows = self.select_streams_page(capture_id, sort_by, descending, after, page_size)
+            if not rows:
+                return
+            yield rows
+            if len(rows) < (page_size or Constants().DB_PAGE_SIZE):
+                return
+            after = self.page_key(rows[-1], sort_by)
+
+
+    def persist_streams(self, capture_id, stream_statuses, batch_size=None, on_batch=None):
+        """Stores a set of Stream_Status objects under a capture.
+
+        Rows are inserted with executemany, which the drivers run as
+        multi-row INSERT statements (MySQLdb) or as one prepared statement
+        (sqlite3), and committed every batch_size rows, so large captures
+        don't need a round trip per stream or one huge transaction.
+
+        Args:
+            capture_id (int): from create_capture
+            stream_statuses (iterable of Stream_Status)
+            batch_size (int): rows per batch; defaults to
+                Constants().DB_INSERT_BATCH_SIZE
+            on_batch (function): called with the number of rows stored so
+                far after each batch is committed
+
+        Returns:
+            int: number of rows stored
+
+        Raises:
+            _db_error: If a batch can't be stored. The batches before it stay
+                stored.
+        """
+        batch_size = batch_size or self._insert_batch_size
+        sql = ' '.join(["INSERT INTO", self._sql_streams_table_columns, self._sql_stream_table_values])
+        sql_count = """UPDATE captures SET num_streams = num_streams + {p}, version = version + 1
+                    WHERE id = {p}""".format(p=self._param)
+        num_stored = 0
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                for batch in self._batches(stream_statuses, batch_size):
+                    cursor.executemany(sql, [(capture_id,) + self._get_stream_row(ss)
+                                             for ss in batch])
+                    cursor.execute(sql_count, (len(batch), capture_id))
+                    conn.commit()
+                    num_stored += len(batch)
+                    if on_batch is not None:
+                        on_batch(num_stored)
+            except self._db_error:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+        return num_stored
+
+
+    def _get_stream_row(self, stream_status):
+        """Returns:
+            tuple: the values of one row of the streams table, in the order
+                of _sql_streams_table_columns, apart from the capture_id
+        """
+        ts = stream_status.tcp_status
+        ss = stream_status.ssl_status
+        return (ts.cli_ip, int(ts.cli_pt), ts.svr_ip, int(ts.svr_pt),
+                int(ts.bytes_to_svr), int(ts.bytes_to_cli),
+                self._epoch_to_datetime(ts.ts_first_pkt), self._epoch_to_datetime(ts.ts_last_pkt),
+                bool(ss.ssl_cli_hello), bool(ss.ssl_cli_ccs), bool(ss.ssl_svr_hello),
+                ss.ssl_version, ss.ssl_cipher, bool(ss.ssl_svr_ccs), ss.is_encrypted)
+
+
+    def _batches(self, items, batch_size):
+        """Generator splitting an iterable into lists of up to batch_size items"""
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
 
 
     def _epoch_to_datetime(self, epoch_seconds):
@@ -67,93 +313,242 @@ class Stream_DB(object):
 
     def get_encryption_details_row(self, conn_id):
         """Retrieve connection's encryption details"""
-        conn = self._get_conn_to_ptp_db()
-	cursor = conn.cursor()
-	sql =  """SELECT is_encrypted, ssl_version, ssl_cipher 
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            sql =  """SELECT is_encrypted, ssl_version, ssl_cipher
                   FROM streams
-                  WHERE id = %s"""
-	cursor.execute(sql, (conn_id,))
-	row = cursor.fetchone()
-	cursor.close()
-        conn.close()
-	return row
+                  WHERE id = {p}""".format(p=self._param)
+            cursor.execute(sql, (conn_id,))
+            row = cursor.fetchone()
+            cursor.close()
+        return row
 
 
     def get_connection_details_row(self, conn_id):
         """Retrieve connection's TCP/IP details"""
-        conn = self._get_conn_to_ptp_db()
-	cursor = conn.cursor()
-	sql =  """SELECT inet6_ntoa(cli_ip), cli_pt, inet6_ntoa(svr_ip), svr_pt,
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            sql =  """SELECT {cli_ip}, cli_pt, {svr_ip}, svr_pt,
                     ts_first_pkt, ts_last_pkt
                   FROM streams
-                  WHERE id = %s"""
-	cursor.execute(sql, (conn_id,))
-	row = cursor.fetchone()
-	cursor.close()
-        conn.close()
-	return row
-
-
-    def clear_streams(self):
-        """Delete all rows"""
-        conn = self._get_conn_to_ptp_db()
-	cursor = conn.cursor()
-        try:
-            sql =  "delete from streams" 
-            cursor.execute(sql)
-            conn.commit()
-        except MySQLdb.OperationalError as e:
-            print("Delete failed: ", e)
-            conn.rollback()
-        finally:
+                  WHERE id = {p}""".format(cli_ip=self._ip_from_db('cli_ip'),
+                                           svr_ip=self._ip_from_db('svr_ip'),
+                                           p=self._param)
+            cursor.execute(sql, (conn_id,))
+            row = cursor.fetchone()
             cursor.close()
-            conn.close()
+        return row
+
+
+    def delete_streams(self, capture_id):
+        """Deletes a capture's streams, keeping the capture itself, so its
+        results can be stored again"""
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("DELETE FROM streams WHERE capture_id = {p}".format(p=self._param),
+                               (capture_id,))
+                sql = """UPDATE captures SET num_streams = 0, version = version + 1
+                      WHERE id = {p}""".format(p=self._param)
+                cursor.execute(sql, (capture_id,))
+                conn.commit()
+            except self._db_error:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+
+
+    def delete_old_captures(self, num_kept=None):
+        """Deletes all but the newest captures, and their streams.
+
+        The streams go in one range delete on the leading capture_id of
+        their indexes, and the captures in one on the primary key, so
+        neither table is scanned.
+
+        Args:
+            num_kept (int): number of captures to keep; defaults to
+                Constants().DB_CAPTURES_KEPT
+
+        Returns:
+            int: number of captures deleted
+
+        Raises:
+            _db_error: If the captures can't be deleted; none are.
+        """
+        num_kept = num_kept or Constants().DB_CAPTURES_KEPT
+        num_deleted = 0
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                # ids only increase, so the oldest capture kept marks the cut
+                sql = """SELECT id FROM captures ORDER BY id DESC
+                      LIMIT 1 OFFSET {p}""".format(p=self._param)
+                cursor.execute(sql, (num_kept - 1,))
+                row = cursor.fetchone()
+                if row is not None:
+                    oldest_kept = row[0]
+                    cursor.execute("DELETE FROM streams WHERE capture_id < {p}".format(p=self._param),
+                                   (oldest_kept,))
+                    cursor.execute("DELETE FROM captures WHERE id < {p}".format(p=self._param),
+                                   (oldest_kept,))
+                    num_deleted = cursor.rowcount
+                    conn.commit()
+            except self._db_error:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+        return num_deleted
+
+
+    def compact(self):
+        """Returns the space freed by deleted captures (see
+        delete_old_captures) to the file system, where the engine doesn't do
+        so itself. Done by ptp_init.py, before captures are made, as it may
+        lock the tables for a while."""
+        pass
 
 
     def drop_table_streams(self):
-        conn = self._get_conn_to_ptp_db()
-        cursor = conn.cursor()
-        sql = "drop table streams;"
-        cursor.execute(sql)
-	cursor.close()
-        conn.close()
-
-    def _get_conn_to_ptp_db(self):
-	conn = MySQLdb.connect(host= "localhost", user="root",
-	    passwd="password", db="ptp")
-        return conn
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            sql = "drop table streams;"
+            cursor.execute(sql)
+            cursor.close()
+
+
+    def drop_table_captures(self):
+        """Must be called after drop_table_streams, whose rows refer to it"""
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            sql = "drop table captures;"
+            cursor.execute(sql)
+            cursor.close()
+
 
     def create_db_ptp(self):
-	conn = MySQLdb.connect(host= "localhost", user="root",
-	    passwd="password")
-        cursor = conn.cursor()
-        cursor.execute("create database ptp;")
+        """Creates the database itself, for engines where that is done
+        separately from connecting to it."""
+        pass
+
+
+    def create_table_captures(self):
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(self._sql_create_table_captures())
+            cursor.close()
 
 
     def create_table_streams(self):
-        conn = self._get_conn_to_ptp_db()
-        cursor = conn.cursor()
-
-        sql = """create table streams (id int not null primary key auto_increment,
-            cli_ip varbinary(16),
-            cli_pt int(5),
-            svr_ip varbinary(16),
-            svr_pt int(5), 
-            bytes_to_cli int(10),
-            bytes_to_svr int(6),
-            ts_first_pkt datetime, 
-            ts_last_pkt datetime, 
-            ssl_cli_hello bool,
-            ssl_cli_ccs bool,
-            ssl_svr_hello bool,
-            ssl_version varbinary(64),
-            ssl_cipher varbinary(128),
-            ssl_svr_ccs bool,
-            is_encrypted varbinary(16) )"""
-
-        cursor.execute(sql)
-	cursor.close()
-        conn.close()
+        """Must be called after create_table_captures, as streams refer to it"""
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            for sql in self._sql_create_table_streams():
+                cursor.execute(sql)
+            cursor.close()
+
+
+    def migrate_table_streams(self):
+        """Brings a streams table made before captures were kept up to date,
+        keeping its rows: they become one capture (only the last capture's
+        streams were kept then), and the capture_id column and its indexes
+        are added. Must be called after create_table_captures.
+
+        Returns:
+            bool: whether the table needed migrating
+        """
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT * FROM streams LIMIT 0")
+                columns = [column[0] for column in cursor.description]
+                cursor.fetchall()
+                if 'capture_id' in columns:
+                    return False
+                cursor.execute("SELECT COUNT(*) FROM streams")
+                num_streams = cursor.fetchone()[0]
+                sql = """INSERT INTO captures (ts_created, num_streams, is_complete)
+                      VALUES ({p}, {p}, {p})""".format(p=self._param)
+                cursor.execute(sql, (self._epoch_to_datetime(time.time()), num_streams, True))
+                capture_id = cursor.lastrowid
+                for sql in self._sql_migrate_table_streams(capture_id):
+                    cursor.execute(sql)
+                conn.commit()
+            finally:
+                cursor.close()
+        return True
+
+
+    def _sql_create_table_captures(self):
+        """Returns:
+            str: the engine's CREATE TABLE statement for the captures table
+        """
+        raise NotImplementedError
+
+
+    def _sql_create_table_streams(self):
+        """Returns:
+            list of str: the engine's statements creating the streams table
+                and its indexes
+        """
+        raise NotImplementedError
+
+
+    def _sql_migrate_table_streams(self, capture_id):
+        """Args:
+            capture_id (int): capture the existing rows are put under
+
+        Returns:
+            list of str: the engine's statements adding the capture_id
+                column, and its indexes, to a streams table without them
+        """
+        raise NotImplementedError
+
+
+    def _ip_to_db(self, value):
+        """Returns:
+            str: SQL expression storing the IP address value (a placeholder)
+                in an IP address column
+        """
+        return value
+
+
+    def _ip_from_db(self, column):
+        """Returns:
+            str: SQL expression giving the IP address in column as text
+        """
+        return column
+
+
+    @staticmethod
+    def _connect():
+        """Returns:
+            a new DB-API connection to the ptp database
+        """
+        raise NotImplementedError
+
+
+    @staticmethod
+    def _check_connection(conn):
+        """Raises an exception if a pooled connection is no longer usable."""
+        conn.ping()
+
+
+    @classmethod
+    def _make_pool(cls, connect):
+        return DB_Connection_Pool(connect, size=Constants().DB_POOL_SIZE,
+                                  check=cls._check_connection)
+
+
+    @classmethod
+    def _get_shared_pool(cls):
+        with cls._shared_pool_lock:
+            # Looked up in the class's own dict, so each subclass gets its
+            # own pool
+            if cls.__dict__.get('_shared_pool') is None:
+                cls._shared_pool = cls._make_pool(cls._connect)
+            return cls._shared_pool
 
 
     def log(self, msg):
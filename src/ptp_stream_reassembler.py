@@ -0,0 +1,154 @@
+from ptp_packet_decoder import TCP_SYN
+
+
+class Stream_Reassembler(object):
+    """Rebuilds the byte stream carried by one direction of a TCP connection
+    from its segments, in whatever order they were captured.
+
+    Sequence numbers are converted to offsets relative to the initial
+    sequence number (ISN), modulo 2**32, so a stream crossing the sequence
+    number wraparound point reassembles like any other. The ISN comes from
+    the SYN if one was seen, otherwise from the first segment carrying data.
+
+    A segment that continues the stream is delivered straight away, along
+    with any queued segments it makes contiguous. Retransmitted bytes
+    already delivered are trimmed off overlapping segments. Segments that
+    arrive ahead of a hole are queued, up to max_pending of them; if the
+    queue overflows, the hole is recorded in gaps and skipped, so memory
+    stays bounded when a segment was never captured. Segments starting more
+    than window bytes beyond the next expected byte, or before the start of
+    the stream, are discarded.
+
+    Args:
+        max_bytes (int): how many bytes from the start of the stream to keep
+            for get_data(). 0 keeps none; delivered bytes are still returned
+            by add_segment.
+        max_pending (int): maximum number of out-of-order segments queued
+        window (int): how far beyond the next expected byte, in bytes, a
+            segment may start
+
+    Attributes:
+        gaps (list of (int, int)): (start, end) offsets of holes skipped in
+            the stream
+    """
+
+    SEQ_MOD = 1 << 32
+    _SEQ_HALF = 1 << 31
+
+    def __init__(self, max_bytes=16384, max_pending=32, window=1 << 20):
+        self._max_bytes = max_bytes
+        self._max_pending = max_pending
+        self._window = window
+        self._isn = None
+        self._next = 0
+        self._pending = {}
+        self._chunks = []
+        self._size = 0
+        self.gaps = []
+
+
+    def add_segment(self, seq, flags, payload):
+        """Adds one TCP segment to the stream.
+
+        Args:
+            seq (int): TCP sequence number
+            flags (int): TCP flags byte
+            payload (str): TCP payload
+
+        Returns:
+            str: bytes that became contiguous as a result, in stream order
+                ('' if none did)
+        """
+        if flags & TCP_SYN:
+            seq = (seq + 1) % self.SEQ_MOD
+            if self._isn is None:
+                self._isn = seq
+
+        if not payload:
+            return b''
+
+        if self._isn is None:
+            self._isn = seq
+
+        offset = (seq - self._isn) % self.SEQ_MOD
+        if offset >= self._SEQ_HALF or offset > self._next + self._window:
+            # before the start of the stream, or too far ahead to be real
+            return b''
+
+        if offset > self._next:
+            queued = self._pending.get(offset)
+            if queued is None or len(queued) < len(payload):
+                self._pending[offset] = payload
+            if len(self._pending) <= self._max_pending:
+                return b''
+            self._skip_gap()
+            return self._deliver([])
+
+        return self._deliver([self._trim(offset, payload)])
+
+
+    def get_data(self):
+        """Returns:
+            str: the contiguous stream from its start, up to max_bytes
+        """
+        if len(self._chunks) > 1:
+            self._chunks = [b''.join(self._chunks)]
+        return self._chunks[0] if self._chunks else b''
+
+
+    def get_next_offset(self):
+        """Returns:
+            int: offset of the next byte expected, i.e. number of bytes
+                delivered (including skipped gaps)
+        """
+        return self._next
+
+
+    def has_pending(self):
+        """Returns:
+            bool: True if out-of-order segments are waiting for a hole to fill
+        """
+        return bool(self._pending)
+
+
+    def _trim(self, offset, payload):
+        """Cuts off the start of a segment that overlaps bytes already
+        delivered, and advances the next expected offset past it.
+
+        Returns:
+            str: the bytes of payload not delivered before
+        """
+        end = offset + len(payload)
+        if end <= self._next:
+            return b''
+        payload = payload[self._next - offset:]
+        self._next = end
+        return payload
+
+
+    def _deliver(self, new):
+        """Appends any queued segments made contiguous to new, stores the
+        result up to max_bytes and returns it."""
+        pending = self._pending
+        while pending:
+            offset = min(pending)
+            if offset > self._next:
+                break
+            new.append(self._trim(offset, pending.pop(offset)))
+
+        data = b''.join(new)
+        room = self._max_bytes - self._size
+        if data and room > 0:
+            kept = data[:room]
+            self._chunks.append(kept)
+            self._size += len(kept)
+        return data
+
+
+    def _skip_gap(self):
+        """Gives up on the hole before the earliest queued segment."""
+        offset = min(self._pending)
+        self.gaps.append((self._next, offset))
+        self._next = offset
+        # nothing after a hole can be part of the contiguous prefix
+        self._max_bytes = self._size
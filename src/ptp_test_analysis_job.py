@@ -0,0 +1,59 @@
+import unittest
+import threading
+from ptp_analysis_job import Job_Runner, Analysis_Job
+
+
+class Test_Job_Runner(unittest.TestCase):
+    """Unit tests for PTP Job_Runner and Analysis_Job classes"""
+
+    def test_job_runs_in_background_with_progress(self):
+        runner = Job_Runner()
+        release = threading.Event()
+
+        def work(progress):
+            progress.stage = 'reading packets'
+            progress.packets_read = 10
+            release.wait()
+            progress.flows_analysed = 2
+            return 2
+
+        job = runner.submit(work)
+        self.assertIs(runner.get(job.job_id), job)
+        while job.progress.packets_read != 10:
+            job.wait(0.01)
+        self.assertEqual(job.state, Analysis_Job.RUNNING)
+        self.assertEqual(job.to_dict()['progress']['stage'], 'reading packets')
+        release.set()
+        self.assertTrue(job.wait(5))
+        self.assertEqual(job.state, Analysis_Job.DONE)
+        self.assertEqual(job.result, 2)
+        self.assertEqual(job.to_dict()['progress']['flows_analysed'], 2)
+
+    def test_jobs_run_one_at_a_time_in_order(self):
+        runner = Job_Runner()
+        order = []
+        jobs = [runner.submit(lambda progress, i=i: order.append(i)) for i in range(5)]
+        self.assertTrue(jobs[-1].wait(5))
+        self.assertEqual(order, range(5))
+
+    def test_failed_job_keeps_error(self):
+        def work(progress):
+            raise ValueError("bad pcap")
+        job = Job_Runner().submit(work)
+        self.assertTrue(job.wait(5))
+        self.assertEqual(job.state, Analysis_Job.FAILED)
+        self.assertEqual(job.error, "ValueError: bad pcap")
+
+    def test_unknown_and_old_jobs(self):
+        runner = Job_Runner(max_jobs=2)
+        self.assertIsNone(runner.get('nonexistent'))
+        jobs = []
+        for i in range(3):
+            jobs.append(runner.submit(lambda progress: None))
+            jobs[-1].wait(5)
+        self.assertIsNone(runner.get(jobs[0].job_id))
+        self.assertIs(runner.get(jobs[2].job_id), jobs[2])
+
+
+if __name__ == '__main__':
+    unittest.main()
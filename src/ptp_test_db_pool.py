@@ -0,0 +1,96 @@
+import unittest
+import threading
+from ptp_db_pool import DB_Connection_Pool, DB_Pool_Timeout
+
+
+class Fake_Connection(object):
+    """Stands in for a DB-API connection"""
+
+    def __init__(self):
+        self.closed = False
+        self.rollbacks = 0
+        self.healthy = True
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+    def ping(self):
+        if not self.healthy:
+            raise Exception("server has gone away")
+
+
+class Test_DB_Connection_Pool(unittest.TestCase):
+    """Unit tests for PTP DB_Connection_Pool class"""
+
+    def setUp(self):
+        self.connections = []
+
+    def connect(self):
+        conn = Fake_Connection()
+        self.connections.append(conn)
+        return conn
+
+    def test_connection_is_reused(self):
+        pool = DB_Connection_Pool(self.connect)
+        with pool.connection() as conn:
+            first = conn
+        with pool.connection() as conn:
+            self.assertIs(conn, first)
+        self.assertEqual(len(self.connections), 1)
+        # read transactions are ended so the next user sees fresh data
+        self.assertEqual(first.rollbacks, 2)
+
+    def test_concurrent_users_get_different_connections(self):
+        pool = DB_Connection_Pool(self.connect, size=2)
+        with pool.connection() as conn1:
+            with pool.connection() as conn2:
+                self.assertIsNot(conn1, conn2)
+                self.assertEqual(pool.get_num_open(), 2)
+
+    def test_checkout_times_out_when_all_in_use(self):
+        pool = DB_Connection_Pool(self.connect, size=1, timeout=0.05)
+        with pool.connection():
+            with self.assertRaises(DB_Pool_Timeout):
+                with pool.connection():
+                    pass
+
+    def test_waiting_thread_gets_returned_connection(self):
+        pool = DB_Connection_Pool(self.connect, size=1, timeout=5)
+        got = []
+
+        def wait_for_connection():
+            with pool.connection() as conn:
+                got.append(conn)
+
+        with pool.connection() as conn:
+            waiter = threading.Thread(target=wait_for_connection)
+            waiter.start()
+            waiter.join(0.05)
+            self.assertEqual(got, [])
+        waiter.join()
+        self.assertEqual(got, [conn])
+
+    def test_connection_discarded_after_exception(self):
+        pool = DB_Connection_Pool(self.connect)
+        with self.assertRaises(ValueError):
+            with pool.connection() as conn:
+                raise ValueError()
+        self.assertTrue(conn.closed)
+        self.assertEqual(pool.get_num_open(), 0)
+
+    def test_unhealthy_idle_connection_replaced(self):
+        pool = DB_Connection_Pool(self.connect, check_after=0)
+        with pool.connection() as conn:
+            first = conn
+        first.healthy = False
+        with pool.connection() as conn:
+            self.assertIsNot(conn, first)
+        self.assertTrue(first.closed)
+        self.assertEqual(pool.get_num_open(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+from ptp_duplicate_filter import Duplicate_Filter
+from ptp_packet_decoder import Packet_Decoder, TCP_SYN, TCP_ACK
+from scapy.all import Ether, IP, TCP, Raw
+
+
+class Test_Duplicate_Filter(unittest.TestCase):
+    """Unit tests for PTP Duplicate_Filter class"""
+
+    def decode(self, *pkts):
+        """Turns Scapy packets into the Decoded_Packets the filter checks"""
+        decoder = Packet_Decoder()
+        return [decoder.decode(0, str(pkt)) for pkt in pkts]
+
+    def remove_duplicates(self, pkts, dup_filter=None):
+        dup_filter = dup_filter or Duplicate_Filter()
+        return [pkt for pkt in pkts if not dup_filter.is_duplicate(pkt)]
+
+    def test_only_duplicate_ack_removed(self):
+        """Given a session with three packets, only the duplicate should be removed.
+        The other two should remain.
+        Duplicates: a pair of ACK packets (ACK flag set, same SEQ and ACK numbers)
+        Other: SYN packet (SYN flag set)
+        """
+        non_dup = Ether()/IP()/TCP(flags='S', seq=0, ack=0)
+        ack1 = Ether()/IP()/TCP(flags='A', seq=1, ack=1)
+        ack2 = Ether()/IP()/TCP(flags='A', seq=1, ack=1)
+        pkts = self.decode(non_dup, ack1, ack2)        
+        deduped_pkts = self.remove_duplicates(pkts)
+        self.assertTrue(deduped_pkts[0].flags == TCP_SYN) 
+        self.assertTrue(len(deduped_pkts) == 2)
+
+    def test_only_duplicate_data_removed(self):
+        """Given a session with three packets, only the duplicate should be removed.
+        The other two should remain.
+        Duplicates: a pair of data packets (PUSH and ACK flags set, same SEQ and ACK numbers)
+        Other: SYN packet (SYN flag set)
+        """
+        non_dup = Ether()/IP()/TCP(flags='S', seq=0, ack=0)
+        data1 = Ether() \
+                /IP() \
+                /TCP(flags='PA', seq=10, ack=11, chksum=0xccfe ) \
+                /Raw(load='abc') 
+        data2 = Ether() \
+                /IP() \
+                /TCP(flags='PA', seq=10, ack=11, chksum=0xccfe ) \
+                /Raw(load='abc') 
+        pkts = self.decode(non_dup, data1, data2)        
+        deduped_pkts = self.remove_duplicates(pkts)
+        self.assertTrue(deduped_pkts[0].flags == TCP_SYN) 
+        self.assertTrue(len(deduped_pkts) == 2)
+
+
+    def test_only_duplicate_syn_removed(self):
+        """Given a session with three packets, only the duplicate should be removed.
+        The other two should remain.
+        Duplicates: a pair of SYN packets (SYN flag set, same SEQ and ACK numbers)
+        Other: ACK packet (ACK flag set)
+        """
+        syn1 = Ether()/IP()/TCP(flags='S', seq=0, ack=0)
+        syn2 = Ether()/IP()/TCP(flags='S', seq=0, ack=0)
+        non_dup = Ether()/IP()/TCP(flags='A', seq=1, ack=1)
+        pkts = self.decode(syn1, syn2, non_dup)        
+        deduped_pkts = self.remove_duplicates(pkts)
+        self.assertTrue(deduped_pkts[-1].flags == TCP_ACK) 
+        self.assertTrue(len(deduped_pkts) == 2)
+
+
+    def test_only_duplicate_synack_removed(self):
+        """Given a session with three packets, only the duplicate should be removed.
+        The other two should remain.
+        Duplicates: a pair of SYN/ACK packets (SYN and ACK flag set, same SEQ and ACK numbers)
+        Other: ACK packet (ACK flag set)
+        """
+        synack1 = Ether()/IP()/TCP(flags='SA', seq=0, ack=1)
+        synack2 = Ether()/IP()/TCP(flags='SA', seq=0, ack=1)
+        non_dup = Ether()/IP()/TCP(flags='A', seq=10, ack=11)
+        pkts = self.decode(synack1, synack2, non_dup)        
+        deduped_pkts = self.remove_duplicates(pkts)
+        self.assertTrue(deduped_pkts[-1].flags == TCP_ACK) 
+        self.assertTrue(len(deduped_pkts) == 2)
+
+    def test_only_most_recent_keys_remembered(self):
+        """A duplicate arriving after max_keys other distinct packets is no
+        longer recognised, so filter state stays bounded.
+        """
+        ack1 = Ether()/IP()/TCP(flags='A', seq=1, ack=1)
+        ack2 = Ether()/IP()/TCP(flags='A', seq=2, ack=1)
+        ack3 = Ether()/IP()/TCP(flags='A', seq=3, ack=1)
+        pkts = self.decode(ack1, ack2, ack3, ack1)
+        deduped_pkts = self.remove_duplicates(pkts, Duplicate_Filter(max_keys=2))
+        self.assertTrue(len(deduped_pkts) == 4)
+
+if __name__ == '__main__':
+    unittest.main()
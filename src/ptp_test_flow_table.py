@@ -0,0 +1,80 @@
+import unittest
+from ptp_flow_table import Flow_Table
+from ptp_packet_decoder import Packet_Decoder
+from scapy.all import Ether, IP, TCP
+
+
+class Test_Flow_Table(unittest.TestCase):
+    """Unit tests for PTP Flow_Table class"""
+
+    def packet(self, src, sport, dst, dport, flags='A', seq=0):
+        frame = str(Ether()/IP(src=src, dst=dst)/
+                    TCP(sport=sport, dport=dport, flags=flags, seq=seq))
+        return Packet_Decoder().decode(0, frame)
+
+    def test_both_directions_go_to_one_flow(self):
+        flow_table = Flow_Table(cli_ip='10.0.2.15')
+        flow_table.add_packet(self.packet('1.2.3.4', 443, '10.0.2.15', 5555), 0)
+        flow_table.add_packet(self.packet('10.0.2.15', 5555, '1.2.3.4', 443, seq=1), 0)
+        flow_table.add_packet(self.packet('10.0.2.15', 5555, '1.2.3.4', 443, seq=2), 0)
+        flows = flow_table.get_flows()
+        cli_to_svr, svr_to_cli = flows[('10.0.2.15', 5555, '1.2.3.4', 443)]
+        self.assertEqual(len(flows), 1)
+        self.assertEqual(len(cli_to_svr), 2)
+        self.assertEqual(len(svr_to_cli), 1)
+
+    def test_missing_direction_is_none(self):
+        flow_table = Flow_Table(cli_ip='10.0.2.15')
+        flow_table.add_packet(self.packet('1.2.3.4', 443, '10.0.2.15', 5555), 0)
+        cli_to_svr, svr_to_cli = flow_table.get_flows()[('10.0.2.15', 5555, '1.2.3.4', 443)]
+        self.assertIsNone(cli_to_svr)
+        self.assertEqual(svr_to_cli.src_ip, '1.2.3.4')
+
+    def test_syn_sender_is_client_if_client_ip_unknown(self):
+        flow_table = Flow_Table()
+        flow_table.add_packet(self.packet('1.2.3.4', 80, '5.6.7.8', 40000, flags='S'), 0)
+        self.assertEqual(flow_table.get_flows().keys(), [('1.2.3.4', 80, '5.6.7.8', 40000)])
+
+    def test_synack_receiver_is_client_if_client_ip_unknown(self):
+        flow_table = Flow_Table()
+        flow_table.add_packet(self.packet('5.6.7.8', 40000, '1.2.3.4', 80, flags='SA'), 0)
+        self.assertEqual(flow_table.get_flows().keys(), [('1.2.3.4', 80, '5.6.7.8', 40000)])
+
+    def test_lower_port_is_server_if_nothing_else_to_go_on(self):
+        flow_table = Flow_Table()
+        flow_table.add_packet(self.packet('1.2.3.4', 443, '5.6.7.8', 40000), 0)
+        self.assertEqual(flow_table.get_flows().keys(), [('5.6.7.8', 40000, '1.2.3.4', 443)])
+
+    def test_duplicates_dropped_and_counted(self):
+        flow_table = Flow_Table(cli_ip='10.0.2.15')
+        for i in range(3):
+            flow_table.add_packet(self.packet('10.0.2.15', 5555, '1.2.3.4', 443, flags='S'), 0)
+        cli_to_svr, svr_to_cli = flow_table.get_flows()[('10.0.2.15', 5555, '1.2.3.4', 443)]
+        self.assertEqual(len(cli_to_svr), 1)
+        self.assertEqual(cli_to_svr.num_duplicates, 2)
+
+    def test_closed_and_idle_flows_are_popped(self):
+        verdicts = []
+        flow_table = Flow_Table(cli_ip='10.0.2.15',
+                                on_verdict=lambda quad, tracker: verdicts.append(quad))
+        closed = ('10.0.2.15', 5555, '1.2.3.4', 443)
+        idle = ('10.0.2.15', 6666, '1.2.3.4', 443)
+        flow_table.add_packet(self.packet(*closed, flags='S'), 0)
+        flow_table.add_packet(self.packet(*closed, flags='FA', seq=1), 0)
+        flow_table.add_packet(self.packet(*idle, flags='S'), 0)
+        self.assertEqual(flow_table.pop_finished(now=5, linger=10, idle_timeout=60), {})
+        popped = flow_table.pop_finished(now=10, linger=10, idle_timeout=60)
+        self.assertEqual(popped.keys(), [closed])
+        (cli_to_svr, svr_to_cli), tracker = popped[closed]
+        self.assertEqual(len(cli_to_svr), 2)
+        self.assertIsNotNone(tracker.get_verdict())
+        self.assertEqual(verdicts, [closed])
+        self.assertEqual(flow_table.pop_finished(now=60, linger=10, idle_timeout=60).keys(), [idle])
+        self.assertEqual(len(flow_table), 0)
+        # a late packet starts a new flow
+        flow_table.add_packet(self.packet(*closed), 0)
+        self.assertEqual(flow_table.get_flows().keys(), [closed])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+from ptp_hostname_index import Hostname_Index
+from ptp_packet_decoder import Packet_Decoder
+from scapy.all import Ether, IP, UDP, DNS, DNSQR, DNSRR
+
+
+class Test_Hostname_Index(unittest.TestCase):
+    """Unit tests for PTP Hostname_Index class"""
+
+    def dns_response(self, qname, answers, rcode=0):
+        an = None
+        for rrname, rr_type, rdata in answers:
+            rr = DNSRR(rrname=rrname, type=rr_type, rdata=rdata)
+            an = rr if an is None else an/rr
+        return str(DNS(id=1, qr=1, rd=1, ra=1, rcode=rcode, qd=DNSQR(qname=qname),
+                       an=an, ancount=len(answers)))
+
+    def test_a_answer_named_after_query(self):
+        index = Hostname_Index()
+        msg = self.dns_response('www.example.com', [
+            ('www.example.com', 'CNAME', 'cdn.example.net'),
+            ('cdn.example.net', 'A', '93.184.216.34'),
+            ('cdn.example.net', 'A', '93.184.216.35')])
+        self.assertEqual(index.add_dns_response(msg), 2)
+        self.assertEqual(index.lookup(['93.184.216.34', '93.184.216.35', '1.1.1.1']),
+                         {'93.184.216.34': 'www.example.com',
+                          '93.184.216.35': 'www.example.com'})
+
+    def test_aaaa_answer(self):
+        index = Hostname_Index()
+        index.add_dns_response(self.dns_response('v6.example.com', [
+            ('v6.example.com', 'AAAA', '2001:db8::1')]))
+        self.assertEqual(index.get('2001:db8::1'), 'v6.example.com')
+
+    def test_error_and_malformed_responses_are_ignored(self):
+        index = Hostname_Index()
+        msg = self.dns_response('www.example.com', [('www.example.com', 'A', '1.2.3.4')])
+        self.assertEqual(index.add_dns_response(self.dns_response(
+            'www.example.com', [('www.example.com', 'A', '1.2.3.4')], rcode=3)), 0)
+        self.assertEqual(index.add_dns_response(msg[:-3]), 0)
+        self.assertEqual(len(index), 0)
+
+    def test_sni_overrides_dns(self):
+        index = Hostname_Index()
+        index.add_sni('1.2.3.4', 'api.example.com')
+        index.add_dns_response(self.dns_response('www.example.com', [
+            ('www.example.com', 'A', '1.2.3.4')]))
+        self.assertEqual(index.get('1.2.3.4'), 'api.example.com')
+
+    def test_add_packet_takes_responses_from_port_53(self):
+        index = Hostname_Index()
+        payload = self.dns_response('www.example.com', [('www.example.com', 'A', '1.2.3.4')])
+        decoder = Packet_Decoder(decode_udp=True)
+        query = decoder.decode(0, str(Ether()/IP()/UDP(sport=3333, dport=53)/payload))
+        response = decoder.decode(0, str(Ether()/IP()/UDP(sport=53, dport=3333)/payload))
+        self.assertEqual(index.add_packet(query), 0)
+        self.assertEqual(index.add_packet(response), 1)
+
+    def test_oldest_entries_dropped(self):
+        index = Hostname_Index(max_entries=1)
+        index.add_sni('1.1.1.1', 'one.example.com')
+        index.add_sni('2.2.2.2', 'two.example.com')
+        self.assertEqual(index.lookup(['1.1.1.1', '2.2.2.2']), {'2.2.2.2': 'two.example.com'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+from ptp_packet_decoder import Packet_Decoder, TCP_SYN, TCP_PSH, TCP_ACK, IP_PROTO_UDP
+from ptp_pcap_reader import Pcap_Reader
+from ptp_constants import Constants
+from scapy.all import rdpcap, Ether, Dot1Q, CookedLinux, PPP, IP, IPv6, \
+        IPv6ExtHdrHopByHop, UDP, TCP, Raw
+
+
+class Test_Packet_Decoder(unittest.TestCase):
+    """Unit tests for PTP Packet_Decoder class"""
+
+    def setUp(self):
+        self.tcp = TCP(sport=44071, dport=443, seq=123456, ack=654321,
+                       flags='PA', chksum=0xabcd)/Raw(load='hello')
+
+    def assert_decoded(self, pkt, src_ip, dst_ip):
+        self.assertEqual(pkt.src_ip, src_ip)
+        self.assertEqual(pkt.dst_ip, dst_ip)
+        self.assertEqual(pkt.src_pt, 44071)
+        self.assertEqual(pkt.dst_pt, 443)
+        self.assertEqual(pkt.seq, 123456)
+        self.assertEqual(pkt.ack, 654321)
+        self.assertEqual(pkt.flags, TCP_PSH | TCP_ACK)
+        self.assertEqual(pkt.chksum, 0xabcd)
+        self.assertEqual(pkt.get_payload(), 'hello')
+
+    def test_fields_match_scapy_dissection(self):
+        pcap = Constants().TEST_PCAP_DIR + '/ssl-test.pcap'
+        scapy_pkts = [p for p in rdpcap(pcap) if p.haslayer(TCP)]
+        with Pcap_Reader(pcap) as reader:
+            decoder = Packet_Decoder(reader.get_link_type())
+            pkts = [decoder.decode(ts, frame) for ts, offset, frame in reader]
+        pkts = [p for p in pkts if p is not None]
+        self.assertEqual(len(pkts), len(scapy_pkts))
+        for pkt, scapy_pkt in zip(pkts, scapy_pkts):
+            self.assertEqual(pkt.src_ip, scapy_pkt[IP].src)
+            self.assertEqual(pkt.dst_pt, scapy_pkt[TCP].dport)
+            self.assertEqual(pkt.seq, scapy_pkt[TCP].seq)
+            self.assertEqual(pkt.flags, int(scapy_pkt[TCP].flags))
+            # Scapy counts Ethernet padding as TCP payload; the decoder doesn't
+            payload = scapy_pkt[Raw].load if scapy_pkt.haslayer(Raw) else ''
+            self.assertEqual(pkt.payload_len, len(payload))
+
+    def test_ethernet_padding_is_not_payload(self):
+        frame = str(Ether()/IP(src='10.0.2.15', dst='1.2.3.4')/TCP(flags='S'))
+        pkt = Packet_Decoder().decode(0, frame + '\x00' * 6)
+        self.assertEqual(pkt.flags, TCP_SYN)
+        self.assertEqual(pkt.payload_len, 0)
+
+    def test_vlan_tagged_ethernet(self):
+        frame = str(Ether()/Dot1Q(vlan=5)/IP(src='10.0.2.15', dst='1.2.3.4')/self.tcp)
+        self.assert_decoded(Packet_Decoder().decode(0, frame), '10.0.2.15', '1.2.3.4')
+
+    def test_linux_cooked_capture(self):
+        frame = str(CookedLinux(proto=0x0800)/IP(src='10.0.2.15', dst='1.2.3.4')/self.tcp)
+        decoder = Packet_Decoder(Packet_Decoder.LINKTYPE_LINUX_SLL)
+        self.assert_decoded(decoder.decode(0, frame), '10.0.2.15', '1.2.3.4')
+
+    def test_ppp(self):
+        frame = str(PPP(proto=0x0021)/IP(src='10.0.2.15', dst='1.2.3.4')/self.tcp)
+        decoder = Packet_Decoder(Packet_Decoder.LINKTYPE_PPP)
+        self.assert_decoded(decoder.decode(0, frame), '10.0.2.15', '1.2.3.4')
+
+    def test_ipv6_with_extension_header(self):
+        frame = str(Ether()/IPv6(src='fe80::1', dst='2001:db8::2')/
+                    IPv6ExtHdrHopByHop()/self.tcp)
+        self.assert_decoded(Packet_Decoder().decode(0, frame), 'fe80::1', '2001:db8::2')
+
+    def test_non_tcp_is_ignored(self):
+        frame = str(Ether()/IP(dst='1.2.3.4')/UDP()/Raw(load='x'))
+        self.assertIsNone(Packet_Decoder().decode(0, frame))
+
+    def test_udp_decoded_if_asked_for(self):
+        frame = str(Ether()/IP(src='8.8.8.8', dst='10.0.2.15')/UDP(sport=53, dport=3333)/
+                    Raw(load='dns'))
+        pkt = Packet_Decoder(decode_udp=True).decode(0, frame)
+        self.assertEqual(pkt.proto, IP_PROTO_UDP)
+        self.assertEqual((pkt.src_pt, pkt.dst_pt), (53, 3333))
+        self.assertEqual(pkt.get_payload(), 'dns')
+
+    def test_truncated_frame_is_ignored(self):
+        frame = str(Ether()/IP(dst='1.2.3.4')/self.tcp)
+        self.assertIsNone(Packet_Decoder().decode(0, frame[:40]))
+
+    def test_both_directions_in_same_shard(self):
+        to_svr = str(Ether()/IP(src='10.0.2.15', dst='1.2.3.4')/TCP(sport=44071, dport=443))
+        to_cli = str(Ether()/IP(src='1.2.3.4', dst='10.0.2.15')/TCP(sport=443, dport=44071))
+        decoder = Packet_Decoder()
+        self.assertEqual(decoder.get_shard(to_svr, 8), decoder.get_shard(to_cli, 8))
+        udp = str(Ether()/IP(dst='1.2.3.4')/UDP())
+        self.assertIsNone(decoder.get_shard(udp, 8))
+        self.assertIsNotNone(Packet_Decoder(decode_udp=True).get_shard(udp, 8))
+
+    def test_unsupported_link_type_raises_value_error(self):
+        self.assertRaises(ValueError, Packet_Decoder, 12345)
+
+
+if __name__ == '__main__':
+    unittest.main()
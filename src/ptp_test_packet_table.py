@@ -0,0 +1,38 @@
+import unittest
+from ptp_packet_table import Packet_Table
+from ptp_packet_decoder import Packet_Decoder
+from scapy.all import Ether, IP, TCP, Raw
+
+
+class Test_Packet_Table(unittest.TestCase):
+    """Unit tests for PTP Packet_Table class"""
+
+    def setUp(self):
+        decoder = Packet_Decoder()
+        pkts = []
+        for ts, seq, load in [(3.0, 300, 'ccc'), (1.0, 100, 'a'), (2.0, 200, 'bb')]:
+            frame = str(Ether()/IP(src='10.0.2.15', dst='1.2.3.4')/
+                        TCP(sport=1234, dport=443, seq=seq)/Raw(load=load))
+            pkts.append(decoder.decode(ts, frame))
+        self.table = Packet_Table.from_packets(pkts)
+
+    def test_endpoints_come_from_packets(self):
+        table = self.table
+        self.assertEqual((table.src_ip, table.src_pt, table.dst_ip, table.dst_pt),
+                         ('10.0.2.15', 1234, '1.2.3.4', 443))
+
+    def test_payload_size_is_sum_of_payload_lengths(self):
+        self.assertEqual(self.table.get_payload_size(), 6)
+
+    def test_start_and_end_ts(self):
+        self.assertEqual(self.table.get_start_and_end_ts(), (1.0, 3.0))
+
+    def test_select_keeps_given_rows(self):
+        selected = self.table.select([2, 0])
+        self.assertEqual(len(selected), 2)
+        self.assertEqual(selected[0].seq, 200)
+        self.assertEqual(selected[1].seq, 300)
+
+
+if __name__ == '__main__':
+    unittest.main()
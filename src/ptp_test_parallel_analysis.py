@@ -0,0 +1,38 @@
+import unittest
+from ptp_parallel_analysis import Parallel_Analysis, to_record
+from ptp_session_reassembler import Session_Reassembler
+from ptp_hostname_index import Hostname_Index
+from ptp_analysis_job import Analysis_Progress
+
+
+class Test_Parallel_Analysis(unittest.TestCase):
+    """Unit tests for PTP Parallel_Analysis class"""
+
+    def serial_records(self, pcap):
+        reassembler = Session_Reassembler(pcap)
+        pairs = reassembler.get_session_pairs()
+        records = sorted(to_record(pair.get_stream_status()) for pair in pairs.itervalues())
+        return records, reassembler.get_hostname_index()
+
+    def test_results_match_single_process(self):
+        for pcap in ['test-pcap-files/ssl-test.pcap', 'test-pcap-files/test1.pcap']:
+            expected, expected_index = self.serial_records(pcap)
+            progress = Analysis_Progress()
+            hostname_index = Hostname_Index()
+            statuses = Parallel_Analysis(pcap, num_processes=3).run(progress, hostname_index)
+            self.assertEqual(sorted(to_record(status) for status in statuses), expected)
+            self.assertEqual(progress.flows_analysed, len(expected))
+            self.assertEqual(sorted(hostname_index.get_entries()),
+                             sorted(expected_index.get_entries()))
+
+    def test_several_files_analysed_as_one_capture(self):
+        pcaps = ['test-pcap-files/ssl-test.pcap', 'test-pcap-files/test1.pcap']
+        expected = []
+        for pcap in pcaps:
+            expected.extend(self.serial_records(pcap)[0])
+        statuses = Parallel_Analysis(pcaps, num_processes=2).run()
+        self.assertEqual(sorted(to_record(status) for status in statuses), sorted(expected))
+
+
+if __name__ == '__main__':
+    unittest.main()
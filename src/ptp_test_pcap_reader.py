@@ -0,0 +1,56 @@
+import unittest
+import os
+import tempfile
+from ptp_pcap_reader import Pcap_Reader
+from ptp_constants import Constants
+from scapy.all import rdpcap
+
+
+class Test_Pcap_Reader(unittest.TestCase):
+    """Unit tests for PTP Pcap_Reader class"""
+
+    def setUp(self):
+        self.pcap = Constants().TEST_PCAP_DIR + '/ssl-test.pcap'
+
+    def test_reads_same_number_of_packets_as_rdpcap(self):
+        with Pcap_Reader(self.pcap) as reader:
+            num_records = len(list(reader))
+        self.assertEqual(num_records, len(rdpcap(self.pcap)))
+
+    def test_frames_and_timestamps_match_rdpcap(self):
+        pkts = rdpcap(self.pcap)
+        with Pcap_Reader(self.pcap) as reader:
+            for pkt, (ts, offset, frame) in zip(pkts, reader):
+                self.assertEqual(str(frame), str(pkt))
+                self.assertAlmostEqual(ts, float(pkt.time), places=5)
+
+    def test_offset_locates_frame_in_file(self):
+        with Pcap_Reader(self.pcap) as reader:
+            ts, offset, frame = next(iter(reader))
+            self.assertEqual(reader.get_bytes(offset, len(frame)), str(frame))
+
+    def test_link_type_is_ethernet(self):
+        with Pcap_Reader(self.pcap) as reader:
+            self.assertEqual(reader.get_link_type(), 1)
+
+    def test_empty_file_yields_no_records(self):
+        fd, filename = tempfile.mkstemp(suffix='.pcap')
+        os.close(fd)
+        try:
+            with Pcap_Reader(filename) as reader:
+                self.assertEqual(list(reader), [])
+        finally:
+            os.remove(filename)
+
+    def test_non_pcap_file_raises_value_error(self):
+        fd, filename = tempfile.mkstemp(suffix='.pcap')
+        os.write(fd, b'x' * 100)
+        os.close(fd)
+        try:
+            self.assertRaises(ValueError, Pcap_Reader, filename)
+        finally:
+            os.remove(filename)
+
+
+if __name__ == '__main__':
+    unittest.main()
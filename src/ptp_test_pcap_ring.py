@@ -0,0 +1,72 @@
+import unittest
+import os
+import shutil
+import tempfile
+from ptp_pcap_ring import Pcap_Ring
+from ptp_pcap_reader import Pcap_Reader
+
+
+class Test_Pcap_Ring(unittest.TestCase):
+    """Unit tests for PTP Pcap_Ring class"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.frame = 'x' * 84    # 100 bytes with its record header
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_ring(self, timestamps, **kwargs):
+        with Pcap_Ring(self.directory, 1, **kwargs) as ring:
+            for ts in timestamps:
+                ring.write(ts, 0, self.frame)
+
+    def test_oldest_segments_deleted(self):
+        self.write_ring(range(1000, 1020), num_segments=3, max_bytes=224)
+        segments = Pcap_Ring.read_index(self.directory)
+        self.assertEqual([segment['seq'] for segment in segments], [7, 8, 9])
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ['index.json', 'segment-000007.pcap', 'segment-000008.pcap',
+                          'segment-000009.pcap'])
+        self.assertEqual([(segment['ts_first'], segment['ts_last'], segment['num_packets'])
+                          for segment in segments],
+                         [(1014, 1015, 2), (1016, 1017, 2), (1018, 1019, 2)])
+
+    def test_segments_hold_their_packets(self):
+        self.write_ring(range(1000, 1010), max_seconds=4)
+        num_packets = 0
+        for segment in Pcap_Ring.read_index(self.directory):
+            with Pcap_Reader(os.path.join(self.directory, segment['filename'])) as reader:
+                timestamps = [ts for ts, offset, frame in reader]
+            self.assertEqual(timestamps[0], segment['ts_first'])
+            self.assertEqual(timestamps[-1], segment['ts_last'])
+            self.assertTrue(timestamps[-1] - timestamps[0] < 4)
+            num_packets += len(timestamps)
+        self.assertEqual(num_packets, 10)
+
+    def test_find_segments_covering_window(self):
+        self.write_ring(range(1000, 1010), max_seconds=4)
+        find = lambda start, end: [os.path.basename(filename) for filename in
+                                   Pcap_Ring.find_segments(self.directory, start, end)]
+        self.assertEqual(find(1005, 1006), ['segment-000001.pcap'])
+        self.assertEqual(find(1003, 1008), ['segment-000000.pcap', 'segment-000001.pcap',
+                                              'segment-000002.pcap'])
+        self.assertEqual(find(1009, None), ['segment-000002.pcap'])
+        self.assertEqual(find(2000, None), [])
+
+    def test_flush_updates_index(self):
+        ring = Pcap_Ring(self.directory, 1)
+        ring.write(1000, 0, self.frame)
+        ring.flush()
+        self.assertEqual(len(Pcap_Ring.find_segments(self.directory)), 1)
+        ring.close()
+
+    def test_carries_on_from_existing_ring(self):
+        self.write_ring([1000, 1001], max_seconds=1)
+        self.write_ring([1002], max_seconds=1)
+        self.assertEqual([segment['seq'] for segment in Pcap_Ring.read_index(self.directory)],
+                         [0, 1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
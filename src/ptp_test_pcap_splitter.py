@@ -0,0 +1,59 @@
+import unittest
+import shutil
+import struct
+import tempfile
+from ptp_pcap_splitter import Pcap_Splitter
+from ptp_pcap_reader import Pcap_Reader
+from ptp_session_reassembler import Session_Reassembler
+from ptp_analysis_job import Analysis_Progress
+
+
+class Test_Pcap_Splitter(unittest.TestCase):
+    """Unit tests for PTP Pcap_Splitter class"""
+
+    def setUp(self):
+        self.pcap = 'test-pcap-files/ssl-test.pcap'
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_shards_hold_whole_flows(self):
+        shard_filenames = Pcap_Splitter([self.pcap], 3, self.directory).split()
+        self.assertEqual(len(shard_filenames), 3)
+        quads = set()
+        for shard_filename in shard_filenames:
+            pairs = Session_Reassembler(shard_filename).get_session_pairs()
+            self.assertFalse(quads.intersection(pairs))
+            quads.update(pairs)
+        self.assertEqual(quads, set(Session_Reassembler(self.pcap).get_session_pairs()))
+
+    def test_records_copied_in_order(self):
+        shard_filenames = Pcap_Splitter([self.pcap], 2, self.directory).split()
+        with Pcap_Reader(self.pcap) as reader:
+            original = [(ts, str(frame)) for ts, offset, frame in reader]
+        for shard_filename in shard_filenames:
+            with Pcap_Reader(shard_filename) as reader:
+                copied = [(ts, str(frame)) for ts, offset, frame in reader]
+            positions = [original.index(record) for record in copied]
+            self.assertEqual(positions, sorted(positions))
+
+    def test_counts_packets_of_all_files(self):
+        progress = Analysis_Progress()
+        Pcap_Splitter([self.pcap, self.pcap], 2, self.directory).split(progress)
+        with Pcap_Reader(self.pcap) as reader:
+            self.assertEqual(progress.packets_read, 2 * len(list(reader)))
+
+    def test_different_link_types_rejected(self):
+        other = self.directory + '/raw.pcap'
+        with open(self.pcap, 'rb') as f:
+            header = f.read(Pcap_Reader.GLOBAL_HEADER_LEN)
+        with open(other, 'wb') as f:
+            f.write(header[:20] + struct.pack('<I', 101))
+            f.write(struct.pack('<IIII', 0, 0, 0, 0))
+        splitter = Pcap_Splitter([self.pcap, other], 2, self.directory)
+        self.assertRaises(ValueError, splitter.split)
+
+
+if __name__ == '__main__':
+    unittest.main()
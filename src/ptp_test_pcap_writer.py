@@ -0,0 +1,46 @@
+import unittest
+import os
+import tempfile
+from ptp_pcap_writer import Pcap_Writer
+from ptp_pcap_reader import Pcap_Reader
+from ptp_constants import Constants
+
+
+class Test_Pcap_Writer(unittest.TestCase):
+    """Unit tests for PTP Pcap_Writer class"""
+
+    def setUp(self):
+        fd, self.filename = tempfile.mkstemp(suffix='.pcap')
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def test_copy_reads_back_the_same(self):
+        pcap = Constants().TEST_PCAP_DIR + '/ssl-test.pcap'
+        with Pcap_Reader(pcap) as reader:
+            original = [(ts, str(frame)) for ts, offset, frame in reader]
+            with Pcap_Writer(self.filename, reader.get_link_type()) as writer:
+                for ts, frame in original:
+                    writer.write(int(ts), int(round((ts % 1) * 1e6)), frame)
+        with Pcap_Reader(self.filename) as reader:
+            self.assertEqual(reader.get_link_type(), 1)
+            copy = [(ts, str(frame)) for ts, offset, frame in reader]
+        self.assertEqual([frame for ts, frame in copy], [frame for ts, frame in original])
+        for (ts, _), (original_ts, _) in zip(copy, original):
+            self.assertAlmostEqual(ts, original_ts, places=5)
+
+    def test_records_visible_after_flush(self):
+        writer = Pcap_Writer(self.filename, 1)
+        writer.write(1, 2, 'x' * 60)
+        with Pcap_Reader(self.filename) as reader:
+            self.assertEqual(list(reader), [])
+        writer.flush()
+        with Pcap_Reader(self.filename) as reader:
+            self.assertEqual([str(frame) for ts, offset, frame in reader], ['x' * 60])
+        writer.close()
+        self.assertEqual(writer.num_written, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
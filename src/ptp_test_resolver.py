@@ -0,0 +1,91 @@
+import unittest
+import socket
+import threading
+import time
+from ptp_resolver import Resolver
+
+
+class Fake_Lookup(object):
+    """Stands in for socket.gethostbyaddr, with a delay per lookup"""
+
+    def __init__(self, names, delay=0.0):
+        self.names = names
+        self.delay = delay
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, ip_addr):
+        with self._lock:
+            self.calls.append(ip_addr)
+        time.sleep(self.delay)
+        if ip_addr not in self.names:
+            raise socket.herror(1, 'Unknown host')
+        return (self.names[ip_addr], [], [ip_addr])
+
+
+class Test_Resolver(unittest.TestCase):
+    """Unit tests for PTP Resolver class"""
+
+    NAMES = {'1.1.1.1': 'one.example.com', '2.2.2.2': 'two.example.com'}
+
+    def test_resolve_all_looks_up_each_address_once(self):
+        lookup = Fake_Lookup(self.NAMES)
+        resolver = Resolver(lookup=lookup)
+        names = resolver.resolve_all(['1.1.1.1', '2.2.2.2', '1.1.1.1', '3.3.3.3'])
+        self.assertEqual(names, {'1.1.1.1': 'one.example.com',
+                                 '2.2.2.2': 'two.example.com',
+                                 '3.3.3.3': '3.3.3.3'})
+        self.assertEqual(sorted(lookup.calls), ['1.1.1.1', '2.2.2.2', '3.3.3.3'])
+
+    def test_lookups_run_concurrently(self):
+        lookup = Fake_Lookup(self.NAMES, delay=0.2)
+        resolver = Resolver(num_threads=4, lookup=lookup)
+        start = time.time()
+        resolver.resolve_all(['1.1.1.1', '2.2.2.2', '3.3.3.3', '4.4.4.4'])
+        self.assertLess(time.time() - start, 0.6)
+
+    def test_cached_answer_is_reused(self):
+        lookup = Fake_Lookup(self.NAMES)
+        resolver = Resolver(lookup=lookup)
+        resolver.resolve('1.1.1.1')
+        self.assertEqual(resolver.resolve('1.1.1.1'), 'one.example.com')
+        self.assertEqual(lookup.calls, ['1.1.1.1'])
+
+    def test_expired_answer_is_looked_up_again(self):
+        lookup = Fake_Lookup(self.NAMES)
+        resolver = Resolver(ttl=0.0, lookup=lookup)
+        resolver.resolve('1.1.1.1')
+        resolver.resolve('1.1.1.1')
+        self.assertEqual(lookup.calls, ['1.1.1.1', '1.1.1.1'])
+
+    def test_slow_lookup_returns_address_then_fills_in(self):
+        lookup = Fake_Lookup(self.NAMES, delay=0.3)
+        resolver = Resolver(lookup=lookup)
+        self.assertEqual(resolver.resolve('1.1.1.1', timeout=0.05), '1.1.1.1')
+        self.assertEqual(resolver.get_cached(['1.1.1.1']), {})
+        time.sleep(0.4)
+        self.assertEqual(resolver.get_cached(['1.1.1.1']), {'1.1.1.1': 'one.example.com'})
+
+    def test_least_recently_used_entry_is_evicted(self):
+        lookup = Fake_Lookup(self.NAMES)
+        resolver = Resolver(max_entries=1, lookup=lookup)
+        resolver.resolve('1.1.1.1')
+        resolver.resolve('2.2.2.2')
+        self.assertEqual(resolver.get_cached(['1.1.1.1', '2.2.2.2']),
+                         {'2.2.2.2': 'two.example.com'})
+
+    def test_unexpected_lookup_error_is_a_failed_lookup(self):
+        def lookup(ip_addr):
+            if ip_addr == '3.3.3.3':
+                raise ValueError("not an address")
+            return Fake_Lookup(self.NAMES)(ip_addr)
+        resolver = Resolver(num_threads=1, lookup=lookup)
+        started = time.time()
+        self.assertEqual(resolver.resolve('3.3.3.3', timeout=5), '3.3.3.3')
+        self.assertLess(time.time() - started, 1)
+        # the worker carries on
+        self.assertEqual(resolver.resolve('1.1.1.1', timeout=5), 'one.example.com')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -14,11 +14,11 @@ class Test_Session_Pair(unittest.TestCase):
         
     def setUp(self):
         self.pcap = 'test-pcap-files/ssl-test.pcap'
-        cli_ip, cli_pt, svr_ip, svr_pt = ('10.0.2.15', '55083', '104.25.157.13', '443')
+        cli_ip, cli_pt, svr_ip, svr_pt = ('10.0.2.15', 55083, '104.25.157.13', 443)
         self.stream_with_ssl_handshake = (cli_ip, cli_pt, svr_ip, svr_pt) 
-        cli_ip, cli_pt, svr_ip, svr_pt = ('10.0.2.15', '47769', '52.95.132.37', '443')
+        cli_ip, cli_pt, svr_ip, svr_pt = ('10.0.2.15', 47769, '52.95.132.37', 443)
         self.stream_without_ssl_handshake = (cli_ip, cli_pt, svr_ip, svr_pt) 
-        cli_ip, cli_pt, svr_ip, svr_pt = ('10.0.2.15', '33074', '216.58.206.33', '80')
+        cli_ip, cli_pt, svr_ip, svr_pt = ('10.0.2.15', 33074, '216.58.206.33', 80)
         self.stream_using_http = (cli_ip, cli_pt, svr_ip, svr_pt) 
 
     def tearDown(self):
@@ -1,78 +1,121 @@
 import unittest
+import Queue
+import time
 from ptp_session_reassembler import Session_Reassembler
-from scapy.all import rdpcap, PacketList, Ether, IP, TCP, Raw
+from ptp_pcap_reader import Pcap_Reader
+from ptp_packet_decoder import Packet_Decoder
+from ptp_constants import Constants, Is_Encrypted_Enum
+from ptp_analysis_job import Analysis_Progress
 
 
 class Test_Session_Reassembler(unittest.TestCase):
     """Unit tests for PTP Session_Reassembler class"""
 
-    def test_only_duplicate_ack_removed(self):
-        """Given a PacketList with three packets, only the duplicate should be removed.
-        The other two should remain.
-        Duplicates: a pair of ACK packets (ACK flag set, same SEQ and ACK numbers)
-        Other: SYN packet (SYN flag set)
-        """
-        non_dup = Ether()/IP()/TCP(flags='S', seq=0, ack=0)
-        ack1 = Ether()/IP()/TCP(flags='A', seq=1, ack=1)
-        ack2 = Ether()/IP()/TCP(flags='A', seq=1, ack=1)
-        pkts = PacketList([non_dup, ack1, ack2])        
-        sr = Session_Reassembler()
-        deduped_pkts = sr._remove_duplicate_packets(pkts)
-        self.assertTrue(deduped_pkts[0][TCP].flags == 'S') 
-        self.assertTrue(len(deduped_pkts) == 2)
-
-    def test_only_duplicate_data_removed(self):
-        """Given a PacketList with three packets, only the duplicate should be removed.
-        The other two should remain.
-        Duplicates: a pair of data packets (PUSH and ACK flags set, same SEQ and ACK numbers)
-        Other: SYN packet (SYN flag set)
-        """
-        non_dup = Ether()/IP()/TCP(flags='S', seq=0, ack=0)
-        data1 = Ether() \
-                /IP() \
-                /TCP(flags='PA', seq=10, ack=11, chksum=0xccfe ) \
-                /Raw(load='abc') 
-        data2 = Ether() \
-                /IP() \
-                /TCP(flags='PA', seq=10, ack=11, chksum=0xccfe ) \
-                /Raw(load='abc') 
-        pkts = PacketList([non_dup, data1, data2])        
-        sr = Session_Reassembler()
-        deduped_pkts = sr._remove_duplicate_packets(pkts)
-        self.assertTrue(deduped_pkts[0][TCP].flags == 'S') 
-        self.assertTrue(len(deduped_pkts) == 2)
-
-
-    def test_only_duplicate_syn_removed(self):
-        """Given a PacketList with three packets, only the duplicate should be removed.
-        The other two should remain.
-        Duplicates: a pair of SYN packets (SYN flag set, same SEQ and ACK numbers)
-        Other: ACK packet (ACK flag set)
-        """
-        syn1 = Ether()/IP()/TCP(flags='S', seq=0, ack=0)
-        syn2 = Ether()/IP()/TCP(flags='S', seq=0, ack=0)
-        non_dup = Ether()/IP()/TCP(flags='A', seq=1, ack=1)
-        pkts = PacketList([syn1, syn2, non_dup])        
-        sr = Session_Reassembler()
-        deduped_pkts = sr._remove_duplicate_packets(pkts)
-        self.assertTrue(deduped_pkts[-1][TCP].flags == 'A') 
-        self.assertTrue(len(deduped_pkts) == 2)
-
-
-    def test_only_duplicate_synack_removed(self):
-        """Given a PacketList with three packets, only the duplicate should be removed.
-        The other two should remain.
-        Duplicates: a pair of SYN/ACK packets (SYN and ACK flag set, same SEQ and ACK numbers)
-        Other: ACK packet (ACK flag set)
+    def setUp(self):
+        self.pcap = 'test-pcap-files/ssl-test.pcap'
+        self.stream_with_ssl_handshake = ('10.0.2.15', 55083, '104.25.157.13', 443)
+
+    def queue_packets(self, packet_queue):
+        """Queues the packets of the PCAP file as the Sniffer would have,
+        i.e. without its stop packet.
+
+        Returns:
+            int: number of packets queued
         """
-        synack1 = Ether()/IP()/TCP(flags='SA', seq=0, ack=1)
-        synack2 = Ether()/IP()/TCP(flags='SA', seq=0, ack=1)
-        non_dup = Ether()/IP()/TCP(flags='A', seq=10, ack=11)
-        pkts = PacketList([synack1, synack2, non_dup])        
-        sr = Session_Reassembler()
-        deduped_pkts = sr._remove_duplicate_packets(pkts)
-        self.assertTrue(deduped_pkts[-1][TCP].flags == 'A') 
-        self.assertTrue(len(deduped_pkts) == 2)
+        kill_pkt_ip = Constants().KILL_PKT_IP
+        num_queued = 0
+        with Pcap_Reader(self.pcap) as reader:
+            decode = Packet_Decoder(reader.get_link_type()).decode
+            for ts, offset, frame in reader:
+                pkt = decode(ts, frame)
+                if pkt is not None and pkt.dst_ip != kill_pkt_ip:
+                    # pcapy hands the Sniffer its own copy of each frame
+                    pkt.frame = str(frame)
+                    packet_queue.put(pkt)
+                    num_queued += 1
+        return num_queued
+
+    def statuses(self, session_pairs):
+        return dict((quad, pair.get_stream_status().ssl_status.is_encrypted)
+                    for quad, pair in session_pairs.iteritems())
+
+    def test_live_results_match_pcap_file_results(self):
+        packet_queue = Queue.Queue()
+        reassembler = Session_Reassembler()
+        reassembler.start_live(packet_queue)
+        self.queue_packets(packet_queue)
+        packet_queue.put(None)
+        reassembler.stop_live()
+        self.assertFalse(reassembler.is_live())
+
+        expected = self.statuses(Session_Reassembler(self.pcap).get_session_pairs())
+        self.assertEqual(self.statuses(reassembler.get_session_pairs()), expected)
+
+    def test_live_results_kept_when_finished_flows_are_released(self):
+        packet_queue = Queue.Queue()
+        reassembler = Session_Reassembler()
+        reassembler._const.LIVE_SWEEP_INTERVAL = 0
+        reassembler._const.LIVE_FLOW_LINGER = 0
+        reassembler.start_live(packet_queue)
+        self.queue_packets(packet_queue)
+        packet_queue.put(None)
+        reassembler.stop_live()
+
+        def summaries(session_pairs):
+            return dict((quad, (status.ssl_status.is_encrypted, status.tcp_status.bytes_to_cli,
+                                status.tcp_status.bytes_to_svr))
+                        for quad, status in ((quad, pair.get_stream_status())
+                                             for quad, pair in session_pairs.iteritems()))
+        live = reassembler.get_session_pairs()
+        self.assertEqual(summaries(live),
+                         summaries(Session_Reassembler(self.pcap).get_session_pairs()))
+        # the closed connections' packets were let go of
+        self.assertLess(len(reassembler._live_flow_table), len(live))
+
+    def test_live_verdicts_are_published(self):
+        packet_queue = Queue.Queue()
+        reassembler = Session_Reassembler()
+        reassembler.start_live(packet_queue)
+        self.queue_packets(packet_queue)
+        packet_queue.put(None)
+        reassembler.stop_live()
+
+        feed = reassembler.get_verdict_feed()
+        self.assertTrue(feed.is_closed())
+        events, next_seq = feed.get_batch(0, coalesce=0)
+        verdicts = dict(((e['cli_ip'], e['cli_pt'], e['svr_ip'], e['svr_pt']), e['is_encrypted'])
+                        for e in events)
+        # every connection once, with its final verdict
+        self.assertEqual(len(events), len(verdicts))
+        self.assertEqual(verdicts, self.statuses(reassembler.get_session_pairs()))
+        self.assertEqual(verdicts[self.stream_with_ssl_handshake], Is_Encrypted_Enum.YES)
+
+    def test_progress_counts_packets_read(self):
+        with Pcap_Reader(self.pcap) as reader:
+            num_frames = sum(1 for frame in reader)
+        progress = Analysis_Progress()
+        Session_Reassembler(self.pcap).get_session_pairs(progress)
+        self.assertEqual(progress.packets_read, num_frames)
+
+    def test_results_available_during_capture(self):
+        packet_queue = Queue.Queue()
+        reassembler = Session_Reassembler()
+        reassembler.start_live(packet_queue)
+        num_queued = self.queue_packets(packet_queue)
+        progress = Analysis_Progress()
+        deadline = time.time() + 10
+        # packets_read only counts packets whose results are in
+        session_pairs = reassembler.get_session_pairs(progress)
+        while progress.packets_read < num_queued and time.time() < deadline:
+            time.sleep(0.01)
+            session_pairs = reassembler.get_session_pairs(progress)
+        self.assertEqual(progress.packets_read, num_queued)
+        statuses = self.statuses(session_pairs)
+        self.assertEqual(statuses[self.stream_with_ssl_handshake], Is_Encrypted_Enum.YES)
+        self.assertIn(Is_Encrypted_Enum.UNASSESSED, statuses.values())
+        packet_queue.put(None)
+        reassembler.stop_live()
+
 
 if __name__ == '__main__':
     unittest.main()
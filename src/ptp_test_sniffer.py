@@ -4,6 +4,7 @@ logging.getLogger("scapy.runtime").setLevel(logging.ERROR)
 from scapy.all import Ether, IP, TCP, sendp, rdpcap, Raw, PacketList, PPP
 import unittest
 import os
+import Queue
 
 class Test_Sniffer(unittest.TestCase):
 
@@ -39,6 +40,17 @@ class Test_Sniffer(unittest.TestCase):
     def test_no_pcap_file_if_sniffer_has_not_run(self):
         self.assertFalse(self.sniffer.pcap_file_exists())
 
+    def test_queue_is_ended_and_error_kept_if_capture_cannot_start(self):
+        packet_queue = Queue.Queue()
+        sniffer = Sniffer(pcap_filename=None, packet_queue=packet_queue)
+        def fail_to_open(*args):
+            raise IOError("no such interface")
+        sniffer._open_capture = fail_to_open
+        sniffer.start()
+        self.assertIsNone(packet_queue.get(timeout=5))
+        sniffer.stop()
+        self.assertEqual(sniffer.error, "IOError: no such interface")
+
     def test_sniffer_detects_correct_number_of_packets(self):
         num_packets = 100000
         pcap_filename = 'test-pcap-files/sniffer_test.pcap'
@@ -62,17 +74,6 @@ class Test_Sniffer(unittest.TestCase):
         debug_msg = 'num_packets_sniffed: {}'.format(num_packets_sniffed)
         self.assertEqual(num_packets_sniffed, num_packets, msg=debug_msg)
 
-        
-
-
-
-'''
-    def test_test_packet_sent_and_received(self):
-        self.sniffer.start()
-        Packet_Sender().send_test_packet()
-        self.sniffer.stop()
-'''
-
 
 if __name__ == '__main__':
     unittest.main()
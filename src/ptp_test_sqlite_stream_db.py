@@ -0,0 +1,180 @@
+import unittest
+import os
+import shutil
+import sqlite3
+import tempfile
+from datetime import datetime
+from ptp_sqlite_stream_db import SQLite_Stream_DB
+from ptp_connection_status import Stream_Status, TCP_Status, SSL_Status
+from ptp_constants import Is_Encrypted_Enum
+
+
+def stream_status(svr_ip='93.184.216.34', bytes_to_cli=1000, is_encrypted=Is_Encrypted_Enum.YES,
+                  ssl_cipher='TLS_ECDHE_RSA_WITH_AES_128_GCM_SHA256'):
+    tcp_status = TCP_Status(cli_ip='10.8.0.2', cli_pt=50000, svr_ip=svr_ip, svr_pt=443,
+                            bytes_to_svr=100, bytes_to_cli=bytes_to_cli,
+                            ts_first_pkt=1500000000.5, ts_last_pkt=1500000010.5)
+    ssl_status = SSL_Status(ssl_cli_hello=True, ssl_cli_ccs=True, ssl_svr_hello=True,
+                            ssl_version='TLS 1.2', ssl_cipher=ssl_cipher, ssl_svr_ccs=True,
+                            is_encrypted=is_encrypted)
+    return Stream_Status(tcp_status=tcp_status, ssl_status=ssl_status)
+
+
+class Test_SQLite_Stream_DB(unittest.TestCase):
+    """Unit tests for PTP SQLite_Stream_DB class"""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.db = SQLite_Stream_DB(filename=os.path.join(self.dir, 'ptp.db'))
+        self.db.create_table_captures()
+        self.db.create_table_streams()
+        self.capture_id = self.db.create_capture('sniffed.pcap')
+
+    def tearDown(self):
+        self.db._pool.close_all()
+        shutil.rmtree(self.dir)
+
+    def all_streams(self, capture_id):
+        return [row for page in self.db.iter_stream_pages(capture_id) for row in page]
+
+    def test_persist_and_select_streams(self):
+        stored = self.db.persist_streams(self.capture_id,
+                                         [stream_status(bytes_to_cli=10),
+                                          stream_status(svr_ip='2001:db8::1', bytes_to_cli=20,
+                                                        is_encrypted=Is_Encrypted_Enum.NO)])
+        self.assertEqual(stored, 2)
+        rows = self.all_streams(self.capture_id)
+        self.assertEqual([row[1:] for row in rows],
+                         [('2001:db8::1', 100, 20, 'No'), ('93.184.216.34', 100, 10, 'Yes')])
+
+    def test_details_rows(self):
+        self.db.persist_streams(self.capture_id, [stream_status()])
+        conn_id = self.all_streams(self.capture_id)[0][0]
+        self.assertEqual(self.db.get_encryption_details_row(conn_id),
+                         ('Yes', 'TLS 1.2', 'TLS_ECDHE_RSA_WITH_AES_128_GCM_SHA256'))
+        row = self.db.get_connection_details_row(conn_id)
+        self.assertEqual(row[:4], ('10.8.0.2', 50000, '93.184.216.34', 443))
+        self.assertIsInstance(row[4], datetime)
+
+    def test_quotes_in_values_are_stored(self):
+        self.db.persist_streams(self.capture_id, [stream_status(ssl_cipher="it's \"quoted\"")])
+        conn_id = self.all_streams(self.capture_id)[0][0]
+        self.assertEqual(self.db.get_encryption_details_row(conn_id)[2], "it's \"quoted\"")
+
+    def test_batches_and_delete_streams(self):
+        stored = self.db.persist_streams(self.capture_id,
+                                         (stream_status(bytes_to_cli=i) for i in range(25)),
+                                         batch_size=10)
+        self.assertEqual(stored, 25)
+        self.assertEqual(len(self.all_streams(self.capture_id)), 25)
+        self.assertEqual(self.db.get_capture(self.capture_id)[3], 25)
+        self.db.delete_streams(self.capture_id)
+        self.assertEqual(self.all_streams(self.capture_id), [])
+        self.assertEqual(self.db.get_capture(self.capture_id)[3], 0)
+
+    def test_failed_insert_raises(self):
+        self.db.drop_table_streams()
+        with self.assertRaises(sqlite3.OperationalError):
+            self.db.persist_streams(self.capture_id, [stream_status()])
+        self.assertEqual(self.db.get_capture(self.capture_id)[3], 0)
+
+    def test_captures_are_kept_apart(self):
+        other_capture_id = self.db.create_capture()
+        self.db.persist_streams(self.capture_id, [stream_status()])
+        self.db.persist_streams(other_capture_id, [stream_status(), stream_status()])
+        self.assertEqual(len(self.all_streams(self.capture_id)), 1)
+        self.assertEqual(len(self.all_streams(other_capture_id)), 2)
+        self.assertEqual(self.db.get_capture(other_capture_id)[3], 2)
+
+    def test_delete_old_captures(self):
+        capture_ids = [self.capture_id] + [self.db.create_capture() for i in range(3)]
+        for capture_id in capture_ids:
+            self.db.persist_streams(capture_id, [stream_status()])
+        self.assertEqual(self.db.delete_old_captures(num_kept=2), 2)
+        self.assertEqual([self.db.get_capture(capture_id) is not None
+                          for capture_id in capture_ids], [False, False, True, True])
+        self.assertEqual(self.all_streams(capture_ids[1]), [])
+        self.assertEqual(len(self.all_streams(capture_ids[3])), 1)
+        self.assertEqual(self.db.delete_old_captures(num_kept=2), 0)
+        self.db.compact()
+
+    def test_pages_follow_sort_order(self):
+        statuses = [stream_status(svr_ip='10.0.0.%d' % (i % 4), bytes_to_cli=i % 3,
+                                  is_encrypted=Is_Encrypted_Enum.YES if i % 2 else Is_Encrypted_Enum.NO)
+                    for i in range(11)]
+        self.db.persist_streams(self.capture_id, statuses)
+        self.db.persist_streams(self.db.create_capture(), statuses)
+        rows = self.all_streams(self.capture_id)
+        for sort_by, col in SQLite_Stream_DB.SORT_COLUMNS.items():
+            for descending in [True, False]:
+                pages = list(self.db.iter_stream_pages(self.capture_id, sort_by, descending,
+                                                       page_size=3))
+                self.assertEqual([len(page) for page in pages], [3, 3, 3, 2])
+                expected = sorted(rows, key=lambda row: (row[col], row[0]), reverse=descending)
+                self.assertEqual([row for page in pages for row in page], expected)
+
+    def test_unknown_sort_column(self):
+        with self.assertRaises(ValueError):
+            self.db.select_streams_page(self.capture_id, sort_by='ssl_cipher')
+
+    def test_capture_version_changes_with_streams(self):
+        self.assertEqual(self.db.get_capture(self.capture_id)[3:], (0, 0, 0))
+        self.db.persist_streams(self.capture_id, [stream_status()])
+        conn_id = self.all_streams(self.capture_id)[0][0]
+        version = self.db.get_capture(self.capture_id)[4]
+        self.assertGreater(version, 0)
+        self.assertEqual(self.db.get_stream_version(conn_id), (self.capture_id, version, 0))
+        self.db.delete_streams(self.capture_id)
+        self.assertGreater(self.db.get_capture(self.capture_id)[4], version)
+        self.assertIsNone(self.db.get_stream_version(conn_id))
+        self.db.set_capture_complete(self.capture_id)
+        self.assertEqual(self.db.get_capture(self.capture_id)[5], 1)
+        self.assertIsNone(self.db.get_capture(self.capture_id + 1))
+
+    def test_migrate_table_streams(self):
+        self.assertFalse(self.db.migrate_table_streams())
+        # a streams table as made before captures were kept
+        self.db.drop_table_streams()
+        with self.db._pool.connection() as conn:
+            conn.execute("""create table streams (id integer primary key autoincrement,
+                cli_ip text, cli_pt integer, svr_ip text, svr_pt integer,
+                bytes_to_cli integer, bytes_to_svr integer,
+                ts_first_pkt timestamp, ts_last_pkt timestamp,
+                ssl_cli_hello boolean, ssl_cli_ccs boolean, ssl_svr_hello boolean,
+                ssl_version text, ssl_cipher text, ssl_svr_ccs boolean, is_encrypted text )""")
+            conn.execute("""insert into streams (cli_ip, svr_ip, bytes_to_cli, is_encrypted)
+                values ('10.8.0.2', '93.184.216.34', 10, 'Yes')""")
+            conn.commit()
+        self.assertTrue(self.db.migrate_table_streams())
+        capture_id = self.capture_id + 1
+        self.assertEqual(self.db.get_capture(capture_id)[3:], (1, 0, 1))
+        self.assertEqual([row[1:] for row in self.all_streams(capture_id)],
+                         [('93.184.216.34', None, 10, 'Yes')])
+        with self.db._pool.connection() as conn:
+            indexes = conn.execute("""select name from sqlite_master
+                where type = 'index' and tbl_name = 'streams' order by name""").fetchall()
+        self.assertEqual([name for (name,) in indexes],
+                         ['streams_capture_bytes_to_cli', 'streams_capture_is_encrypted',
+                          'streams_capture_svr_ip'])
+        self.db.persist_streams(self.capture_id, [stream_status()])
+        self.assertEqual(len(self.all_streams(self.capture_id)), 1)
+        self.assertFalse(self.db.migrate_table_streams())
+
+    def test_capture_queries_use_indexes(self):
+        with self.db._pool.connection() as conn:
+            for sql in ["SELECT id FROM streams WHERE capture_id = 1 ORDER BY bytes_to_cli DESC",
+                        "SELECT id FROM streams WHERE capture_id = 1 AND "
+                        "(svr_ip > '10.0.0.1' OR (svr_ip = '10.0.0.1' AND id > 5)) "
+                        "ORDER BY svr_ip, id LIMIT 10",
+                        "DELETE FROM streams WHERE capture_id < 5"]:
+                plan = ' '.join(str(row[-1]) for row in conn.execute("EXPLAIN QUERY PLAN " + sql))
+                self.assertRegexpMatches(plan, 'USING (COVERING )?INDEX')
+                self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_wal_mode(self):
+        with self.db._pool.connection() as conn:
+            self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], 'wal')
+
+
+if __name__ == '__main__':
+    unittest.main()
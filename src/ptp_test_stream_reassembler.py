@@ -0,0 +1,71 @@
+import unittest
+from ptp_stream_reassembler import Stream_Reassembler
+from ptp_packet_decoder import TCP_SYN, TCP_ACK, TCP_PSH
+
+
+class Test_Stream_Reassembler(unittest.TestCase):
+    """Unit tests for PTP Stream_Reassembler class"""
+
+    DATA = TCP_PSH | TCP_ACK
+
+    def test_in_order_segments(self):
+        stream = Stream_Reassembler()
+        stream.add_segment(999, TCP_SYN, '')
+        self.assertEqual(stream.add_segment(1000, self.DATA, 'abc'), 'abc')
+        self.assertEqual(stream.add_segment(1003, self.DATA, 'def'), 'def')
+        self.assertEqual(stream.get_data(), 'abcdef')
+
+    def test_out_of_order_segment_is_queued_until_hole_filled(self):
+        stream = Stream_Reassembler()
+        stream.add_segment(999, TCP_SYN, '')
+        self.assertEqual(stream.add_segment(1003, self.DATA, 'def'), '')
+        self.assertTrue(stream.has_pending())
+        self.assertEqual(stream.add_segment(1000, self.DATA, 'abc'), 'abcdef')
+        self.assertFalse(stream.has_pending())
+
+    def test_retransmitted_overlap_is_trimmed(self):
+        stream = Stream_Reassembler()
+        stream.add_segment(1000, self.DATA, 'abc')
+        self.assertEqual(stream.add_segment(1000, self.DATA, 'abc'), '')
+        self.assertEqual(stream.add_segment(1001, self.DATA, 'bcdef'), 'def')
+        self.assertEqual(stream.get_data(), 'abcdef')
+
+    def test_sequence_number_wraparound(self):
+        stream = Stream_Reassembler()
+        isn = Stream_Reassembler.SEQ_MOD - 2
+        stream.add_segment(isn - 1, TCP_SYN, '')
+        stream.add_segment(0, self.DATA, 'cd')
+        stream.add_segment(isn, self.DATA, 'ab')
+        self.assertEqual(stream.get_data(), 'abcd')
+
+    def test_segment_before_start_of_stream_is_discarded(self):
+        stream = Stream_Reassembler()
+        stream.add_segment(999, TCP_SYN, '')
+        self.assertEqual(stream.add_segment(990, self.DATA, 'xyz'), '')
+        self.assertEqual(stream.get_next_offset(), 0)
+
+    def test_segment_beyond_window_is_discarded(self):
+        stream = Stream_Reassembler(window=100)
+        stream.add_segment(1000, self.DATA, 'abc')
+        stream.add_segment(2000, self.DATA, 'xyz')
+        self.assertFalse(stream.has_pending())
+
+    def test_hole_is_skipped_when_queue_overflows(self):
+        stream = Stream_Reassembler(max_pending=2)
+        stream.add_segment(1000, self.DATA, 'a')
+        stream.add_segment(1002, self.DATA, 'c')
+        stream.add_segment(1003, self.DATA, 'd')
+        self.assertEqual(stream.add_segment(1004, self.DATA, 'e'), 'cde')
+        self.assertEqual(stream.gaps, [(1, 2)])
+        # only the contiguous prefix counts as stream data
+        self.assertEqual(stream.get_data(), 'a')
+
+    def test_only_max_bytes_kept(self):
+        stream = Stream_Reassembler(max_bytes=4)
+        stream.add_segment(1000, self.DATA, 'abc')
+        self.assertEqual(stream.add_segment(1003, self.DATA, 'def'), 'def')
+        self.assertEqual(stream.get_data(), 'abcd')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+import struct
+from ptp_tls_parser import TLS_Parser
+
+
+def record(content_type, body, version=0x0303):
+    return struct.pack('!BHH', content_type, version, len(body)) + body
+
+
+def handshake(msg_type, body):
+    return struct.pack('!BBH', msg_type, len(body) >> 16, len(body) & 0xffff) + body
+
+
+def server_hello(version=0x0303, cipher=0xcca9, session_id='\x01' * 32, extensions=None):
+    body = struct.pack('!H', version) + '\x00' * 32 + \
+        struct.pack('!B', len(session_id)) + session_id + \
+        struct.pack('!HB', cipher, 0)
+    if extensions is not None:
+        body += struct.pack('!H', len(extensions)) + extensions
+    return handshake(TLS_Parser.SERVER_HELLO, body)
+
+
+def client_hello(server_name):
+    sni = struct.pack('!BH', 0, len(server_name)) + server_name
+    sni = struct.pack('!H', len(sni)) + sni
+    extensions = struct.pack('!HH', 10, 2) + '\x00\x17' + \
+        struct.pack('!HH', 0, len(sni)) + sni
+    body = struct.pack('!H', 0x0303) + '\x00' * 32 + '\x00' + \
+        struct.pack('!H', 4) + '\xcc\xa9\x13\x01' + '\x01\x00' + \
+        struct.pack('!H', len(extensions)) + extensions
+    return handshake(TLS_Parser.CLIENT_HELLO, body)
+
+
+CCS = record(TLS_Parser.CHANGE_CIPHER_SPEC, '\x01')
+
+
+class Test_TLS_Parser(unittest.TestCase):
+    """Unit tests for PTP TLS_Parser class"""
+
+    def test_client_hello_and_ccs(self):
+        parser = TLS_Parser()
+        data = record(TLS_Parser.HANDSHAKE, handshake(TLS_Parser.CLIENT_HELLO, 'x' * 40)) + CCS
+        self.assertEqual(parser.parse(data), len(data))
+        self.assertTrue(parser.is_tls)
+        self.assertEqual(parser.first_handshake_type, TLS_Parser.CLIENT_HELLO)
+        self.assertTrue(parser.ccs_seen)
+
+    def test_server_name_from_client_hello(self):
+        parser = TLS_Parser()
+        parser.parse(record(TLS_Parser.HANDSHAKE, client_hello('www.example.com')))
+        self.assertEqual(parser.server_name, 'www.example.com')
+
+    def test_server_hello_version_cipher_and_encrypted_record(self):
+        parser = TLS_Parser()
+        parser.parse(record(TLS_Parser.HANDSHAKE, server_hello()) + CCS +
+                     record(TLS_Parser.HANDSHAKE, 'encrypted finished'))
+        self.assertEqual(parser.first_handshake_type, TLS_Parser.SERVER_HELLO)
+        self.assertEqual(parser.version, 0x0303)
+        self.assertEqual(parser.cipher, 0xcca9)
+        self.assertTrue(parser.ccs_seen)
+        self.assertTrue(parser.record_after_ccs)
+
+    def test_supported_versions_extension_gives_tls_1_3(self):
+        extensions = struct.pack('!HHH', 43, 2, 0x0304)
+        parser = TLS_Parser()
+        parser.parse(record(TLS_Parser.HANDSHAKE, server_hello(cipher=0x1301, session_id='',
+                                                               extensions=extensions)) +
+                     CCS + record(TLS_Parser.APPLICATION_DATA, 'encrypted'))
+        self.assertEqual(parser.version, TLS_Parser.TLS_1_3)
+        self.assertEqual(parser.cipher, 0x1301)
+        self.assertTrue(parser.record_after_ccs)
+
+    def test_handshake_message_split_over_records(self):
+        msg = server_hello()
+        parser = TLS_Parser()
+        parser.parse(record(TLS_Parser.HANDSHAKE, msg[:10]) + record(TLS_Parser.HANDSHAKE, msg[10:]))
+        self.assertEqual(parser.cipher, 0xcca9)
+
+    def test_partial_record_waits_for_rest_of_stream(self):
+        data = record(TLS_Parser.HANDSHAKE, server_hello()) + CCS
+        parser = TLS_Parser()
+        consumed = parser.parse(data[:20])
+        self.assertEqual(consumed, 0)
+        self.assertIsNone(parser.first_handshake_type)
+        consumed = parser.parse(data[consumed:] if consumed else data)
+        self.assertEqual(consumed, len(data))
+        self.assertTrue(parser.ccs_seen)
+
+    def test_non_tls_stream(self):
+        parser = TLS_Parser()
+        data = 'GET / HTTP/1.1\r\nHost: example.com\r\n\r\n'
+        self.assertEqual(parser.parse(data), len(data))
+        self.assertFalse(parser.is_tls)
+        self.assertIsNone(parser.first_handshake_type)
+
+    def test_stream_must_open_with_handshake_record(self):
+        parser = TLS_Parser()
+        parser.parse(CCS)
+        self.assertFalse(parser.is_tls)
+        self.assertFalse(parser.ccs_seen)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+from ptp_tls_tracker import TLS_Tracker
+from ptp_tls_parser import TLS_Parser
+from ptp_constants import Is_Encrypted_Enum
+from ptp_packet_decoder import TCP_SYN, TCP_ACK, TCP_PSH
+from ptp_test_tls_parser import record, handshake, server_hello, CCS
+
+
+class Test_TLS_Tracker(unittest.TestCase):
+    """Unit tests for PTP TLS_Tracker class"""
+
+    DATA = TCP_PSH | TCP_ACK
+    CLIENT_FLIGHT = record(TLS_Parser.HANDSHAKE, handshake(TLS_Parser.CLIENT_HELLO, 'x' * 40))
+    SERVER_FLIGHT = record(TLS_Parser.HANDSHAKE, server_hello())
+
+    def test_verdict_reached_as_soon_as_handshake_completes(self):
+        tracker = TLS_Tracker(svr_pt=443)
+        tracker.add_segment(True, 999, TCP_SYN, '')
+        tracker.add_segment(False, 4999, TCP_SYN | TCP_ACK, '')
+        tracker.add_segment(True, 1000, self.DATA, self.CLIENT_FLIGHT)
+        self.assertIsNone(tracker.add_segment(False, 5000, self.DATA, self.SERVER_FLIGHT))
+        self.assertIsNone(tracker.add_segment(True, 1000 + len(self.CLIENT_FLIGHT), self.DATA, CCS))
+        verdict = tracker.add_segment(False, 5000 + len(self.SERVER_FLIGHT), self.DATA,
+                                      CCS + record(TLS_Parser.HANDSHAKE, 'encrypted'))
+        self.assertEqual(verdict, Is_Encrypted_Enum.YES)
+        self.assertFalse(tracker.needs_payload(True))
+        self.assertFalse(tracker.needs_payload(False))
+        self.assertEqual(tracker.server.cipher, 0xcca9)
+
+    def test_records_split_and_out_of_order(self):
+        tracker = TLS_Tracker(svr_pt=443)
+        flight = self.CLIENT_FLIGHT + CCS
+        tracker.add_segment(True, 999, TCP_SYN, '')
+        tracker.add_segment(True, 1010, self.DATA, flight[10:])
+        self.assertFalse(tracker.client_handshake_seen())
+        tracker.add_segment(True, 1000, self.DATA, flight[:10])
+        self.assertTrue(tracker.client_handshake_seen())
+
+    def test_plain_http_is_decided_on_first_segment(self):
+        tracker = TLS_Tracker(svr_pt=80)
+        verdict = tracker.add_segment(True, 1000, self.DATA, 'GET / HTTP/1.1\r\n\r\n')
+        self.assertEqual(verdict, Is_Encrypted_Enum.NO)
+        self.assertFalse(tracker.needs_payload(True))
+        # the other direction is still followed until it settles too
+        self.assertTrue(tracker.needs_payload(False))
+
+    def test_direction_given_up_after_max_bytes(self):
+        tracker = TLS_Tracker(svr_pt=443, max_bytes=len(self.CLIENT_FLIGHT) + 2)
+        tracker.add_segment(True, 1000, self.DATA, self.CLIENT_FLIGHT + 'xyz')
+        self.assertFalse(tracker.needs_payload(True))
+        self.assertEqual(tracker.get_verdict(), Is_Encrypted_Enum.UNKNOWN)
+
+    def test_finish_without_verdict(self):
+        tracker = TLS_Tracker(svr_pt=443)
+        tracker.add_segment(True, 1000, self.DATA, self.CLIENT_FLIGHT)
+        self.assertIsNone(tracker.get_verdict())
+        self.assertEqual(tracker.finish(), Is_Encrypted_Enum.UNKNOWN)
+        self.assertFalse(tracker.needs_payload(True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import unittest
+import ctypes.util
+import os
+import socket
+import subprocess
+import time
+from ptp_tpacket_capture import Tpacket_V3_Capture
+
+
+def run(cmd):
+    """Returns:
+        bool: whether the command succeeded
+    """
+    with open(os.devnull, 'w') as devnull:
+        return subprocess.call(cmd.split(), stdout=devnull, stderr=devnull) == 0
+
+
+@unittest.skipUnless(os.geteuid() == 0, "needs root to set up a veth pair")
+class Test_Tpacket_V3_Capture(unittest.TestCase):
+    """Unit tests for PTP Tpacket_V3_Capture class, capturing on one end of
+    a veth pair what is sent from the other.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        # left behind by an earlier run, perhaps
+        run('ip link del ptptest0')
+        for cmd in ['ip link add ptptest0 type veth peer name ptptest1',
+                    'ip link set ptptest0 up', 'ip link set ptptest1 up']:
+            if not run(cmd):
+                run('ip link del ptptest0')
+                raise unittest.SkipTest("can't set up a veth pair")
+
+    @classmethod
+    def tearDownClass(cls):
+        run('ip link del ptptest0')
+
+    def setUp(self):
+        self.cap = Tpacket_V3_Capture('ptptest1', timeout_ms=50, block_size=1024 * 1024,
+                                      num_blocks=4)
+        self.sender = socket.socket(socket.AF_PACKET, socket.SOCK_RAW)
+        self.sender.bind(('ptptest0', 0))
+        self.frames = ['\x02' * 6 + '\x04' * 6 + '\x08\x00' + chr(i % 256) * (46 + i % 500)
+                       for i in range(2000)]
+
+    def tearDown(self):
+        self.cap.close()
+        self.sender.close()
+
+    def capture(self):
+        captured = []
+        def on_packet(packet_hdr, packet_body):
+            if packet_body[:6] == '\x02' * 6:   # not the kernel's own traffic
+                captured.append((packet_hdr.getts(), packet_hdr.getlen(), str(packet_body)))
+        while self.cap.dispatch(-1, on_packet) or len(captured) < len(self.frames):
+            if time.time() - self.ts_sent > 5:
+                break
+        return captured
+
+    def test_frames_captured_in_order(self):
+        self.ts_sent = time.time()
+        for frame in self.frames:
+            self.sender.send(frame)
+        captured = self.capture()
+        self.assertEqual([frame for ts, length, frame in captured], self.frames)
+        self.assertEqual([length for ts, length, frame in captured], map(len, self.frames))
+        sec, usec = captured[0][0]
+        self.assertAlmostEqual(sec + usec / 1e6, self.ts_sent, delta=5)
+        self.assertEqual(self.cap.stats()[1], 0)
+
+    def test_dispatch_returns_after_timeout_when_idle(self):
+        started = time.time()
+        self.cap.dispatch(-1, lambda packet_hdr, packet_body: None)
+        self.assertTrue(time.time() - started < 1)
+
+    def test_link_type_is_ethernet(self):
+        self.assertEqual(self.cap.datalink(), 1)
+
+
+
+@unittest.skipUnless(os.geteuid() == 0, "needs root to set up a tun interface")
+class Test_Tpacket_V3_Capture_Raw(unittest.TestCase):
+    """Unit tests for PTP Tpacket_V3_Capture class on an interface whose
+    frames have no link header, e.g. ppp or tun.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        run('ip link del ptptun0')
+        for cmd in ['ip tuntap add dev ptptun0 mode tun', 'ip link set ptptun0 up']:
+            if not run(cmd):
+                run('ip link del ptptun0')
+                raise unittest.SkipTest("can't set up a tun interface")
+
+    @classmethod
+    def tearDownClass(cls):
+        run('ip link del ptptun0')
+
+    def setUp(self):
+        self.cap = Tpacket_V3_Capture('ptptun0', timeout_ms=50, block_size=1024 * 1024,
+                                      num_blocks=4)
+
+    def tearDown(self):
+        self.cap.close()
+
+    def test_link_type_is_raw(self):
+        self.assertEqual(self.cap.datalink(), 101)
+
+    @unittest.skipUnless(ctypes.util.find_library('pcap'), "needs libpcap")
+    def test_filter_compiles(self):
+        self.cap.setfilter("tcp or udp port 53")
+
+
+if __name__ == '__main__':
+    unittest.main()
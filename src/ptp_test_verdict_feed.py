@@ -0,0 +1,59 @@
+import unittest
+import threading
+import time
+from ptp_verdict_feed import Verdict_Feed
+
+
+class Test_Verdict_Feed(unittest.TestCase):
+    """Unit tests for PTP Verdict_Feed class"""
+
+    def test_readers_get_all_events_in_order(self):
+        feed = Verdict_Feed(coalesce=0)
+        for i in range(3):
+            feed.publish({'n': i})
+        events, next_seq = feed.get_batch(0)
+        self.assertEqual(events, [{'n': 0}, {'n': 1}, {'n': 2}])
+        self.assertEqual(next_seq, 3)
+        feed.publish({'n': 3})
+        self.assertEqual(feed.get_batch(next_seq), ([{'n': 3}], 4))
+        # another reader starting from the beginning
+        self.assertEqual(len(feed.get_batch(0)[0]), 4)
+
+    def test_events_close_together_are_batched(self):
+        feed = Verdict_Feed(coalesce=0.2)
+
+        def publish():
+            for i in range(5):
+                feed.publish({'n': i})
+                time.sleep(0.01)
+
+        publisher = threading.Thread(target=publish)
+        publisher.start()
+        events, next_seq = feed.get_batch(0, timeout=5)
+        publisher.join()
+        self.assertEqual(len(events), 5)
+
+    def test_batch_size_is_limited(self):
+        feed = Verdict_Feed(max_batch=2)
+        for i in range(5):
+            feed.publish({'n': i})
+        events, next_seq = feed.get_batch(0)
+        self.assertEqual(events, [{'n': 0}, {'n': 1}])
+        self.assertEqual(next_seq, 2)
+
+    def test_reader_behind_misses_oldest(self):
+        feed = Verdict_Feed(max_events=2, coalesce=0)
+        for i in range(5):
+            feed.publish({'n': i})
+        self.assertEqual(feed.get_batch(0), ([{'n': 3}, {'n': 4}], 5))
+
+    def test_timeout_and_close(self):
+        feed = Verdict_Feed()
+        self.assertEqual(feed.get_batch(0, timeout=0.01), ([], 0))
+        threading.Timer(0.05, feed.close).start()
+        self.assertEqual(feed.get_batch(0, timeout=5), ([], 0))
+        self.assertTrue(feed.is_closed())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,212 @@
+import struct
+
+
+class TLS_Parser(object):
+    """Byte-level parser for the start of one direction of an SSL/TLS
+    connection. Walks the record layer by the length in each record header,
+    and pulls out of the first handshake message (ClientHello or
+    ServerHello) the few things PTP reports: message type, server name
+    (SNI), negotiated version and cipher suite. Also notes the ChangeCipherSpec (CCS) and
+    whether another record follows it (the first encrypted one).
+
+    Fields are read in place with struct.unpack_from, so the stream is never
+    converted to hex or searched with regular expressions; only the
+    handshake records before the first handshake message has been parsed
+    are copied.
+
+    parse() may be called repeatedly as more of the stream arrives: it
+    consumes only complete records and returns where it stopped.
+
+    Attributes:
+        is_tls (bool): None until the first record header has been seen,
+            then whether the stream looks like SSL/TLS at all
+        first_handshake_type (int): type of the first handshake message,
+            e.g. CLIENT_HELLO, or None if not (yet) seen
+        version (int): version agreed in the ServerHello, e.g. 0x0303, taking
+            the TLS 1.3 supported_versions extension into account
+        cipher (int): cipher suite chosen in the ServerHello, e.g. 0xcca9
+        server_name (str): host name from the ClientHello's server_name
+            (SNI) extension, if any
+        ccs_seen (bool): True once a ChangeCipherSpec message has been seen
+        record_after_ccs (bool): True once a record (encrypted handshake, or
+            for TLS 1.3 application data) follows the ChangeCipherSpec
+    """
+
+    CHANGE_CIPHER_SPEC = 0x14
+    ALERT = 0x15
+    HANDSHAKE = 0x16
+    APPLICATION_DATA = 0x17
+
+    CLIENT_HELLO = 0x01
+    SERVER_HELLO = 0x02
+
+    TLS_1_3 = 0x0304
+
+    RECORD_HEADER_LEN = 5
+    _RECORD_VERSIONS = (0x0300, 0x0301, 0x0302, 0x0303)
+    _MAX_RECORD_LEN = (1 << 14) + 2048
+    _EXT_SERVER_NAME = 0
+    _EXT_SUPPORTED_VERSIONS = 43
+    _SNI_HOST_NAME = 0
+
+    _record_hdr = struct.Struct('!BHH')
+    _handshake_hdr = struct.Struct('!BBH')
+    _ubyte = struct.Struct('!B')
+    _ushort = struct.Struct('!H')
+    _ushort_pair = struct.Struct('!HH')
+
+    def __init__(self):
+        self.is_tls = None
+        self.first_handshake_type = None
+        self.version = None
+        self.cipher = None
+        self.server_name = None
+        self.ccs_seen = False
+        self.record_after_ccs = False
+        self._handshake = []
+
+
+    def parse(self, data, offset=0):
+        """Walks the complete records in data from offset.
+
+        Args:
+            data (str, buffer or memoryview): the stream, or the part of it
+                not yet consumed
+            offset (int): where in data the next record header starts
+
+        Returns:
+            int: offset just past the last complete record consumed. If the
+                stream turns out not to be SSL/TLS, the rest of data is
+                treated as consumed.
+        """
+        end = len(data)
+        hdr_len = self.RECORD_HEADER_LEN
+        unpack_from = self._record_hdr.unpack_from
+
+        while offset + hdr_len <= end:
+            content_type, version, length = unpack_from(data, offset)
+            if not self._is_record_header(content_type, version, length):
+                self.is_tls = False
+                return end
+            if offset + hdr_len + length > end:
+                break
+            self.is_tls = True
+            self._on_record(content_type, data, offset + hdr_len, length)
+            offset += hdr_len + length
+
+        return offset
+
+
+    def _is_record_header(self, content_type, version, length):
+        if self.is_tls is False:
+            return False
+        if version not in self._RECORD_VERSIONS or length > self._MAX_RECORD_LEN:
+            return False
+        if self.is_tls is None:
+            # a connection has to open with a handshake record
+            return content_type == self.HANDSHAKE
+        return self.CHANGE_CIPHER_SPEC <= content_type <= self.APPLICATION_DATA
+
+
+    def _on_record(self, content_type, data, start, length):
+        if self.ccs_seen:
+            if content_type == self.HANDSHAKE or \
+                    (content_type == self.APPLICATION_DATA and self.version == self.TLS_1_3):
+                self.record_after_ccs = True
+            return
+
+        if content_type == self.CHANGE_CIPHER_SPEC:
+            self.ccs_seen = length >= 1 and self._ubyte.unpack_from(data, start)[0] == 1
+        elif content_type == self.HANDSHAKE and self.first_handshake_type is None:
+            # a handshake message may be split over several records
+            self._handshake.append(data[start:start + length])
+            self._parse_first_handshake_message()
+
+
+    def _parse_first_handshake_message(self):
+        """Parses the first handshake message once all of it has arrived."""
+        msg = b''.join(self._handshake)
+        if len(msg) < 4:
+            self._handshake = [msg]
+            return
+        msg_type, len_hi, len_lo = self._handshake_hdr.unpack_from(msg, 0)
+        if len(msg) < 4 + ((len_hi << 16) | len_lo):
+            self._handshake = [msg]
+            return
+
+        self._handshake = None
+        self.first_handshake_type = msg_type
+        try:
+            if msg_type == self.SERVER_HELLO:
+                self._parse_server_hello(msg, 4)
+            elif msg_type == self.CLIENT_HELLO:
+                self._parse_client_hello(msg, 4)
+        except struct.error:
+            # truncated or malformed; keep whatever was read
+            pass
+
+
+    def _parse_client_hello(self, msg, offset):
+        """Reads the server name from a ClientHello body: version (2 bytes),
+        random (32), session ID (1-byte length + ID), cipher suites (2-byte
+        length + suites), compression methods (1-byte length + methods),
+        then optional extensions.
+        """
+        offset += 2 + 32
+        session_id_len, = self._ubyte.unpack_from(msg, offset)
+        offset += 1 + session_id_len
+        cipher_suites_len, = self._ushort.unpack_from(msg, offset)
+        offset += 2 + cipher_suites_len
+        compression_methods_len, = self._ubyte.unpack_from(msg, offset)
+        offset += 1 + compression_methods_len
+
+        for ext_type, start, end in self._extensions(msg, offset):
+            if ext_type == self._EXT_SERVER_NAME:
+                # list length (2 bytes), then entries of name type (1 byte),
+                # name length (2 bytes) and name
+                offset = start + 2
+                while offset + 3 <= end:
+                    name_type, = self._ubyte.unpack_from(msg, offset)
+                    name_len, = self._ushort.unpack_from(msg, offset + 1)
+                    offset += 3
+                    if name_type == self._SNI_HOST_NAME:
+                        self.server_name = str(msg[offset:offset + name_len])
+                        return
+                    offset += name_len
+
+
+    def _extensions(self, msg, offset):
+        """Generator over the extensions block of a hello message that
+        starts at offset, if there is one.
+
+        Yields:
+            (int, int, int): extension type, offset of its data in msg, offset
+                of the end of its data
+        """
+        if offset + 2 > len(msg):
+            return
+        extensions_len, = self._ushort.unpack_from(msg, offset)
+        offset += 2
+        extensions_end = min(offset + extensions_len, len(msg))
+        while offset + 4 <= extensions_end:
+            ext_type, ext_len = self._ushort_pair.unpack_from(msg, offset)
+            offset += 4
+            yield ext_type, offset, min(offset + ext_len, extensions_end)
+            offset += ext_len
+
+
+    def _parse_server_hello(self, msg, offset):
+        """Reads version and cipher suite from a ServerHello body:
+        version (2 bytes), random (32), session ID (1-byte length + ID),
+        cipher suite (2), compression method (1), then optional extensions.
+        """
+        self.version, = self._ushort.unpack_from(msg, offset)
+        offset += 2 + 32
+        session_id_len, = self._ubyte.unpack_from(msg, offset)
+        offset += 1 + session_id_len
+        self.cipher, = self._ushort.unpack_from(msg, offset)
+        offset += 2 + 1
+
+        for ext_type, start, end in self._extensions(msg, offset):
+            if ext_type == self._EXT_SUPPORTED_VERSIONS and end - start == 2:
+                self.version, = self._ushort.unpack_from(msg, start)
@@ -0,0 +1,175 @@
+from ptp_constants import Is_Encrypted_Enum
+from ptp_stream_reassembler import Stream_Reassembler
+from ptp_tls_parser import TLS_Parser
+
+
+class TLS_Tracker(object):
+    """Push-based SSL/TLS handshake state machine for one TCP connection.
+    Segments are added as they are captured, in either direction and in any
+    order; each direction is reassembled (see Stream_Reassembler) and its
+    newly contiguous bytes are fed straight into that direction's
+    TLS_Parser, so nothing waits for the end of the capture.
+
+    A verdict (YES, NO or UNKNOWN, see Is_Encrypted_Enum) is reached as soon
+    as it can no longer change: YES once both sides have completed their
+    part of the handshake, NO or UNKNOWN once either side has shown it
+    won't. Each direction is dropped, and needs_payload() returns False for
+    it, as soon as that direction is settled, so no more of its payload has
+    to be kept or fetched.
+
+    Note:
+        The criteria are those of the original end-of-capture analysis:
+        YES if the client sent a Client Hello (CH) and later a Change
+        Cipher Spec (CCS), and the server sent a Server Hello and later a
+        CCS followed by the start of the encrypted tunnel. Otherwise NO if
+        the server port is 80, and UNKNOWN if not.
+
+    Args:
+        svr_pt (int): server TCP port
+        max_bytes (int): how much of each direction's byte stream is
+            searched for its side of the handshake. Too high and we might
+            get false positives. Too low and we miss this side of the
+            handshake.
+
+    Attributes:
+        client (TLS_Parser): what was parsed from the client-to-server stream
+        server (TLS_Parser): what was parsed from the server-to-client stream
+    """
+
+    _SVR, _CLI = 0, 1
+
+    def __init__(self, svr_pt, max_bytes=16384):
+        self._svr_pt = svr_pt
+        self._max_bytes = max_bytes
+        self.client = TLS_Parser()
+        self.server = TLS_Parser()
+        # indexed by _SVR or _CLI
+        self._parsers = (self.server, self.client)
+        # a direction's entries become None once it is settled
+        self._streams = [Stream_Reassembler(max_bytes=0),
+                         Stream_Reassembler(max_bytes=0)]
+        self._unparsed = [b'', b'']
+        self._verdict = None
+
+
+    def add_segment(self, from_client, seq, flags, payload):
+        """Adds one TCP segment of the connection.
+
+        Args:
+            from_client (bool): True if sent by the client
+            seq (int): TCP sequence number
+            flags (int): TCP flags byte
+            payload (str): TCP payload
+
+        Returns:
+            str: the verdict if one has been reached, else None
+        """
+        side = self._CLI if from_client else self._SVR
+        stream = self._streams[side]
+        if stream is None:
+            return self._verdict
+
+        start = stream.get_next_offset()
+        data = stream.add_segment(seq, flags, payload)
+        if data and start < self._max_bytes:
+            data = self._unparsed[side] + data[:self._max_bytes - start]
+            consumed = self._parsers[side].parse(data)
+            self._unparsed[side] = data[consumed:]
+
+        if self._is_settled(side):
+            self._streams[side] = self._unparsed[side] = None
+            if self._verdict is None:
+                self._verdict = self._decide()
+        return self._verdict
+
+
+    def needs_payload(self, from_client):
+        """Returns:
+            bool: False once what one direction's segments can tell us has
+                been found out, so they no longer need to be added
+        """
+        return self._streams[self._CLI if from_client else self._SVR] is not None
+
+
+    def get_verdict(self):
+        """Returns:
+            str: the verdict if one has been reached, else None
+        """
+        return self._verdict
+
+
+    def finish(self):
+        """Decides on whatever has been seen, for when no more segments
+        will be added (e.g. the capture has ended).
+
+        Returns:
+            str: the verdict
+        """
+        if self._verdict is None:
+            self._verdict = self._final_verdict()
+        self._streams = [None, None]
+        self._unparsed = [None, None]
+        return self._verdict
+
+
+    def client_handshake_seen(self):
+        """Returns:
+            bool: True if the client's CH and CCS have been seen
+        """
+        client = self.client
+        return client.first_handshake_type == TLS_Parser.CLIENT_HELLO and client.ccs_seen
+
+
+    def server_handshake_seen(self):
+        """Returns:
+            bool: True if the server's Server Hello and CCS, and the start
+                of the encrypted tunnel, have been seen
+        """
+        server = self.server
+        return server.first_handshake_type == TLS_Parser.SERVER_HELLO and \
+            server.ccs_seen and server.record_after_ccs
+
+
+    def _decide(self):
+        """Returns:
+            str: the verdict if it can no longer change, else None
+        """
+        client_seen = self.client_handshake_seen()
+        server_seen = self.server_handshake_seen()
+        if client_seen and server_seen:
+            return Is_Encrypted_Enum.YES
+        if (not client_seen and self._streams[self._CLI] is None) or \
+                (not server_seen and self._streams[self._SVR] is None):
+            return self._final_verdict()
+        return None
+
+
+    def _is_settled(self, side):
+        """Returns:
+            bool: True if one direction has shown its side of the handshake,
+                or can no longer show it: it isn't SSL/TLS, opens with the
+                wrong handshake message, or has run past max_bytes
+        """
+        if side == self._CLI:
+            if self.client_handshake_seen():
+                return True
+            hello_type = TLS_Parser.CLIENT_HELLO
+        else:
+            if self.server_handshake_seen():
+                return True
+            hello_type = TLS_Parser.SERVER_HELLO
+
+        parser = self._parsers[side]
+        if parser.is_tls is False:
+            return True
+        if parser.first_handshake_type not in (None, hello_type):
+            return True
+        return self._streams[side].get_next_offset() >= self._max_bytes
+
+
+    def _final_verdict(self):
+        if self.client_handshake_seen() and self.server_handshake_seen():
+            return Is_Encrypted_Enum.YES
+        if self._svr_pt == 80:
+            return Is_Encrypted_Enum.NO
+        return Is_Encrypted_Enum.UNKNOWN
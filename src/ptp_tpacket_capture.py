@@ -0,0 +1,267 @@
+import ctypes
+import ctypes.util
+import mmap
+import select
+import socket
+import struct
+from ptp_packet_decoder import Packet_Decoder
+from ptp_pcap_reader import _make_view
+
+
+# from <linux/if_packet.h> and <linux/if_ether.h>
+SOL_PACKET = 263
+PACKET_ADD_MEMBERSHIP = 1
+PACKET_RX_RING = 5
+PACKET_STATISTICS = 6
+PACKET_VERSION = 10
+PACKET_MR_PROMISC = 1
+TPACKET_V3 = 2
+TP_STATUS_KERNEL = 0
+TP_STATUS_USER = 1
+ETH_P_ALL = 0x0003
+SO_ATTACH_FILTER = 26
+
+# from <pcap/dlt.h>: the DLT_* values libpcap compiles filters for, which
+# differ from the LINKTYPE_* values in PCAP files for some link types
+DLT_EN10MB = 1
+DLT_RAW = 12
+
+# from <linux/if_arp.h>: (LINKTYPE_*, DLT_*) of each interface type
+_ARPHRD_LINK_TYPES = {
+    1: (Packet_Decoder.LINKTYPE_ETHERNET, DLT_EN10MB),     # ARPHRD_ETHER
+    772: (Packet_Decoder.LINKTYPE_ETHERNET, DLT_EN10MB),   # ARPHRD_LOOPBACK
+    512: (Packet_Decoder.LINKTYPE_RAW, DLT_RAW),           # ARPHRD_PPP: no link header
+    65534: (Packet_Decoder.LINKTYPE_RAW, DLT_RAW),         # ARPHRD_NONE, e.g. tun
+}
+
+
+class _Bpf_Insn(ctypes.Structure):
+    """struct bpf_insn, the same as the kernel's struct sock_filter"""
+    _fields_ = [('code', ctypes.c_ushort), ('jt', ctypes.c_ubyte),
+                ('jf', ctypes.c_ubyte), ('k', ctypes.c_uint32)]
+
+
+class _Bpf_Program(ctypes.Structure):
+    """struct bpf_program, as filled in by pcap_compile_nopcap"""
+    _fields_ = [('bf_len', ctypes.c_uint), ('bf_insns', ctypes.POINTER(_Bpf_Insn))]
+
+
+class _Sock_Fprog(ctypes.Structure):
+    """struct sock_fprog, for SO_ATTACH_FILTER"""
+    _fields_ = [('len', ctypes.c_ushort), ('filter', ctypes.POINTER(_Bpf_Insn))]
+
+
+class _Packet_Header(object):
+    """Stands in for the Pkthdr pcapy passes to dispatch callbacks."""
+
+    __slots__ = ('_ts', '_len', '_caplen')
+
+    def __init__(self, ts, length, caplen):
+        self._ts = ts
+        self._len = length
+        self._caplen = caplen
+
+    def getts(self):
+        return self._ts
+
+    def getlen(self):
+        return self._len
+
+    def getcaplen(self):
+        return self._caplen
+
+
+class Tpacket_V3_Capture(object):
+    """Linux capture backend reading packets straight from the kernel's
+    memory-mapped AF_PACKET receive ring (TPACKET_V3), rather than through
+    libpcap, see
+    https://www.kernel.org/doc/Documentation/networking/packet_mmap.txt
+
+    The kernel fills whole blocks of packets and hands each over when it
+    is full or has waited timeout_ms, so the packets of a block are read in
+    one go, with one system call (to poll) at most per block rather than
+    one or more per packet. Frames are passed on as zero-copy views into
+    the ring, which are only valid until the callback returns: anything
+    kept longer must be copied.
+
+    Has the part of the interface of pcapy's Reader that the Sniffer uses
+    (see Sniffer's CAPTURE_BACKEND), so either can be used.
+
+    Args:
+        iface_name (str): network interface to capture on
+        snaplen (int): most bytes kept of each frame
+        promiscuous (bool): capture frames not addressed to the interface
+        timeout_ms (int): most time dispatch waits for a block, and the
+            kernel waits before handing over a block that isn't full
+        block_size (int): bytes in each block of the ring; a multiple of the
+            page size
+        num_blocks (int): blocks in the ring
+
+    Raises:
+        socket.error: If the socket or ring can't be set up, e.g. without
+            CAP_NET_RAW or on a kernel before 3.2.
+        ValueError: If the interface's type is not supported.
+    """
+
+    # block_status, num_pkts and offset_to_first_pkt, after version and
+    # offset_to_priv
+    _block_hdr = struct.Struct('=III')
+    _BLOCK_STATUS_OFFSET = 8
+    # tp_next_offset, tp_sec, tp_nsec, tp_snaplen, tp_len, tp_status, tp_mac
+    _pkt_hdr = struct.Struct('=IIIIIIH')
+    _FRAME_SIZE = 2048
+    _KERNEL_STATUS = struct.pack('=I', TP_STATUS_KERNEL)
+
+
+    def __init__(self, iface_name, snaplen=65535, promiscuous=True, timeout_ms=100,
+                 block_size=1024 * 1024, num_blocks=64):
+        self._iface_name = iface_name
+        self._snaplen = snaplen
+        self._timeout_ms = timeout_ms
+        self._block_size = block_size
+        self._num_blocks = num_blocks
+        self._link_type, self._dlt = self._get_link_type(iface_name)
+        self._current_block = 0
+        self._num_received = 0
+        self._num_dropped = 0
+
+        self._sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+        try:
+            self._sock.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+            req = struct.pack('=IIIIIII', block_size, num_blocks, self._FRAME_SIZE,
+                              block_size * num_blocks // self._FRAME_SIZE,
+                              timeout_ms, 0, 0)
+            self._sock.setsockopt(SOL_PACKET, PACKET_RX_RING, req)
+            self._map = mmap.mmap(self._sock.fileno(), block_size * num_blocks,
+                                  mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+            self._sock.bind((iface_name, ETH_P_ALL))
+            if promiscuous:
+                mreq = struct.pack('=iHH8s', self._get_ifindex(iface_name),
+                                   PACKET_MR_PROMISC, 0, b'')
+                self._sock.setsockopt(SOL_PACKET, PACKET_ADD_MEMBERSHIP, mreq)
+        except:
+            self._sock.close()
+            raise
+        self._poll = select.poll()
+        self._poll.register(self._sock.fileno(), select.POLLIN | select.POLLERR)
+
+
+    def datalink(self):
+        """Returns:
+            int: LINKTYPE_* value of the frames
+        """
+        return self._link_type
+
+
+    def setfilter(self, bpf_filter):
+        """Attaches a BPF filter to the socket, so frames it doesn't match
+        never reach the ring. The filter is compiled with libpcap (found
+        with ctypes), as tcpdump's are.
+
+        Args:
+            bpf_filter (str): filter expression, e.g. "tcp or udp port 53"
+
+        Raises:
+            ValueError: If libpcap can't be found or can't compile it.
+        """
+        libpcap_name = ctypes.util.find_library('pcap')
+        if libpcap_name is None:
+            raise ValueError("libpcap is needed to compile the filter %r" % bpf_filter)
+        libpcap = ctypes.CDLL(libpcap_name)
+        program = _Bpf_Program()
+        if libpcap.pcap_compile_nopcap(self._snaplen, self._dlt, ctypes.byref(program),
+                                       ctypes.c_char_p(bpf_filter), 1, 0) != 0:
+            raise ValueError("Can't compile the filter %r" % bpf_filter)
+        try:
+            fprog = _Sock_Fprog(program.bf_len, program.bf_insns)
+            self._sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER,
+                                  ctypes.string_at(ctypes.addressof(fprog), ctypes.sizeof(fprog)))
+        finally:
+            libpcap.pcap_freecode(ctypes.byref(program))
+
+
+    def dispatch(self, maxcant, callback):
+        """Passes the packets of the blocks the kernel has handed over to
+        callback, waiting up to timeout_ms for one if there are none.
+
+        Args:
+            maxcant (int): packets after which to stop, though the rest of
+                the block is still passed on; -1 for no limit
+            callback (function): called with a header (with getts and
+                getlen methods, as pcapy's) and a zero-copy view of each
+                frame
+
+        Returns:
+            int: number of packets passed to callback
+        """
+        buf = self._map
+        block_hdr = self._block_hdr
+        status_offset = self._BLOCK_STATUS_OFFSET
+        offset = self._current_block * self._block_size
+        status, _, _ = block_hdr.unpack_from(buf, offset + status_offset)
+        if not status & TP_STATUS_USER:
+            self._poll.poll(self._timeout_ms)
+
+        num_packets = 0
+        while maxcant < 0 or num_packets < maxcant:
+            offset = self._current_block * self._block_size
+            status, num_pkts, first = block_hdr.unpack_from(buf, offset + status_offset)
+            if not status & TP_STATUS_USER:
+                break
+            num_packets += self._read_block(offset + first, num_pkts, callback)
+            # hands the block back to the kernel
+            buf[offset + status_offset:offset + status_offset + 4] = self._KERNEL_STATUS
+            self._current_block = (self._current_block + 1) % self._num_blocks
+        return num_packets
+
+
+    def stats(self):
+        """Returns:
+            (int, int, int): packets received and dropped by the kernel for
+                want of room in the ring since the capture was opened, and 0
+                for those dropped by the interface (not known), as pcapy's
+                stats
+        """
+        received, dropped, _ = struct.unpack(
+            '=III', self._sock.getsockopt(SOL_PACKET, PACKET_STATISTICS, 12))
+        # the kernel's counts start again from 0 each time they are read
+        self._num_received += received
+        self._num_dropped += dropped
+        return self._num_received, self._num_dropped, 0
+
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._sock.close()
+
+
+    def _read_block(self, offset, num_pkts, callback):
+        buf = self._map
+        unpack_from = self._pkt_hdr.unpack_from
+        make_view = _make_view
+        for _ in xrange(num_pkts):
+            next_offset, sec, nsec, snaplen, wirelen, _, mac = unpack_from(buf, offset)
+            callback(_Packet_Header((sec, nsec // 1000), wirelen, snaplen),
+                     make_view(buf, offset + mac, snaplen))
+            offset += next_offset
+        return num_pkts
+
+
+    @staticmethod
+    def _get_link_type(iface_name):
+        """Returns:
+            (int, int): LINKTYPE_* and DLT_* values of the interface's frames
+        """
+        with open('/sys/class/net/%s/type' % iface_name) as type_file:
+            arphrd = int(type_file.read())
+        if arphrd not in _ARPHRD_LINK_TYPES:
+            raise ValueError("Unsupported type %d of interface %s" % (arphrd, iface_name))
+        return _ARPHRD_LINK_TYPES[arphrd]
+
+
+    @staticmethod
+    def _get_ifindex(iface_name):
+        with open('/sys/class/net/%s/ifindex' % iface_name) as ifindex_file:
+            return int(ifindex_file.read())
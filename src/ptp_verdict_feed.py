@@ -0,0 +1,97 @@
+import threading
+import time
+from collections import deque
+from itertools import islice
+
+
+class Verdict_Feed(object):
+    """Broadcasts connection verdicts, as they are reached during a live
+    capture, to any number of readers (e.g. server-sent event streams),
+    each reading at its own pace.
+
+    Events are numbered in the order published, and readers ask for those
+    after the last number they saw, so one that reconnects can carry on
+    where it left off. Only the newest max_events are kept: a reader that
+    falls further behind than that misses the oldest.
+
+    To save the readers (and browsers) from being woken once per
+    connection at high flow rates, get_batch waits a little after the first
+    new event for others to go with it.
+
+    Args:
+        max_events (int): number of events kept for readers
+        coalesce (float): seconds get_batch waits for more events after the
+            first, by default
+        max_batch (int): most events get_batch returns at once
+    """
+
+    def __init__(self, max_events=10000, coalesce=0.25, max_batch=500):
+        self._events = deque(maxlen=max_events)
+        self._coalesce = coalesce
+        self._max_batch = max_batch
+        self._next_seq = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+
+    def publish(self, event):
+        """Adds an event for the readers.
+
+        Args:
+            event (dict): e.g. a connection's quad and verdict
+        """
+        with self._cond:
+            self._events.append(event)
+            self._next_seq += 1
+            self._cond.notify_all()
+
+
+    def close(self):
+        """Marks the end of the feed, e.g. when the capture stops."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+    def is_closed(self):
+        return self._closed
+
+
+    def get_batch(self, next_seq, timeout=15.0, coalesce=None):
+        """Waits for events numbered next_seq onwards.
+
+        Once there is one, waits up to coalesce seconds more (or until there
+        are max_batch) so that those published close together are returned
+        together.
+
+        Args:
+            next_seq (int): number of the first event wanted; 0 for all
+            timeout (float): seconds to wait for an event at most
+            coalesce (float): defaults to the constructor's
+
+        Returns:
+            (list, int): the events, oldest first, which may be empty if
+                none came in time or the feed is closed, and the next_seq to
+                ask for after them
+        """
+        if coalesce is None:
+            coalesce = self._coalesce
+        deadline = time.time() + timeout
+        with self._cond:
+            while self._next_seq <= next_seq and not self._closed:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return [], next_seq
+                self._cond.wait(remaining)
+
+            flush_at = time.time() + coalesce
+            while self._next_seq - next_seq < self._max_batch and not self._closed:
+                remaining = flush_at - time.time()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            oldest_seq = self._next_seq - len(self._events)
+            start = max(next_seq, oldest_seq) - oldest_seq
+            events = list(islice(self._events, start, start + self._max_batch))
+            return events, oldest_seq + start + len(events)